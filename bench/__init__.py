@@ -0,0 +1,4 @@
+"""
+Офлайн-бенчмарк ревьюера: локальная заглушка GitHub API, фейковая LLM
+и синтетические PR. Запуск: python -m bench.run (из корня репозитория).
+"""
@@ -0,0 +1,118 @@
+"""
+Фейковая chat-модель вместо ChatOpenAI: детерминированный ответ, имитация задержки,
+учёт размера промптов (оценка токенов как в src/compaction.py).
+"""
+import json
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List
+
+from src.compaction import estimate_tokens
+
+_ADDED = re.compile(r"^\+(?!\+\+ )(.*\S.*)$", re.M)
+_PATH = re.compile(r"^\+\+\+ b/(.+)$", re.M)
+
+
+class FakeResponse:
+    def __init__(self, content: str, tokens_in: int, tokens_out: int):
+        self.content = content
+        self.response_metadata = {"token_usage": {
+            "prompt_tokens": tokens_in,
+            "completion_tokens": tokens_out,
+            "total_tokens": tokens_in + tokens_out,
+        }}
+        self.usage_metadata = {"input_tokens": tokens_in, "output_tokens": tokens_out,
+                               "total_tokens": tokens_in + tokens_out}
+
+
+class FakeChunk:
+    """Чанк потокового ответа; usage — только у последнего (как при stream_usage=True)."""
+
+    def __init__(self, content: str, usage: Dict[str, int] = None):
+        self.content = content
+        self.usage_metadata = usage
+
+
+class FakeChatModel:
+    """Совместим по вызову с ChatOpenAI(model=..., temperature=...).invoke(prompt | messages)."""
+
+    latency = 0.05          # базовая задержка ответа, сек
+    latency_per_1k = 0.01   # + за каждую 1000 токенов промпта
+    every_nth = 7           # замечание на каждую n-ю добавленную строку
+    chunk_chars = 64        # размер чанка потокового ответа
+    stats: Dict[str, int] = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    _lock = threading.Lock()
+
+    def __init__(self, model: str = "fake", temperature: float = 0, **kwargs: Any):
+        self.model = model
+
+    @classmethod
+    def reset(cls) -> None:
+        with cls._lock:
+            cls.stats = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    @staticmethod
+    def _prompt_text(prompt: Any) -> str:
+        if isinstance(prompt, str):
+            return prompt
+        parts: List[str] = []
+        for m in prompt or []:
+            parts.append(m.get("content", "") if isinstance(m, dict) else str(getattr(m, "content", m)))
+        return "\n".join(parts)
+
+    def _answer(self, text: str) -> str:
+        if "<<<DIFF" not in text:
+            return "Коротко: используй const и убери console.log."
+        diff = text.split("<<<DIFF", 1)[1]
+        items: List[Dict[str, str]] = []
+        path = None
+        n = 0
+        for line in diff.split("\n"):
+            m = _PATH.match(line)
+            if m:
+                path = m.group(1)
+                continue
+            m = _ADDED.match(line)
+            if m and path:
+                n += 1
+                if n % self.every_nth == 0:
+                    items.append({"path": path, "line_match": m.group(1).strip()[:40],
+                                  "body": "Проверь именование и форматирование."})
+        return "```json\n" + json.dumps(items, ensure_ascii=False) + "\n```"
+
+    def invoke(self, prompt: Any, *args: Any, **kwargs: Any) -> FakeResponse:
+        text = self._prompt_text(prompt)
+        tokens_in = estimate_tokens(text)
+        time.sleep(self.latency + self.latency_per_1k * tokens_in / 1000)
+        content = self._answer(text)
+        tokens_out = estimate_tokens(content)
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["prompt_tokens"] += tokens_in
+            self.stats["completion_tokens"] += tokens_out
+        return FakeResponse(content, tokens_in, tokens_out)
+
+    def stream(self, prompt: Any, *args: Any, **kwargs: Any) -> Iterator[FakeChunk]:
+        """
+        Та же задержка, что у invoke, но ответ приходит кусками: первый — через latency,
+        остальные равномерно за оставшееся время (имитация генерации).
+        """
+        text = self._prompt_text(prompt)
+        tokens_in = estimate_tokens(text)
+        content = self._answer(text)
+        tokens_out = estimate_tokens(content)
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["prompt_tokens"] += tokens_in
+            self.stats["completion_tokens"] += tokens_out
+        parts = [content[i:i + self.chunk_chars] for i in range(0, len(content), self.chunk_chars)] or [""]
+        time.sleep(self.latency)
+        step = self.latency_per_1k * tokens_in / 1000 / len(parts)
+        for i, part in enumerate(parts):
+            if i:
+                time.sleep(step)
+            yield FakeChunk(part)
+        time.sleep(step)
+        yield FakeChunk("", {"input_tokens": tokens_in, "output_tokens": tokens_out,
+                             "total_tokens": tokens_in + tokens_out})
@@ -0,0 +1,79 @@
+"""Синтетические PR для бенчмарка: детерминированные файлы и патчи заданного размера."""
+import random
+from typing import Any, Dict, List
+
+# строки «нового кода»; часть нарушает forbiddenPatterns из .github/ai-review.json
+CODE_LINES = [
+    "const value{i} = compute(input{i});",
+    "let counter{i} = 0;",
+    "export function handler{i}(req, res) {{",
+    "  return res.json({{ ok: true, id: {i} }});",
+    "}}",
+    "if (items{i}.length > 0) {{ process(items{i}); }}",
+    "var legacy{i} = 1;",
+    "console.log('debug', value{i});",
+    "const url{i} = 'http://example.com/api/{i}';",
+    "import {{ helper{i} }} from './helper{i}';",
+]
+
+
+def make_patch(rng: random.Random, hunks: int, lines_per_hunk: int) -> Dict[str, Any]:
+    parts: List[str] = []
+    additions = deletions = 0
+    new_line = 1
+    for h in range(hunks):
+        new_line += rng.randint(5, 40)
+        body: List[str] = []
+        old_cnt = new_cnt = 0
+        for k in range(lines_per_hunk):
+            kind = rng.random()
+            text = rng.choice(CODE_LINES).format(i=rng.randint(0, 999))
+            if kind < 0.45:
+                body.append("+" + text)
+                new_cnt += 1
+                additions += 1
+            elif kind < 0.6:
+                body.append("-" + text)
+                old_cnt += 1
+                deletions += 1
+            else:
+                body.append(" " + text)
+                old_cnt += 1
+                new_cnt += 1
+        parts.append(f"@@ -{new_line},{old_cnt} +{new_line},{new_cnt} @@\n" + "\n".join(body))
+        new_line += new_cnt
+    return {
+        "patch": "\n".join(parts),
+        "additions": additions,
+        "deletions": deletions,
+        "changes": additions + deletions,
+    }
+
+
+def make_pr(number: int, files: int, seed: int = 42) -> Dict[str, Any]:
+    """PR с files файлами: 90% под src/ (TS), остальные — вне области ревью."""
+    rng = random.Random(seed + files)
+    items: List[Dict[str, Any]] = []
+    for i in range(files):
+        # каждый 10-й файл — вне области ревью, но не первый: PR из одного файла тоже ревьюится
+        prefix = "docs" if i % 10 == 9 else "src"
+        ext = "md" if prefix == "docs" else rng.choice(["ts", "tsx", "js"])
+        f = make_patch(rng, hunks=rng.randint(1, 4), lines_per_hunk=rng.randint(4, 20))
+        f.update({"filename": f"{prefix}/module{i // 50}/file{i}.{ext}", "status": "modified"})
+        items.append(f)
+    return {
+        "number": number,
+        "head": {"sha": f"{number:040x}"},
+        "base": {"sha": f"{number + 1:040x}"},
+        "changed_files": files,
+        "files": items,
+    }
+
+
+def unified_diff(pr: Dict[str, Any]) -> str:
+    """Тот же PR в виде application/vnd.github.diff."""
+    out: List[str] = []
+    for f in pr["files"]:
+        fn = f["filename"]
+        out.append(f"diff --git a/{fn} b/{fn}\n--- a/{fn}\n+++ b/{fn}\n{f['patch']}\n")
+    return "".join(out)
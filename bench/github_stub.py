@@ -0,0 +1,214 @@
+"""
+Локальная заглушка GitHub REST API — ровно те эндпоинты, которые вызывает src/github_client.py.
+Считает запросы по маршрутам; поддерживает пагинацию (Link), ETag и .diff.
+"""
+import json
+import re
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from .fixtures import make_pr, unified_diff
+
+_PR = re.compile(r"^/repos/[^/]+/[^/]+/pulls/(\d+)$")
+_FILES = re.compile(r"^/repos/[^/]+/[^/]+/pulls/(\d+)/files$")
+_PR_COMMENTS = re.compile(r"^/repos/[^/]+/[^/]+/pulls/(\d+)/comments$")
+_REVIEWS = re.compile(r"^/repos/[^/]+/[^/]+/pulls/(\d+)/reviews$")
+_COMMENT = re.compile(r"^/repos/[^/]+/[^/]+/pulls/comments/(\d+)$")
+
+
+def _ts(n: int) -> str:
+    # монотонные метки времени: комментарий n создан через n секунд после начала суток
+    return f"2024-01-01T{n // 3600 % 24:02d}:{n // 60 % 60:02d}:{n % 60:02d}Z"
+
+
+class GitHubStub:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.prs: Dict[int, Dict[str, Any]] = {}
+        self.comments: Dict[int, List[Dict[str, Any]]] = {}
+        self.counts: Counter = Counter()
+        self.bytes_sent = 0
+        self.posted_comments = 0
+        self._lock = threading.Lock()
+        self._next_id = 1000
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    # --- данные ---------------------------------------------------------------
+
+    def add_pr(self, pr: Dict[str, Any]) -> None:
+        self.prs[pr["number"]] = pr
+        self.comments.setdefault(pr["number"], [])
+
+    def add_comment(self, pr_number: int, body: str, in_reply_to: Optional[int] = None,
+                    login: str = "dev") -> Dict[str, Any]:
+        with self._lock:
+            self._next_id += 1
+            c = {
+                "id": self._next_id,
+                "body": body,
+                "user": {"login": login},
+                "created_at": _ts(self._next_id),
+                "updated_at": _ts(self._next_id),
+                "path": "src/module0/file1.ts",
+                "line": 1,
+                "pull_request_url": f"/pulls/{pr_number}",
+                "diff_hunk": "@@ -1,2 +1,2 @@\n-var a = 1;\n+let a = 1;",
+            }
+            if in_reply_to:
+                c["in_reply_to_id"] = in_reply_to
+            self.comments.setdefault(pr_number, []).append(c)
+            return c
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.counts.clear()
+            self.bytes_sent = 0
+            self.posted_comments = 0
+
+    # --- сервер ---------------------------------------------------------------
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "GitHubStub":
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub._handle(self, "GET")
+
+            def do_POST(self):
+                stub._handle(self, "POST")
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    # --- обработка ------------------------------------------------------------
+
+    def _count(self, route: str, size: int) -> None:
+        with self._lock:
+            self.counts[route] += 1
+            self.bytes_sent += size
+
+    def _send(self, h: BaseHTTPRequestHandler, route: str, status: int, body: Any,
+              headers: Optional[Dict[str, str]] = None, raw: Optional[bytes] = None) -> None:
+        data = raw if raw is not None else (json.dumps(body).encode() if body is not None else b"")
+        self._count(route, len(data))
+        h.send_response(status)
+        for k, v in (headers or {}).items():
+            h.send_header(k, v)
+        h.send_header("Content-Length", str(len(data)))
+        if raw is None:
+            h.send_header("Content-Type", "application/json; charset=utf-8")
+        h.end_headers()
+        h.wfile.write(data)
+
+    def _control(self, h: BaseHTTPRequestHandler, path: str, payload: Any) -> None:
+        # служебные маршруты бенчмарка, в статистику не попадают
+        if path == "/__bench/load":
+            self.add_pr(make_pr(int(payload["number"]), int(payload["files"]), int(payload.get("seed", 42))))
+            body: Any = {"ok": True}
+        elif path == "/__bench/comment":
+            body = self.add_comment(int(payload["pr"]), payload["body"], payload.get("in_reply_to"))
+        elif path == "/__bench/reset":
+            self.reset_counts()
+            body = {"ok": True}
+        else:
+            with self._lock:
+                body = {"counts": dict(self.counts), "bytes": self.bytes_sent,
+                        "posted_comments": self.posted_comments}
+        data = json.dumps(body).encode()
+        h.send_response(200)
+        h.send_header("Content-Length", str(len(data)))
+        h.end_headers()
+        h.wfile.write(data)
+
+    def _handle(self, h: BaseHTTPRequestHandler, method: str) -> None:
+        u = urlparse(h.path)
+        q = {k: v[0] for k, v in parse_qs(u.query).items()}
+        payload = None
+        if method == "POST":
+            length = int(h.headers.get("Content-Length") or 0)
+            payload = json.loads(h.rfile.read(length) or b"{}")
+        if u.path.startswith("/__bench/"):
+            return self._control(h, u.path, payload)
+        if self.latency:
+            threading.Event().wait(self.latency)
+
+        if method == "GET" and (m := _PR.match(u.path)):
+            pr = self.prs.get(int(m.group(1)))
+            if pr is None:
+                return self._send(h, "pr", 404, {"message": "Not Found"})
+            if "diff" in (h.headers.get("Accept") or ""):
+                return self._send(h, "pr.diff", 200, None, raw=unified_diff(pr).encode())
+            meta = {k: v for k, v in pr.items() if k != "files"}
+            etag = f'"pr-{pr["number"]}-{pr["head"]["sha"][:8]}"'
+            if h.headers.get("If-None-Match") == etag:
+                return self._send(h, "pr.304", 304, None, {"ETag": etag})
+            return self._send(h, "pr", 200, meta, {"ETag": etag})
+
+        if method == "GET" and (m := _FILES.match(u.path)):
+            pr = self.prs[int(m.group(1))]
+            page, per_page = int(q.get("page", 1)), int(q.get("per_page", 30))
+            files = pr["files"][:3000]
+            chunk = files[(page - 1) * per_page: page * per_page]
+            last = max(1, -(-len(files) // per_page))
+            link = f'<{self.url}{u.path}?page={last}&per_page={per_page}>; rel="last"'
+            return self._send(h, "files", 200, chunk, {"Link": link})
+
+        if method == "POST" and (m := _REVIEWS.match(u.path)):
+            n = len(payload.get("comments") or [])
+            with self._lock:
+                self.posted_comments += n
+            return self._send(h, "reviews", 200, {"id": 1})
+
+        if method == "POST" and (m := _PR_COMMENTS.match(u.path)):
+            c = self.add_comment(int(m.group(1)), payload.get("body", ""), payload.get("in_reply_to"), "bot")
+            with self._lock:
+                self.posted_comments += 1
+            return self._send(h, "comments.post", 201, c)
+
+        if method == "GET" and (m := _PR_COMMENTS.match(u.path)):
+            items = self.comments.get(int(m.group(1)), [])
+            if q.get("since"):
+                items = [c for c in items if c["updated_at"] >= q["since"]]
+            page, per_page = int(q.get("page", 1)), int(q.get("per_page", 30))
+            headers = {}
+            if page * per_page < len(items):
+                nxt = dict(q, page=page + 1, per_page=per_page)
+                headers["Link"] = f'<{self.url}{u.path}?{urlencode(nxt)}>; rel="next"'
+            return self._send(h, "comments.list", 200, items[(page - 1) * per_page: page * per_page], headers)
+
+        if method == "GET" and (m := _COMMENT.match(u.path)):
+            cid = int(m.group(1))
+            for items in self.comments.values():
+                for c in items:
+                    if c["id"] == cid:
+                        return self._send(h, "comment", 200, c)
+            return self._send(h, "comment", 404, {"message": "Not Found"})
+
+        return self._send(h, "unknown", 404, {"message": f"stub: no route for {method} {u.path}"})
+
+
+def serve(port_queue, latency: float = 0.0) -> None:
+    """Точка входа для отдельного процесса: заглушка не влияет на замеры памяти/CPU бенчмарка."""
+    stub = GitHubStub(latency=latency).start()
+    port_queue.put(stub.url)
+    threading.Event().wait()
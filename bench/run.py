@@ -0,0 +1,328 @@
+"""
+Офлайн end-to-end бенчмарк: python -m bench.run [--sizes 1,10,100] [--save-baseline].
+
+Заглушка GitHub API работает в отдельном процессе, ChatOpenAI подменяется FakeChatModel.
+Для каждого сценария меряем время по стадиям, число запросов к GitHub,
+токены промптов, пиковую память (tracemalloc) и сравниваем с bench/baseline.json.
+Сценарии startup[...] запускают отдельный интерпретатор и проверяют бюджет старта:
+пропущенное событие не должно импортировать langchain/langgraph.
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import requests
+
+ROOT = Path(__file__).resolve().parent.parent
+BASELINE = Path(__file__).with_name("baseline.json")
+DEFAULT_SIZES = "1,10,100,1000,3000"
+# метрики-счётчики: рост — регрессия при любом превышении
+COUNT_METRICS = ("github_requests", "llm_calls", "prompt_tokens")
+TIME_METRICS = ("wall_s",)
+# старт процесса до фильтрации события: тяжёлые библиотеки не должны загружаться
+HEAVY_MODULES = ("langchain_core", "langchain_openai", "langgraph", "openai")
+STARTUP_BUDGET_S = 0.5
+
+
+class StageTimer:
+    """Подменяет функции модулей обёртками с замером времени (потокобезопасно, суммарно по вызовам)."""
+
+    def __init__(self):
+        self.totals: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._restore: List[Callable[[], None]] = []
+
+    def wrap(self, module: Any, attr: str, stage: str) -> None:
+        orig = getattr(module, attr)
+
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return orig(*args, **kwargs)
+            finally:
+                dt = time.perf_counter() - t0
+                with self._lock:
+                    self.totals[stage] = self.totals.get(stage, 0.0) + dt
+
+        setattr(module, attr, timed)
+        self._restore.append(lambda: setattr(module, attr, orig))
+
+    def restore(self) -> None:
+        for undo in reversed(self._restore):
+            undo()
+        self._restore.clear()
+
+
+class _TimedGraph:
+    def __init__(self, graph: Any, timer: StageTimer):
+        self._graph = graph
+        self._timer = timer
+
+    def invoke(self, *args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return self._graph.invoke(*args, **kwargs)
+        finally:
+            self._timer.totals["graph"] = self._timer.totals.get("graph", 0.0) + time.perf_counter() - t0
+
+
+def _start_stub(latency: float):
+    ctx = multiprocessing.get_context("spawn")
+    q = ctx.Queue()
+    from .github_stub import serve
+    proc = ctx.Process(target=serve, args=(q, latency), daemon=True)
+    proc.start()
+    return proc, q.get(timeout=30)
+
+
+def _control(url: str, name: str, payload: Any = None) -> Any:
+    r = requests.post(f"{url}/__bench/{name}", json=payload or {}) if payload is not None or name != "stats" \
+        else requests.get(f"{url}/__bench/stats")
+    r.raise_for_status()
+    return r.json()
+
+
+def _measure(url: str, fn: Callable[[], Any], timer: StageTimer, verbose: bool) -> Dict[str, Any]:
+    from .fake_llm import FakeChatModel
+
+    _control(url, "reset", {})
+    FakeChatModel.reset()
+    tracemalloc.start()
+    out = io.StringIO()
+    t0 = time.perf_counter()
+    with (contextlib.nullcontext() if verbose else contextlib.redirect_stdout(out)):
+        fn()
+    wall = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = _control(url, "stats")
+    return {
+        "wall_s": round(wall, 4),
+        "stages_s": {k: round(v, 4) for k, v in sorted(timer.totals.items())},
+        "github_requests": sum(stats["counts"].values()),
+        "github_by_route": stats["counts"],
+        "posted_comments": stats["posted_comments"],
+        "llm_calls": FakeChatModel.stats["calls"],
+        "prompt_tokens": FakeChatModel.stats["prompt_tokens"],
+        "peak_mb": round(peak / 2 ** 20, 2),
+    }
+
+
+def run_review(url: str, pr_number: int, verbose: bool) -> Dict[str, Any]:
+    import src.graph as graph_mod
+    import src.main as main_mod
+
+    timer = StageTimer()
+    timer.wrap(main_mod, "fetch_pr", "fetch")
+    timer.wrap(main_mod, "load_diff_index", "index")
+    timer.wrap(main_mod, "build_diff_shards", "shard")
+    timer.wrap(graph_mod, "_review_units", "codestyle (sum over shards)")
+    timer.wrap(graph_mod, "resolve_position", "resolve")
+    timer.wrap(graph_mod, "post_inline_comments", "post")
+    get_graph = graph_mod.get_review_graph
+    timed = _TimedGraph(get_graph(), timer)
+    graph_mod.get_review_graph = lambda: timed
+    try:
+        return _measure(url, lambda: main_mod.main(pr_number), timer, verbose)
+    finally:
+        graph_mod.get_review_graph = get_graph
+        timer.restore()
+
+
+def run_responder(url: str, pr_number: int, thread_len: int, noise: int, verbose: bool) -> Dict[str, Dict[str, Any]]:
+    """
+    Упоминание бота в треде длиной thread_len на PR, где уже есть noise комментариев в других тредах;
+    responder-repeat — ещё одно упоминание в том же треде (кэш комментариев PR тёплый).
+    """
+    import src.comment_responder as responder
+    import src.github_client as gh
+
+    for i in range(noise):
+        _control(url, "comment", {"pr": pr_number, "body": f"шум {i}"})
+    root = _control(url, "comment", {"pr": pr_number, "body": "Почему тут var?"})
+    last = root
+    for i in range(thread_len - 1):
+        last = _control(url, "comment", {"pr": pr_number, "body": f"ответ {i}", "in_reply_to": root["id"]})
+
+    def mention(comment: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "action": "created",
+            "pull_request": {"number": pr_number},
+            "comment": dict(comment, body="@ai что думаешь?", in_reply_to_id=root["id"]),
+        }
+
+    timer = StageTimer()
+    # клиент GitHub responder импортирует при обработке события — оборачиваем в самом модуле
+    timer.wrap(gh, "get_review_thread", "thread")
+    timer.wrap(responder, "_ask_llm", "llm")
+    timer.wrap(gh, "post_review_comment_reply", "reply")
+    try:
+        out = {"responder": _measure(
+            url, lambda: responder.handle_event("pull_request_review_comment", mention(last)), timer, verbose)}
+        timer.totals.clear()
+        again = _control(url, "comment", {"pr": pr_number, "body": "и ещё", "in_reply_to": root["id"]})
+        out["responder-repeat"] = _measure(
+            url, lambda: responder.handle_event("pull_request_review_comment", mention(again)), timer, verbose)
+        return out
+    finally:
+        timer.restore()
+
+
+_STARTUP_SNIPPET = '''
+import json, sys, time
+t0 = time.perf_counter()
+{code}
+print(json.dumps({{"elapsed": time.perf_counter() - t0,
+                  "heavy": sorted(m for m in {heavy!r} if m in sys.modules)}}))
+'''
+
+
+def run_startup(code: str, env: Dict[str, str]) -> Dict[str, Any]:
+    """Холодный старт в отдельном интерпретаторе: время (включая запуск python) и загруженные тяжёлые модули."""
+    snippet = _STARTUP_SNIPPET.format(code=code, heavy=HEAVY_MODULES)
+    t0 = time.perf_counter()
+    p = subprocess.run([sys.executable, "-c", snippet], cwd=ROOT, env={**os.environ, **env},
+                       capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - t0
+    data = json.loads(p.stdout.strip().splitlines()[-1])
+    return {
+        "wall_s": round(wall, 4),
+        "stages_s": {"in-process": round(data["elapsed"], 4)},
+        "github_requests": 0,
+        "github_by_route": {},
+        "posted_comments": 0,
+        "llm_calls": 0,
+        "prompt_tokens": 0,
+        "peak_mb": 0.0,
+        "heavy_imports": data["heavy"],
+    }
+
+
+def run_startup_scenarios(tmp_dir: str) -> Dict[str, Dict[str, Any]]:
+    event_path = os.path.join(tmp_dir, "event-no-mention.json")
+    with open(event_path, "w", encoding="utf-8") as f:
+        json.dump({"action": "created", "pull_request": {"number": 1},
+                   "comment": {"id": 1, "body": "просто комментарий"}}, f)
+    responder_env = {"GITHUB_EVENT_NAME": "pull_request_review_comment", "GITHUB_EVENT_PATH": event_path}
+    return {
+        # типичное событие без упоминания бота: разбор JSON и выход
+        "startup[responder-skip]": run_startup(
+            "from src import comment_responder\ncomment_responder.main()", responder_env),
+        "startup[import-main]": run_startup("import src.main", {}),
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    """Список регрессий относительно baseline."""
+    problems: List[str] = []
+    for name, cur in results.items():
+        if "heavy_imports" in cur:
+            if cur["heavy_imports"]:
+                problems.append(f"{name}: heavy imports at startup: {', '.join(cur['heavy_imports'])}")
+            if cur["wall_s"] > STARTUP_BUDGET_S:
+                problems.append(f"{name}: startup {cur['wall_s']}s over budget {STARTUP_BUDGET_S}s")
+        base = baseline.get(name)
+        if not base:
+            continue
+        for m in TIME_METRICS:
+            if cur[m] > base[m] * (1 + tolerance) and cur[m] - base[m] > 0.05:
+                problems.append(f"{name}: {m} {base[m]} -> {cur[m]}")
+        for m in COUNT_METRICS + ("peak_mb",):
+            limit = base[m] * (1 + tolerance) if m == "peak_mb" else base[m]
+            if cur[m] > limit:
+                problems.append(f"{name}: {m} {base[m]} -> {cur[m]}")
+    return problems
+
+
+def _print_table(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]]) -> None:
+    head = f"{'scenario':<24}{'wall_s':>10}{'base':>10}{'gh_req':>8}{'llm':>6}{'tokens':>10}{'peak_mb':>9}  stages"
+    print(head)
+    print("-" * len(head))
+    for name, r in results.items():
+        base = baseline.get(name, {}).get("wall_s", "-")
+        stages = ", ".join(f"{k}={v}" for k, v in r["stages_s"].items())
+        print(f"{name:<24}{r['wall_s']:>10}{base:>10}{r['github_requests']:>8}{r['llm_calls']:>6}"
+              f"{r['prompt_tokens']:>10}{r['peak_mb']:>9}  {stages}")
+
+
+def main(argv: List[str] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--sizes", default=DEFAULT_SIZES, help="размеры PR (число файлов) через запятую")
+    ap.add_argument("--thread-len", type=int, default=30, help="длина треда для сценария responder")
+    ap.add_argument("--pr-comments", type=int, default=300, help="комментарии в других тредах PR (responder)")
+    ap.add_argument("--llm-latency", type=float, default=0.05, help="базовая задержка фейковой LLM, сек")
+    ap.add_argument("--gh-latency", type=float, default=0.0, help="задержка заглушки GitHub на запрос, сек")
+    ap.add_argument("--baseline", default=str(BASELINE))
+    ap.add_argument("--save-baseline", action="store_true", help="записать результаты как новый baseline")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="допуск по времени и памяти (доля)")
+    ap.add_argument("--strict", action="store_true", help="код возврата 1 при регрессиях")
+    ap.add_argument("--out", help="записать результаты в JSON")
+    ap.add_argument("--verbose", action="store_true", help="не глушить вывод ревьюера")
+    args = ap.parse_args(argv)
+
+    proc, url = _start_stub(args.gh_latency)
+    cache_dir = tempfile.mkdtemp(prefix="ai-review-bench-")
+    # окружение до импорта src: config читает переменные при импорте
+    os.environ.update({
+        "GITHUB_API_URL": url,
+        "GITHUB_REPO": "bench/repo",
+        "GITHUB_TOKEN": "bench-token",
+        "OPENAI_API_KEY": "bench-key",
+        "REVIEW_CACHE_PATH": os.path.join(cache_dir, "reviews.sqlite"),
+        "THREAD_CONTEXT_PATH": os.path.join(cache_dir, "threads.sqlite"),
+    })
+    from .fake_llm import FakeChatModel
+    FakeChatModel.latency = args.llm_latency
+    import src.llm as llm
+    llm.chat_model_class = lambda: FakeChatModel
+    llm.get_chat_model.cache_clear()
+
+    results: Dict[str, Dict[str, Any]] = {}
+    try:
+        for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+            number = 100000 + size
+            _control(url, "load", {"number": number, "files": size})
+            results[f"review[{size}]"] = run_review(url, number, args.verbose)
+            # повторный push без изменений: всё из кэша ревью
+            results[f"review-resync[{size}]"] = run_review(url, number, args.verbose)
+        _control(url, "load", {"number": 1, "files": 1})
+        results.update(run_responder(url, 1, args.thread_len, args.pr_comments, args.verbose))
+        results.update(run_startup_scenarios(cache_dir))
+    finally:
+        proc.terminate()
+
+    baseline: Dict[str, Dict[str, Any]] = {}
+    if Path(args.baseline).exists():
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+    _print_table(results, baseline)
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        Path(args.baseline).write_text(json.dumps(results, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+        print(f"baseline saved: {args.baseline}")
+        return 0
+
+    problems = compare(results, baseline, args.tolerance)
+    if problems:
+        print("\nregressions vs baseline:")
+        for p in problems:
+            print(f"  - {p}")
+    elif baseline:
+        print("\nno regressions vs baseline")
+    return 1 if problems and args.strict else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
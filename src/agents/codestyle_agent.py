@@ -1,8 +1,16 @@
-from typing import List, Dict, Any
-from langchain_openai import ChatOpenAI
-from ..config import get_openai_model
-from ..utils import extract_json
-from pathlib import Path
+import time
+from functools import lru_cache
+from typing import List, Dict, Any, Callable, Optional, Tuple
+from .. import metrics
+from ..llm import Attempt, LLMUnavailable, get_chat_model, resilient_call
+from ..config import get_openai_model, LLM_STREAMING, REVIEW_MAX_PROMPT_TOKENS
+from ..compaction import estimate_tokens
+from ..json_stream import JsonArrayStream
+from ..utils import parse_json_array
+from ..rules import load_rules, rules_for_prompt
+
+# минимум токенов под дифф, даже если правила съели почти весь бюджет
+MIN_DIFF_TOKENS = 1000
 
 PROMPT = (
     "Ты строгий ревьюер code style. На вход — unified diff PR (несколько файлов).\n"
@@ -25,10 +33,110 @@ PROMPT = (
 )
 
 
+@lru_cache(maxsize=None)
+def _prompt_parts() -> Tuple[str, str]:
+    """Промпт с подставленными правилами, разрезанный по месту диффа (собирается один раз)."""
+    # forbiddenPatterns и files исполняются локально (rules.LOCAL_SECTIONS) — в промпт их не кладём
+    rules_text = rules_for_prompt(load_rules())
+    head, tail = PROMPT.replace("{rules}", rules_text).split("{diff}", 1)
+    return head, tail
+
+
+def diff_token_budget() -> int:
+    """Сколько токенов остаётся на дифф шарда в пределах REVIEW_MAX_PROMPT_TOKENS."""
+    head, tail = _prompt_parts()
+    return max(MIN_DIFF_TOKENS, REVIEW_MAX_PROMPT_TOKENS - estimate_tokens(head) - estimate_tokens(tail))
+
+
+def _chunk_text(content: Any) -> str:
+    """content чанка — строка или список блоков ({"type": "text", "text": ...})."""
+    if isinstance(content, str):
+        return content
+    return "".join(b.get("text", "") if isinstance(b, dict) else str(b) for b in content or [])
+
+
+def _stream_items(llm: Any, prompt_text: str, on_item: Callable[[Dict[str, Any]], None],
+                  m: Dict[str, float], attempt: Attempt) -> Optional[List[Dict[str, Any]]]:
+    """
+    Потоковый ответ: каждый допечатанный объект массива сразу уходит в on_item.
+    None — массив так и не закрылся (ответ оборван, не JSON или поток прервался
+    после первых замечаний): отданные объекты остаются у вызывающего, но ответ
+    не считается полным (например, не кэшируется). Ошибка до первого замечания
+    пробрасывается — такую попытку можно повторить.
+    """
+    parser = JsonArrayStream()
+    items: List[Dict[str, Any]] = []
+    t0 = time.perf_counter()
+    try:
+        for chunk in llm.stream(prompt_text):
+            if attempt():
+                # попытку бросили по дедлайну — её замечания уже никому не нужны
+                return None
+            attempt.alive()  # дедлайн потока — от последнего куска, а не от начала ответа
+            for k, v in metrics.llm_usage(chunk).items():
+                m[k] = m.get(k, 0) + v
+            for it in parser.feed(_chunk_text(getattr(chunk, "content", ""))):
+                if not items:
+                    m["first_item_s"] = time.perf_counter() - t0
+                items.append(it)
+                on_item(it)
+    except Exception as e:
+        if not items:
+            raise
+        print(f"[codestyle] stream broken after {len(items)} items: {e!r}")
+        return None
+    if not parser.complete:
+        print(f"[codestyle] streamed answer is incomplete ({len(items)} items, errors: {parser.errors})")
+        return None
+    return items
+
+
+def review_diff(
+    diff: str,
+    on_item: Optional[Callable[[Dict[str, Any]], None]] = None,
+    model: Optional[str] = None,
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Ревью диффа; None, если ответ модели не удалось разобрать как JSON-массив.
+    on_item — вызывается для каждого объекта ответа, как только он разобран
+    (при LLM_STREAMING — ещё до конца генерации).
+    model — модель шарда (см. routing); по умолчанию OPENAI_MODEL.
+    Вызов идёт с дедлайном и повторами (llm.resilient_call); если все попытки
+    не удались — llm.LLMUnavailable.
+    """
+    model = model or get_openai_model()
+    llm = get_chat_model(model)
+    head, tail = _prompt_parts()
+    prompt_text = "".join((head, diff, tail))
+    label = f"codestyle:{model}"
+    with metrics.current().span("llm", label) as m:
+        if LLM_STREAMING and on_item is not None and hasattr(llm, "stream"):
+            # замечания уходят в on_item по ходу: хедж и повтор после первых замечаний задвоили бы их
+            delivered = [0]
+
+            def deliver(it: Dict[str, Any]) -> None:
+                delivered[0] += 1
+                on_item(it)
+
+            try:
+                return resilient_call(
+                    lambda attempt: _stream_items(llm, prompt_text, deliver, m, attempt),
+                    label, hedge=False, may_retry=lambda: not delivered[0], stream=True,
+                )
+            except LLMUnavailable as e:
+                if not delivered[0]:
+                    raise
+                print(f"[codestyle] answer cut short after {delivered[0]} items: {e}")
+                return None
+        resp = resilient_call(lambda attempt: llm.invoke(prompt_text), label)
+        m.update(metrics.llm_usage(resp))
+    items = parse_json_array(getattr(resp, "content", ""))
+    if on_item is not None:
+        for it in items or []:
+            if isinstance(it, dict):
+                on_item(it)
+    return items
+
+
 def run_codestyle_agent(diff: str) -> List[Dict[str, Any]]:
-    llm = ChatOpenAI(model=get_openai_model(), temperature=0)
-    rules_text = Path(".github/ai-review.json").read_text(encoding="utf-8")
-    prompt_text = PROMPT.replace("{diff}", diff).replace("{rules}", rules_text)
-    resp = llm.invoke(prompt_text)
-    data = extract_json(getattr(resp, "content", ""))
-    return data if isinstance(data, list) else []
+    return review_diff(diff) or []
@@ -0,0 +1,98 @@
+"""
+Пакетное ревью многих PR в одном процессе (например, ночной перепрогон после смены правил).
+
+    python -m src.batch 12 15 20
+    python -m src.batch --open [--since 2024-05-01T00:00:00Z] [--limit 50]
+
+PR ревьюятся параллельно (не больше BATCH_CONCURRENCY сразу) и делят между собой всё,
+что в одиночном режиме создаётся на процесс: HTTP-пул и бюджет запросов GitHub,
+скомпилированный граф, правила, кэш ревью, LLM-клиент и общий бюджет вызовов LLM (слоты llm.resilient_call).
+Ошибка в одном PR не останавливает остальные; итоговые метрики — сумма по всем PR.
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from . import metrics
+from .config import BATCH_CONCURRENCY
+
+
+def _review_one(pr_number: int) -> Tuple[metrics.Metrics, float, Optional[Exception]]:
+    """Ревью одного PR в потоке пула: (метрики PR, время работы без ожидания в очереди, ошибка)."""
+    from .main import review
+
+    t0 = time.perf_counter()
+    with metrics.use_metrics(metrics.Metrics(f"PR #{pr_number}")) as m:
+        try:
+            review(pr_number, m)
+        except Exception as e:
+            return m, time.perf_counter() - t0, e
+    return m, time.perf_counter() - t0, None
+
+
+def open_pr_numbers(since: Optional[str] = None, limit: Optional[int] = None) -> List[int]:
+    from .github_client import list_open_prs
+
+    out: List[int] = []
+    for pr in list_open_prs(since):
+        if pr.get("draft"):
+            continue
+        out.append(int(pr["number"]))
+        if limit and len(out) >= limit:
+            break
+    return out
+
+
+def run_batch(pr_numbers: Iterable[int], concurrency: int = BATCH_CONCURRENCY) -> Dict[int, str]:
+    """Ревью списка PR; {pr_number: "ok" | "failed: ..."}."""
+    from .graph import get_review_graph
+
+    prs = list(dict.fromkeys(int(n) for n in pr_numbers))
+    total = metrics.Metrics(f"batch ({len(prs)} PRs)")
+    results: Dict[int, str] = {}
+    if not prs:
+        print("[batch] nothing to review")
+        return results
+
+    get_review_graph()  # компилируем один раз до запуска потоков
+    print(f"[batch] reviewing {len(prs)} PRs, {concurrency} at a time")
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="batch") as pool:
+        futures = {pool.submit(_review_one, n): n for n in prs}
+        for fut in as_completed(futures):
+            n = futures[fut]
+            m, dt, err = fut.result()
+            total.merge(m)
+            total.observe("pr", f"#{n}", dt)
+            results[n] = "ok" if err is None else f"failed: {err!r}"
+            total.add("prs.ok" if err is None else "prs.failed")
+            print(f"[batch] PR {n}: {results[n]} ({dt:.1f}s)")
+
+    failed = sum(1 for v in results.values() if v != "ok")
+    print(f"[batch] done in {time.perf_counter() - t0:.1f}s: {len(prs) - failed} ok, {failed} failed")
+    metrics.write_report(total)
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m src.batch", description="Пакетное ревью PR")
+    ap.add_argument("prs", nargs="*", type=int, help="номера PR")
+    ap.add_argument("--open", action="store_true", help="все открытые PR (кроме черновиков)")
+    ap.add_argument("--since", help="с --open: только обновлённые начиная с (ISO 8601)")
+    ap.add_argument("--limit", type=int, help="с --open: не больше N PR")
+    ap.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    args = ap.parse_args(argv)
+
+    prs = list(args.prs)
+    if args.open:
+        prs += open_pr_numbers(args.since, args.limit)
+    if not prs:
+        ap.error("нужны номера PR или --open")
+    results = run_batch(prs, args.concurrency)
+    return 1 if any(v != "ok" for v in results.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
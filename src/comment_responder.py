@@ -5,14 +5,13 @@ Responder по упоминанию бота (@ai) в инлайн-коммен
 """
 import json
 import os
-from typing import List
+from typing import Any, Dict, List
 
-from langchain_openai import ChatOpenAI
+# только лёгкие модули: большинство событий отсекается фильтром ниже,
+# клиент GitHub (requests) и langchain загружаются лишь при ответе
+from . import metrics
 from .config import OPENAI_MODEL, BOT_MENTION
-from .github_client import (
-    get_review_thread,
-    post_review_comment_reply,
-)
+from .llm import LLMUnavailable, get_chat_model, resilient_call
 
 SYSTEM = (
     "Ты помощник-ревьюер. Отвечай на русском кратко и по делу. "
@@ -37,38 +36,68 @@ def _safe_resp_text(resp) -> str:
     return str(resp or "")
 
 
-def _ask_llm(history_lines: List[str], tail_hint: str) -> str:
-    llm = ChatOpenAI(model=OPENAI_MODEL, temperature=0)
-    prompt = (
-        "Контекст обсуждения (последние сообщения):\n"
-        + "\n".join(history_lines[-20:])
-        + f"\n\nЗадача: {tail_hint}\n"
-        "Отвечай максимально предметно, коротко, на русском."
-    )
-    resp = llm.invoke(
-        [{"role": "system", "content": SYSTEM},
-         {"role": "user", "content": prompt}]
-    )
-    return (_safe_resp_text(resp).strip()
-            or "Уточни вопрос: к какой строке/файлу и что именно смущает?")
+SUMMARY_PROMPT = (
+    "Обнови краткую сводку обсуждения в треде код-ревью. Сохрани суть: вопросы, аргументы, "
+    "договорённости и открытые пункты; без приветствий и повторов. Не больше 120 слов, на русском.\n\n"
+    "Текущая сводка:\n{summary}\n\nНовые сообщения:\n{messages}"
+)
 
 
-if __name__ == "__main__":
-    event_name = os.getenv("GITHUB_EVENT_NAME", "")
-    event_path = os.getenv("GITHUB_EVENT_PATH")
-    if not event_path:
-        raise SystemExit("GITHUB_EVENT_PATH not set")
+def _summarize(summary: str, lines: List[str]) -> str:
+    """Инкрементальная сводка: старая сводка + сообщения, выпавшие из окна последних."""
+    prompt = SUMMARY_PROMPT.format(summary=summary or "—", messages="\n".join(lines))
+    try:
+        label = f"responder-summary:{OPENAI_MODEL}"
+        llm = get_chat_model(OPENAI_MODEL)
+        with metrics.current().span("llm", label) as m:
+            resp = resilient_call(lambda attempt: llm.invoke(prompt), label)
+            m.update(metrics.llm_usage(resp))
+        text = _safe_resp_text(resp).strip()
+        if text:
+            return text
+    except Exception as e:
+        print(f"[responder] summary failed: {e}")
+    # запасной вариант без LLM: начала сообщений
+    return "\n".join(filter(None, [summary] + [ln[:200] for ln in lines]))
+
+
+def _build_prompt(ctx: Dict[str, Any], tail_hint: str) -> str:
+    parts: List[str] = []
+    if ctx.get("path"):
+        where = f"{ctx['path']}, строка {ctx['line']}" if ctx.get("line") else ctx["path"]
+        parts.append(f"Файл: {where}")
+    if ctx.get("diff_hunk"):
+        parts.append("Обсуждаемый код (diff, комментарий относится к последней строке):\n"
+                     f"```diff\n{ctx['diff_hunk']}\n```")
+    if ctx.get("summary"):
+        parts.append(f"Сводка более ранней части обсуждения:\n{ctx['summary']}")
+    parts.append("Контекст обсуждения (последние сообщения):\n" + "\n".join(ctx.get("recent") or []))
+    parts.append(f"Задача: {tail_hint}\nОтвечай максимально предметно, коротко, на русском.")
+    return "\n\n".join(parts)
+
+
+def _ask_llm(ctx: Dict[str, Any], tail_hint: str) -> str:
+    """Ответ модели (с дедлайном, повторами и хеджем); llm.LLMUnavailable — если не удалось."""
+    llm = get_chat_model(OPENAI_MODEL)
+    messages = [{"role": "system", "content": SYSTEM},
+                {"role": "user", "content": _build_prompt(ctx, tail_hint)}]
+    label = f"responder:{OPENAI_MODEL}"
+    with metrics.current().span("llm", label) as m:
+        resp = resilient_call(lambda attempt: llm.invoke(messages), label)
+        m.update(metrics.llm_usage(resp))
+    return (_safe_resp_text(resp).strip()
+            or "Уточни вопрос: к какой строке/файлу и что именно смущает?")
 
-    with open(event_path, "r", encoding="utf-8") as f:
-        evt = json.load(f)
 
+def handle_event(event_name: str, evt: Dict[str, Any]) -> bool:
+    """Обрабатываем событие; True — ответ в тред опубликован."""
     if evt.get("action") != "created":
         print(f"[responder] skip: action={evt.get('action')}")
-        raise SystemExit(0)
+        return False
 
     if event_name != "pull_request_review_comment":
         print(f"[responder] unsupported event for inline-only mode: {event_name}")
-        raise SystemExit(0)
+        return False
 
     pr = evt.get("pull_request") or {}
     pr_number = pr.get("number")
@@ -79,22 +108,46 @@ if __name__ == "__main__":
 
     if not (pr_number and comment_id and _contains_mention(body, BOT_MENTION)):
         print("[responder] skip inline: missing data or no mention")
-        raise SystemExit(0)
-
-    # Собираем тред инлайн-обсуждения
-    thread = get_review_thread(int(pr_number), int(comment_id))
-    thread_lines: List[str] = []
-    for c in thread:
-        user = (c.get("user") or {}).get("login") or "user"
-        t = c.get("body") or ""
-        thread_lines.append(f"{user}: {t}")
-
-    # Если тред пуст — используем сам комментарий автора
-    if not thread_lines:
-        thread_lines.append(f"author: {body}")
-
-    text = _ask_llm(thread_lines, "Ответь по текущему треду к изменённой строке.")
+        return False
+
+    from .github_client import get_review_thread, post_review_comment_reply
+    from .thread_context import build_context, get_thread_store
+
+    # Собираем тред инлайн-обсуждения и сжимаем его: сводка старых сообщений
+    # (хранится по корню треда) + последние сообщения + diff_hunk обсуждаемого кода
+    thread = get_review_thread(int(pr_number), int(comment_id), comment=comment)
+    head_sha = (pr.get("head") or {}).get("sha") or comment.get("commit_id") or ""
+    ctx = build_context(get_thread_store(), thread, comment, head_sha, _summarize)
+
+    try:
+        text = _ask_llm(ctx, "Ответь по текущему треду к изменённой строке.")
+    except LLMUnavailable as e:
+        # без ответа модели в тред ничего не пишем; задача завершается штатно
+        print(f"[responder] no reply: {e}")
+        return False
     # отвечаем в этом же треде (через in_reply_to)
     print(f"[responder] inline reply -> PR {pr_number}, in_reply_to={comment_id}")
     post_review_comment_reply(int(pr_number), int(comment_id), text)
     print(f"[responder] inline reply posted (PR {pr_number}, in_reply_to={comment_id})")
+    return True
+
+
+def main():
+    event_name = os.getenv("GITHUB_EVENT_NAME", "")
+    event_path = os.getenv("GITHUB_EVENT_PATH")
+    if not event_path:
+        raise SystemExit("GITHUB_EVENT_PATH not set")
+
+    with open(event_path, "r", encoding="utf-8") as f:
+        evt = json.load(f)
+
+    # отчёт пишется и при ошибке GitHub/LLM — именно такой запуск и нужно разбирать
+    with metrics.use_metrics(metrics.Metrics(f"responder {event_name}")) as m:
+        try:
+            handle_event(event_name, evt)
+        finally:
+            metrics.write_report(m)
+
+
+if __name__ == "__main__":
+    main()
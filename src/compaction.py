@@ -0,0 +1,239 @@
+"""
+Компактизация диффа перед отправкой в LLM.
+
+- офлайн-оценка числа токенов (без токенизатора и сети);
+- обрезка контекстных строк: оставляем не больше N строк вокруг изменений;
+  между оставленными кусками ханк делится на под-ханки с пересчитанными заголовками '@@';
+- ханки только с удалениями в промпт не идут — комментировать в новой версии нечего;
+- бюджет токенов на один запрос: ханк больше бюджета делится на окна строк (split_hunk),
+  каждое уходит в свой шард; обрезка шарда по строкам — последняя страховка.
+"""
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from .diff_index import Hunk, render_hunks
+
+TRUNCATED_MARK = "… (ханк обрезан по бюджету токенов)"
+
+_HEADER_RE = re.compile(r"^@@ -(\d+)(?:,\d+)? \+(\d+)(?:,\d+)? @@(.*)$")
+# запас на заголовки '@@' под-ханков окна
+_HEADER_TOKENS = 12
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Грубая оценка токенов BPE-токенизатора: ~4 ASCII-символа на токен,
+    ~2 символа на токен для не-ASCII (кириллица и пр.).
+    Считается за O(1) проходов на C-уровне (len/encode), без токенизатора.
+    """
+    if not text:
+        return 0
+    chars = len(text)
+    # для 2-байтных символов UTF-8 разница байт и символов = число не-ASCII символов
+    non_ascii = min(chars, len(text.encode("utf-8")) - chars)
+    return (chars - non_ascii + 3) // 4 + (non_ascii + 1) // 2
+
+
+def _hunk_header(old: int, old_count: int, new: int, new_count: int, section: str) -> str:
+    # для пустой стороны (count 0) номер — строка перед ханком, как у git
+    return (f"@@ -{old if old_count else old - 1},{old_count}"
+            f" +{new if new_count else new - 1},{new_count} @@{section}")
+
+
+def _kept(body: List[str], context_lines: int) -> List[bool]:
+    """Какие строки тела ханка остаются при context_lines строк контекста вокруг изменений."""
+    if context_lines < 0:
+        return [True] * len(body)
+    # расстояние до ближайшей изменённой строки: проход вперёд и назад
+    far = len(body) + 1
+    dist = [far] * len(body)
+    last = -far
+    for i, ln in enumerate(body):
+        if ln[:1] in ("+", "-"):
+            last = i
+        dist[i] = i - last
+    last = 2 * far
+    for i in range(len(body) - 1, -1, -1):
+        if body[i][:1] in ("+", "-"):
+            last = i
+        dist[i] = min(dist[i], last - i)
+
+    keep: List[bool] = []
+    for i, ln in enumerate(body):
+        if ln.startswith("\\"):
+            # "\ No newline at end of file" — только вслед за оставленной строкой
+            keep.append(bool(keep) and keep[-1])
+        else:
+            keep.append(dist[i] <= context_lines)
+    return keep
+
+
+def _sub_hunks(header: str, body: List[str], keep: List[bool]) -> Optional[List[str]]:
+    """
+    Строки keep, разбитые на под-ханки: у каждого непрерывного куска свой заголовок
+    с номерами строк старой и новой версии. None — заголовок не разобрать.
+    """
+    m = _HEADER_RE.match(header)
+    if not m:
+        return None
+    old, new, section = int(m.group(1)), int(m.group(2)), m.group(3)
+    out: List[str] = []
+    run: List[str] = []
+    run_old = run_new = old_count = new_count = 0
+
+    def flush():
+        if run:
+            out.append(_hunk_header(run_old, old_count, run_new, new_count, section))
+            out.extend(run)
+
+    for ln, k in zip(body, keep):
+        if k:
+            if not run:
+                run_old, run_new, old_count, new_count = old, new, 0, 0
+            run.append(ln)
+        elif run:
+            flush()
+            run = []
+        prefix = ln[:1]
+        if prefix in (" ", "-"):
+            old += 1
+            old_count += k
+        if prefix in (" ", "+"):
+            new += 1
+            new_count += k
+    flush()
+    return out
+
+
+def compact_hunk(text: str, context_lines: int) -> Optional[str]:
+    """
+    Сжимаем текст ханка ('@@ ...' + строки с префиксами).
+    None — в ханке нет добавленных строк (только удаления), в LLM его не шлём.
+    context_lines < 0 — контекст не трогаем.
+    Если между оставленными строками есть пропуск, ханк делится на под-ханки
+    со своими заголовками '@@ -a,b +c,d @@' — соседние строки в тексте остаются соседними в файле.
+    """
+    lines = text.split("\n")
+    header, body = lines[0], lines[1:]
+    if not any(ln.startswith("+") for ln in body):
+        return None
+    keep = _kept(body, context_lines)
+    if all(keep):
+        return text
+    parts = _sub_hunks(header, body, keep)
+    if parts is None:
+        # заголовок без номеров строк — контекст не режем, чтобы не склеить несмежные строки
+        return text
+    return "\n".join(parts)
+
+
+def split_hunk(hunk: Hunk, context_lines: int, max_tokens: int) -> List[Hunk]:
+    """
+    Ханк больше бюджета — окна подряд идущих строк, каждое (после компактизации)
+    укладывается в max_tokens. Окна без добавленных строк отбрасываются.
+    """
+    text = hunk.text
+    header, _, _ = text.partition("\n")
+    m = _HEADER_RE.match(header)
+    if not m:
+        return [hunk]
+    budget = max(1, max_tokens - estimate_tokens(hunk.path) - 4 - _HEADER_TOKENS)
+    buf = hunk.buffer
+    body = buf[hunk.body_start:hunk.end].split("\n")
+    keep = _kept(body, context_lines)
+    old, new, section = int(m.group(1)), int(m.group(2)), m.group(3)
+
+    windows: List[Hunk] = []
+    pos = hunk.body_start
+    i = 0
+    while i < len(body):
+        w_start, w_old, w_new = pos, old, new
+        old_count = new_count = used = 0
+        has_added = False
+        j = i
+        while j < len(body):
+            ln = body[j]
+            cost = estimate_tokens(ln) + 1 if keep[j] else 0
+            # '\ No newline' не отрываем от предыдущей строки
+            if j > i and used + cost > budget and not ln.startswith("\\"):
+                break
+            used += cost
+            prefix = ln[:1]
+            old_count += prefix in (" ", "-")
+            new_count += prefix in (" ", "+")
+            has_added = has_added or prefix == "+"
+            pos += len(ln) + 1
+            j += 1
+        if has_added:
+            w_header = _hunk_header(w_old, old_count, w_new, new_count, section)
+            windows.append(hunk.window(w_start, pos - 1, w_header))
+        old += old_count
+        new += new_count
+        i = j
+    return windows
+
+
+def compacted_tokens(hunk: Hunk, context_lines: int) -> Optional[int]:
+    text = compact_hunk(hunk.text, context_lines)
+    return None if text is None else estimate_tokens(text) + estimate_tokens(hunk.path) + 4
+
+
+def _truncate(text: str, max_tokens: int) -> Tuple[str, int]:
+    """Оставляем строки с начала, пока укладываемся в бюджет; (текст, сколько строк отброшено)."""
+    lines = text.split("\n")
+    out: List[str] = []
+    used = 0
+    for ln in lines:
+        cost = estimate_tokens(ln) + 1
+        if out and used + cost > max_tokens:
+            out.append(TRUNCATED_MARK)
+            break
+        out.append(ln)
+        used += cost
+    skipped = sum(1 for ln in lines[len(out) - 1:] if ln) if out[-1] == TRUNCATED_MARK else 0
+    return "\n".join(out), skipped
+
+
+def compact_shard(hunks: List[Hunk], context_lines: int, max_tokens: int) -> Tuple[str, Dict[str, Any]]:
+    """
+    Текст шарда для агента после компактизации и статистика:
+    {"hunks", "dropped_hunks", "truncated", "truncated_lines", "tokens_raw", "tokens_sent"}.
+    """
+    stats = {"hunks": len(hunks), "dropped_hunks": 0, "truncated": 0, "truncated_lines": 0,
+             "tokens_raw": 0, "tokens_sent": 0}
+    parts: List[str] = []
+    kept: List[Hunk] = []
+    last_path = raw_path = None
+    for h in hunks:
+        raw = h.text
+        stats["tokens_raw"] += estimate_tokens(raw)
+        if h.path != raw_path:
+            stats["tokens_raw"] += estimate_tokens(h.path) + 4
+            raw_path = h.path
+        text = compact_hunk(raw, context_lines)
+        if text is None:
+            stats["dropped_hunks"] += 1
+            continue
+        kept.append(h)
+        if h.path != last_path:
+            parts.append(f"+++ b/{h.path}")
+            last_path = h.path
+        parts.append(text)
+
+    if context_lines < 0:
+        # контекст не трогаем — берём текст срезами общего буфера
+        text = render_hunks(kept)
+    else:
+        text = "\n".join(parts) + "\n" if parts else ""
+    tokens = estimate_tokens(text)
+    if tokens > max_tokens:
+        # сюда доходят только шарды, не разделённые на окна (например, одна очень длинная строка)
+        text, skipped = _truncate(text, max_tokens)
+        tokens = estimate_tokens(text)
+        stats["truncated"] = 1
+        stats["truncated_lines"] = skipped
+        at = text.rfind("+++ b/")
+        path = text[at + 6:text.find("\n", at)] if at != -1 else "?"
+        print(f"[compact] shard over budget ({max_tokens} tokens): {skipped} lines from {path} on not reviewed")
+    stats["tokens_sent"] = tokens
+    return text, stats
@@ -1,21 +1,129 @@
 import os
-from dotenv import load_dotenv
 
-# Загружаем .env для локальной разработки
-load_dotenv()
+
+def _find_dotenv():
+    # тот же поиск, что у dotenv.find_dotenv: от каталога модуля вверх до корня
+    d = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        path = os.path.join(d, ".env")
+        if os.path.isfile(path):
+            return path
+        parent = os.path.dirname(d)
+        if parent == d:
+            return None
+        d = parent
+
+
+# Загружаем .env для локальной разработки. В Actions файла нет — python-dotenv
+# тогда не импортируется вовсе и не тратит время старта
+_DOTENV = _find_dotenv()
+if _DOTENV:
+    from dotenv import load_dotenv
+
+    load_dotenv(_DOTENV)
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o")
 
-# GitHub (в GitHub Actions GITHUB_REPOSITORY подставится автоматически)
+# GitHub (в GitHub Actions GITHUB_REPOSITORY и GITHUB_API_URL подставятся автоматически)
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
 GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
 GITHUB_REPO = os.getenv("GITHUB_REPO")  # 'owner/repo' или None
 
+# HTTP-слой GitHub API: пул соединений, ретраи, общий бюджет запросов (token bucket), ETag-кэш
+GITHUB_HTTP_POOL_SIZE = int(os.getenv("GITHUB_HTTP_POOL_SIZE", "16"))
+GITHUB_HTTP_RETRIES = int(os.getenv("GITHUB_HTTP_RETRIES", "4"))
+GITHUB_HTTP_TIMEOUT = float(os.getenv("GITHUB_HTTP_TIMEOUT", "30"))
+GITHUB_RATE_PER_SEC = float(os.getenv("GITHUB_RATE_PER_SEC", "10"))
+GITHUB_RATE_BURST = float(os.getenv("GITHUB_RATE_BURST", "20"))
+GITHUB_MAX_RATE_WAIT = float(os.getenv("GITHUB_MAX_RATE_WAIT", "120"))
+GITHUB_ETAG_CACHE_SIZE = int(os.getenv("GITHUB_ETAG_CACHE_SIZE", "256"))
+
 # Ник-упоминание агента
 BOT_MENTION = os.getenv("BOT_MENTION", "@ai")
 
 REVIEW_ONLY_PREFIXES = [p.strip() for p in os.getenv("REVIEW_ONLY_PREFIXES", "src/").split(",") if p.strip()]
 
+# Источник диффа: files — патчи из /pulls/{n}/files; diff — полный .diff PR потоком;
+# auto — files, а если GitHub обрезал список файлов или не отдал patch — .diff;
+# git — git diff в локальном клоне REVIEW_GIT_DIR (из API — только метаданные PR)
+REVIEW_DIFF_SOURCE = os.getenv("REVIEW_DIFF_SOURCE", "auto").strip().lower()
+# Клон целевого репозитория для REVIEW_DIFF_SOURCE=git (в Actions — GITHUB_WORKSPACE)
+REVIEW_GIT_DIR = os.getenv("REVIEW_GIT_DIR") or os.getenv("GITHUB_WORKSPACE") or "."
+
+# Шардинг диффа для параллельного ревью: бюджет токенов на один запрос к LLM
+# (промпт с правилами + дифф шарда) и лимит одновременно выполняемых веток графа
+REVIEW_MAX_PROMPT_TOKENS = int(os.getenv("REVIEW_MAX_PROMPT_TOKENS", "12000"))
+REVIEW_CONCURRENCY = int(os.getenv("REVIEW_CONCURRENCY", "4"))
+# Сколько контекстных строк оставлять вокруг изменений (-1 — не обрезать)
+REVIEW_CONTEXT_LINES = int(os.getenv("REVIEW_CONTEXT_LINES", "1"))
+
+# Сколько inline-комментариев публиковать одним review (POST /pulls/{n}/reviews)
+REVIEW_BATCH_SIZE = int(os.getenv("REVIEW_BATCH_SIZE", "50"))
+
+# Маршрутизация шардов по моделям: простые шарды — быстрой модели REVIEW_FAST_MODEL,
+# остальные — OPENAI_MODEL. Пустой REVIEW_FAST_MODEL — всё идёт в OPENAI_MODEL.
+# Шард простой, если в нём не больше REVIEW_FAST_MAX_ADDED_LINES добавленных строк,
+# не больше REVIEW_FAST_MAX_RULE_HITS срабатываний forbiddenPatterns и нет файлов
+# типов из REVIEW_STRONG_FILE_TYPES. Целевая задержка ответа на уровень — в секундах
+# (превышения видны в логе и метриках, llm.over_target.*)
+REVIEW_FAST_MODEL = os.getenv("REVIEW_FAST_MODEL", "").strip()
+REVIEW_FAST_MAX_ADDED_LINES = int(os.getenv("REVIEW_FAST_MAX_ADDED_LINES", "80"))
+REVIEW_FAST_MAX_RULE_HITS = int(os.getenv("REVIEW_FAST_MAX_RULE_HITS", "2"))
+REVIEW_STRONG_FILE_TYPES = [
+    t.strip().lower().lstrip(".") for t in os.getenv("REVIEW_STRONG_FILE_TYPES", "").split(",") if t.strip()
+]
+REVIEW_FAST_LATENCY_S = float(os.getenv("REVIEW_FAST_LATENCY_S", "15"))
+REVIEW_STRONG_LATENCY_S = float(os.getenv("REVIEW_STRONG_LATENCY_S", "60"))
+
+# Кэш ревью по ханкам (SQLite); пустой путь выключает кэш
+REVIEW_CACHE_PATH = os.getenv("REVIEW_CACHE_PATH", ".ai-review-cache/reviews.sqlite")
+REVIEW_CACHE_MAX_ENTRIES = int(os.getenv("REVIEW_CACHE_MAX_ENTRIES", "50000"))
+REVIEW_CACHE_MAX_AGE_DAYS = float(os.getenv("REVIEW_CACHE_MAX_AGE_DAYS", "30"))
+
+# JSON-отчёт с метриками ревью (время узлов, вызовы GitHub/LLM, токены); пусто — не писать
+REVIEW_METRICS_PATH = os.getenv("REVIEW_METRICS_PATH", "")
+
+# Контекст тредов responder: сколько последних сообщений идут в промпт как есть
+# (более старые сворачиваются в сводку), сколько строк diff_hunk показывать, где хранить
+RESPONDER_RECENT_MESSAGES = int(os.getenv("RESPONDER_RECENT_MESSAGES", "8"))
+RESPONDER_HUNK_MAX_LINES = int(os.getenv("RESPONDER_HUNK_MAX_LINES", "20"))
+THREAD_CONTEXT_PATH = os.getenv("THREAD_CONTEXT_PATH", ".ai-review-cache/threads.sqlite")
+
+# Общий бюджет LLM процесса (важен для batch/server, где параллельно идут несколько ревью):
+# одновременных вызовов (0 — без ограничения) и вызовов в секунду (0 — без ограничения)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_RATE_PER_SEC = float(os.getenv("LLM_RATE_PER_SEC", "0"))
+# Устойчивость вызовов LLM: дедлайн одной попытки, число повторов (с экспоненциальной
+# задержкой от LLM_RETRY_BACKOFF_S), хедж — второй такой же запрос, если первый не ответил
+# за LLM_HEDGE_AFTER_S сек (0 — без хеджа; при накопленной статистике — по p95 задержки)
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF_S = float(os.getenv("LLM_RETRY_BACKOFF_S", "2"))
+LLM_HEDGE_AFTER_S = float(os.getenv("LLM_HEDGE_AFTER_S", "0"))
+# потоковый ответ: LLM_TIMEOUT_S — до первого куска, дальше столько сек без новых данных
+LLM_STREAM_IDLE_S = float(os.getenv("LLM_STREAM_IDLE_S", "30"))
+# Ответ агента ревью читается потоком: замечания разбираются и привязываются к строкам
+# по мере генерации (0 — ждать ответ целиком)
+LLM_STREAMING = os.getenv("LLM_STREAMING", "1").strip().lower() not in ("0", "false", "no")
+
+# Пакетный режим (python -m src.batch): сколько PR ревьюить одновременно
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+# Режим сервера (python -m src.server): приём вебхуков GitHub
+# по умолчанию — только локальные подключения (за обратным прокси); на внешнем адресе
+# сервер без GITHUB_WEBHOOK_SECRET не стартует
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "2"))
+# предельный размер тела вебхука (GitHub сам ограничивает payload 25 МБ)
+SERVER_MAX_BODY_BYTES = int(os.getenv("SERVER_MAX_BODY_BYTES", str(25 * 1024 * 1024)))
+# секрет вебхука для проверки X-Hub-Signature-256; пусто — подпись не проверяется
+GITHUB_WEBHOOK_SECRET = os.getenv("GITHUB_WEBHOOK_SECRET", "")
+
+# Файл правил ревью (forbiddenPatterns проверяются локально, остальное уходит в промпт)
+RULES_PATH = os.getenv("AI_REVIEW_RULES", ".github/ai-review.json")
+
 def require_var(name: str, value: str | None):
     if not value:
         raise RuntimeError(f"Ожидалась переменная окружения {name}")
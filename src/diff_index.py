@@ -0,0 +1,353 @@
+"""
+Потоковый разбор unified diff в компактный индекс.
+
+Весь дифф хранится одной строкой DiffIndex.text в формате, который видит агент:
+'+++ b/<path>' и строки ханков с префиксами. Индекс строк НОВОЙ версии —
+массивы (array) номеров строк, смещений и длин в этом буфере, а не tuple на строку;
+ханки — объекты со __slots__ и смещениями в том же буфере.
+Разбор однопроходный: строки можно подавать по одной (патчи /files, поток
+.diff, вывод git diff), ничего не склеивая заранее.
+"""
+import re
+from array import array
+from bisect import bisect_right
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+_HUNK_RE = re.compile(r"^@@ -\d+(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+_WS = re.compile(r"\s+")
+
+
+class Hunk:
+    """
+    Один ханк: путь файла и границы текста ханка (с заголовком '@@') в буфере индекса.
+    Окно большого ханка (compaction.split_hunk) — срез строк без заголовка в буфере
+    и свой заголовок header с пересчитанными номерами строк.
+    """
+
+    __slots__ = ("path", "start", "end", "first", "header", "_file")
+
+    def __init__(self, fe: "FileEntry", start: int, first: bool, header: Optional[str] = None):
+        self.path = fe.path
+        self.start = start
+        self.end = start
+        self.first = first  # первый ханк файла: сразу за заголовком '+++ b/<path>'
+        self.header = header
+        self._file = fe
+
+    def window(self, start: int, end: int, header: str) -> "Hunk":
+        """Окно строк buffer[start:end] этого ханка с заголовком header."""
+        w = Hunk(self._file, start, first=False, header=header)
+        w.end = end
+        return w
+
+    @property
+    def header_start(self) -> int:
+        return self._file.header_start
+
+    @property
+    def buffer(self) -> str:
+        return self._file.index.text
+
+    @property
+    def text(self) -> str:
+        body = self._file.index.text[self.start:self.end]
+        return body if self.header is None else f"{self.header}\n{body}"
+
+    @property
+    def body_start(self) -> int:
+        """Смещение первой строки после заголовка '@@'."""
+        if self.header is not None:
+            return self.start
+        nl = self._file.index.text.find("\n", self.start, self.end)
+        return self.end if nl == -1 else nl + 1
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __repr__(self) -> str:
+        return f"Hunk({self.path!r}, {self.start}:{self.end})"
+
+
+class FileEntry:
+    """Строки новой версии одного файла: номера, смещения и длины текста строк в буфере."""
+
+    __slots__ = ("path", "index", "header_start", "numbers", "offsets", "lengths", "added", "hunks",
+                 "_norm_buf", "_norm_starts")
+
+    def __init__(self, index: "DiffIndex", path: str, header_start: int):
+        self.path = path
+        self.index = index
+        self.header_start = header_start
+        self.numbers = array("l")
+        self.offsets = array("q")  # начало текста строки (после префикса '+'/' ')
+        self.lengths = array("l")
+        self.added = bytearray()   # 1 — строка добавлена, 0 — контекст
+        self.hunks: List[Hunk] = []
+        self._norm_buf: Optional[str] = None
+        self._norm_starts: Optional[List[int]] = None
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def line_text(self, i: int) -> str:
+        off = self.offsets[i]
+        return self.index.text[off:off + self.lengths[i]]
+
+    def lines(self) -> Iterator[Tuple[int, str]]:
+        text = self.index.text
+        for n, off, ln in zip(self.numbers, self.offsets, self.lengths):
+            yield n, text[off:off + ln]
+
+    def find(self, line_match: str) -> Optional[int]:
+        """
+        Номер первой строки новой версии, содержащей line_match:
+        сначала точное вхождение (поиск прямо в общем буфере), затем — без пробельных символов.
+        """
+        if not len(self.numbers):
+            return None
+        text = self.index.text
+        if "\n" not in line_match:
+            pos = self.offsets[0]
+            stop = self.offsets[-1] + self.lengths[-1]
+            while True:
+                i = text.find(line_match, pos, stop)
+                if i == -1:
+                    break
+                k = bisect_right(self.offsets, i) - 1
+                # попадание может прийтись на удалённую строку или префикс — пропускаем
+                if k >= 0 and i + len(line_match) <= self.offsets[k] + self.lengths[k]:
+                    return self.numbers[k]
+                pos = i + 1
+        lm_norm = _WS.sub("", line_match)
+        if not lm_norm:
+            return None
+        if self._norm_buf is None:
+            # «сжатый» текст строим лениво — нужен только при неточном совпадении
+            starts: List[int] = []
+            parts: List[str] = []
+            pos = 0
+            for i in range(len(self.numbers)):
+                s = _WS.sub("", self.line_text(i))
+                starts.append(pos)
+                parts.append(s)
+                pos += len(s) + 1
+            self._norm_buf, self._norm_starts = "\n".join(parts), starts
+        i = self._norm_buf.find(lm_norm)
+        return self.numbers[bisect_right(self._norm_starts, i) - 1] if i != -1 else None
+
+
+class DiffIndex:
+    """Индекс диффа: общий буфер text и FileEntry по путям (в порядке появления)."""
+
+    __slots__ = ("text", "files")
+
+    def __init__(self):
+        self.text = ""
+        self.files: Dict[str, FileEntry] = {}
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.files
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.files)
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def items(self) -> Iterator[Tuple[str, List[Tuple[int, str]]]]:
+        """Совместимый вид { path: [(new_line, text), ...] } — строки материализуются по запросу."""
+        for path, fe in self.files.items():
+            yield path, list(fe.lines())
+
+    def added_lines(self) -> Iterator[Tuple[str, int, str]]:
+        """(path, new_line, text) для добавленных строк."""
+        text = self.text
+        for path, fe in self.files.items():
+            for n, off, ln, add in zip(fe.numbers, fe.offsets, fe.lengths, fe.added):
+                if add:
+                    yield path, n, text[off:off + ln]
+
+    def hunks(self) -> Iterator[Hunk]:
+        for fe in self.files.values():
+            yield from fe.hunks
+
+    def find(self, path: str, line_match: str) -> Optional[int]:
+        fe = self.files.get(path)
+        return fe.find(line_match) if fe is not None else None
+
+    @property
+    def line_count(self) -> int:
+        return sum(len(fe) for fe in self.files.values())
+
+
+class DiffIndexBuilder:
+    """
+    Однопроходное построение DiffIndex: start_file(path), затем feed(line) по строкам патча.
+    Конец ханка определяется по счётчикам из заголовка '@@ -a,b +c,d @@'.
+    """
+
+    def __init__(self):
+        self._index = DiffIndex()
+        self._parts: List[str] = []
+        self._pos = 0
+        self._file: Optional[FileEntry] = None
+        self._hunk: Optional[Hunk] = None
+        self._new = 0
+        self._old_left = 0
+        self._new_left = 0
+
+    @property
+    def in_hunk(self) -> bool:
+        return self._hunk is not None
+
+    def _append(self, line: str) -> int:
+        start = self._pos
+        self._parts.append(line)
+        self._parts.append("\n")
+        self._pos += len(line) + 1
+        return start
+
+    def _close_hunk(self) -> None:
+        self._hunk = None
+
+    def start_file(self, path: str) -> None:
+        self._close_hunk()
+        start = self._append(f"+++ b/{path}")
+        self._file = FileEntry(self._index, path, start)
+        self._index.files[path] = self._file
+
+    def feed(self, line: str) -> None:
+        fe = self._file
+        if fe is None:
+            return
+        if line.startswith("@@"):
+            self._close_hunk()
+            m = _HUNK_RE.match(line)
+            if not m:
+                return
+            start = self._append(line)
+            self._hunk = Hunk(fe, start, first=not fe.hunks)
+            self._hunk.end = start + len(line)
+            fe.hunks.append(self._hunk)
+            self._old_left = int(m.group(1)) if m.group(1) is not None else 1
+            self._new = int(m.group(2))
+            self._new_left = int(m.group(3)) if m.group(3) is not None else 1
+            return
+        hunk = self._hunk
+        if hunk is None:
+            return
+        start = self._append(line)
+        hunk.end = start + len(line)
+        prefix = line[:1]
+        if prefix == "+" or prefix == " ":
+            fe.numbers.append(self._new)
+            fe.offsets.append(start + 1)
+            fe.lengths.append(len(line) - 1)
+            fe.added.append(1 if prefix == "+" else 0)
+            self._new += 1
+            self._new_left -= 1
+            if prefix == " ":
+                self._old_left -= 1
+        elif prefix == "-":
+            # удалённая строка — номер новой версии не увеличиваем
+            self._old_left -= 1
+        if self._old_left <= 0 and self._new_left <= 0:
+            self._close_hunk()
+
+    def finish(self) -> DiffIndex:
+        self._close_hunk()
+        self._index.text = "".join(self._parts)
+        self._parts = []
+        return self._index
+
+
+def index_from_files(files: Iterable[dict]) -> DiffIndex:
+    """Индекс по элементам /pulls/{n}/files (поле patch)."""
+    b = DiffIndexBuilder()
+    for f in files:
+        path = f.get("filename")
+        patch = f.get("patch")
+        if not path or not patch:
+            continue
+        b.start_file(path)
+        for ln in patch.splitlines():
+            b.feed(ln)
+    return b.finish()
+
+
+def parse_unified(lines: Iterable[str], include: Optional[Callable[[str], bool]] = None) -> DiffIndex:
+    """
+    Потоковый разбор полного unified diff (git diff / application/vnd.github.diff).
+    Строки читаются по одной; файлы, не прошедшие include(path), и удалённые файлы пропускаются.
+    """
+    b = DiffIndexBuilder()
+    in_file = False
+    for raw in lines:
+        line = raw.rstrip("\r\n")
+        if b.in_hunk:
+            b.feed(line)
+            continue
+        if line.startswith("@@"):
+            if in_file:
+                b.feed(line)
+        elif line.startswith("diff --git "):
+            in_file = False
+        elif line.startswith("+++ "):
+            path = line[4:].split("\t", 1)[0].strip()
+            if len(path) > 1 and path[0] == '"' and path[-1] == '"':
+                path = path[1:-1]
+            if path == "/dev/null":
+                in_file = False
+                continue
+            if path.startswith("b/"):
+                path = path[2:]
+            in_file = include is None or include(path)
+            if in_file:
+                b.start_file(path)
+    return b.finish()
+
+
+def render_hunks(hunks: List[Hunk]) -> str:
+    """
+    Текст шарда для агента: '+++ b/<path>' перед ханками каждого файла.
+    Подряд идущие куски буфера берутся одним срезом, без пересборки по строкам.
+    """
+    if not hunks:
+        return ""
+    buf = hunks[0].buffer
+    parts: List[str] = []
+    run_start = run_end = -1
+    last_path = None
+
+    def flush():
+        if run_start >= 0:
+            parts.append(buf[run_start:run_end])
+            parts.append("\n")
+
+    for h in hunks:
+        start = h.start
+        if h.header is not None:
+            # окно большого ханка: своего заголовка '@@' в буфере нет
+            flush()
+            run_start = -1
+            if h.path != last_path:
+                parts.append(f"+++ b/{h.path}\n")
+                last_path = h.path
+            parts.append(h.text)
+            parts.append("\n")
+            continue
+        if h.path != last_path:
+            if h.first:
+                start = h.header_start  # заголовок файла уже лежит в буфере перед ханком
+            else:
+                flush()
+                run_start = -1
+                parts.append(f"+++ b/{h.path}\n")
+            last_path = h.path
+        if run_start >= 0 and start == run_end + 1:
+            run_end = h.end
+        else:
+            flush()
+            run_start, run_end = start, h.end
+    flush()
+    return "".join(parts)
@@ -0,0 +1,92 @@
+"""
+Дифф PR из локального клона целевого репозитория (REVIEW_DIFF_SOURCE=git).
+
+В Actions репозиторий с PR уже выкачан (actions/checkout) — вместо постраничного
+/pulls/{n}/files (и его обрезанных патчей) дифф считается одной командой git
+между merge-base и head PR, как его показывает GitHub, и читается потоком
+прямо в parse_unified. Из API нужны только метаданные PR (base/head sha).
+
+Клон обычно неглубокий (fetch-depth: 2): недостающие коммиты и история до
+merge-base догружаются git fetch --deepen. Если git недоступен или коммиты
+получить не удалось — GitDiffError, вызывающий возвращается к API.
+"""
+import subprocess
+from typing import Iterable, Iterator, List, Optional
+
+# сколько раз углублять историю в поисках merge-base (глубина удваивается, начиная с 50)
+MAX_DEEPEN_STEPS = 6
+
+
+class GitDiffError(RuntimeError):
+    pass
+
+
+def _git(repo_dir: str, *args: str, check: bool = True) -> subprocess.CompletedProcess:
+    try:
+        proc = subprocess.run(["git", "-C", repo_dir, *args], capture_output=True, text=True)
+    except OSError as e:
+        raise GitDiffError(f"git unavailable: {e}") from e
+    if check and proc.returncode != 0:
+        raise GitDiffError(f"git {args[0]} failed: {proc.stderr.strip()[:500]}")
+    return proc
+
+
+def _has_commit(repo_dir: str, sha: str) -> bool:
+    return _git(repo_dir, "cat-file", "-e", f"{sha}^{{commit}}", check=False).returncode == 0
+
+
+def _fetch(repo_dir: str, *args: str) -> None:
+    print(f"[git] fetch {' '.join(args)}")
+    _git(repo_dir, "fetch", "--no-tags", "--quiet", "origin", *args)
+
+
+def merge_base(repo_dir: str, base_sha: str, head_sha: str) -> str:
+    """merge-base коммитов PR; недостающие коммиты и историю догружаем из origin."""
+    missing = [sha for sha in (base_sha, head_sha) if not _has_commit(repo_dir, sha)]
+    if missing:
+        _fetch(repo_dir, "--depth=50", *missing)
+    depth = 50
+    for _ in range(MAX_DEEPEN_STEPS):
+        proc = _git(repo_dir, "merge-base", base_sha, head_sha, check=False)
+        if proc.returncode == 0 and proc.stdout.strip():
+            return proc.stdout.strip()
+        _fetch(repo_dir, f"--deepen={depth}", base_sha, head_sha)
+        depth *= 2
+    raise GitDiffError(f"no merge-base for {base_sha[:12]}..{head_sha[:12]} in {repo_dir}")
+
+
+def _pathspec(prefix: str) -> str:
+    p = prefix.strip()
+    while p.startswith("./"):
+        p = p[2:]
+    return p.lstrip("/")
+
+
+def stream_git_diff(
+    repo_dir: str,
+    base_sha: str,
+    head_sha: str,
+    prefixes: Optional[Iterable[str]] = None,
+) -> Iterator[str]:
+    """
+    Unified diff PR (merge-base..head) построчно, в том же виде, что .diff от GitHub.
+    prefixes — каталоги для pathspec: остальные файлы git даже не сравнивает.
+    """
+    base = merge_base(repo_dir, base_sha, head_sha)
+    cmd: List[str] = [
+        "git", "-C", repo_dir, "-c", "core.quotepath=off",
+        "diff", "--no-color", "--no-ext-diff", "--no-textconv", "--find-renames", "-U3",
+        "--src-prefix=a/", "--dst-prefix=b/", base, head_sha, "--",
+    ]
+    cmd += [f":(top){spec}" for spec in map(_pathspec, prefixes or ()) if spec]
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        raise GitDiffError(f"git unavailable: {e}") from e
+    with proc:
+        # читаем байты и режем только по '\n' — '\r' в CRLF-файлах не должен резать строки
+        for raw in proc.stdout:
+            yield raw.decode("utf-8", errors="replace").rstrip("\n")
+        err = proc.stderr.read().decode("utf-8", errors="replace")
+        if proc.wait() != 0:
+            raise GitDiffError(f"git diff failed: {err.strip()[:500]}")
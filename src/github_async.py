@@ -0,0 +1,81 @@
+"""
+Асинхронный вариант чтения PR: метаданные и список файлов запрашиваются
+одновременно, страницы /files — параллельно, как только первая страница
+сообщила их число (Link: rel="last").
+Запросы выполняются в потоках поверх общей сессии github_http, поэтому пул
+соединений, ретраи, бюджет запросов и ETag-кэш те же, что у синхронного клиента.
+"""
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+from . import github_client as gh
+
+PER_PAGE = 100
+# /pulls/{n}/files отдаёт не больше 3000 файлов
+MAX_FILES_PAGES = 30
+
+
+async def _aget(url: str, params: Optional[Dict[str, Any]] = None) -> requests.Response:
+    r = await asyncio.to_thread(gh._request, "GET", url, params=params)
+    r.raise_for_status()
+    return r
+
+
+def _last_page(r: requests.Response) -> Optional[int]:
+    last = (r.links or {}).get("last", {}).get("url")
+    if not last:
+        return None
+    pages = parse_qs(urlparse(last).query).get("page")
+    return int(pages[0]) if pages and pages[0].isdigit() else None
+
+
+async def aget_pr_info(pr_number: int) -> Dict[str, Any]:
+    repo = gh.resolve_repo()
+    r = await _aget(f"{gh.API_URL}/repos/{repo}/pulls/{pr_number}")
+    return r.json()
+
+
+async def aget_pr_files(pr_number: int) -> List[Dict[str, Any]]:
+    repo = gh.resolve_repo()
+    url = f"{gh.API_URL}/repos/{repo}/pulls/{pr_number}/files"
+
+    def page_params(page: int) -> Dict[str, Any]:
+        return {"page": page, "per_page": PER_PAGE}
+
+    first = await _aget(url, page_params(1))
+    out: List[Dict[str, Any]] = list(first.json())
+    if len(out) < PER_PAGE:
+        return out
+
+    last = _last_page(first)
+    if last is None:
+        # нет Link-заголовка — листаем последовательно до неполной страницы
+        page = 2
+        while page <= MAX_FILES_PAGES:
+            items = (await _aget(url, page_params(page))).json()
+            out.extend(items)
+            if len(items) < PER_PAGE:
+                break
+            page += 1
+        return out
+
+    rest = await asyncio.gather(
+        *(_aget(url, page_params(p)) for p in range(2, min(last, MAX_FILES_PAGES) + 1))
+    )
+    for r in rest:
+        out.extend(r.json())
+    return out
+
+
+async def afetch_pr(pr_number: int) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Метаданные PR и список файлов одновременно."""
+    pr, files = await asyncio.gather(aget_pr_info(pr_number), aget_pr_files(pr_number))
+    return pr, files
+
+
+def fetch_pr(pr_number: int) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Синхронная обёртка для точек входа."""
+    return asyncio.run(afetch_pr(pr_number))
@@ -1,9 +1,13 @@
 import os
+import threading
+from collections import OrderedDict
+
 import requests
-from typing import List, Dict, Any, Optional
-from .config import GITHUB_TOKEN, GITHUB_REPO
+from typing import List, Dict, Any, Iterator, Optional
+from .config import GITHUB_API_URL, GITHUB_TOKEN, GITHUB_REPO, REVIEW_BATCH_SIZE
+from .github_http import get_session
 
-API_URL = "https://api.github.com"
+API_URL = GITHUB_API_URL
 
 
 def _auth_headers(extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
@@ -13,6 +17,11 @@ def _auth_headers(extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
     return h
 
 
+def _request(method: str, url: str, **kwargs) -> requests.Response:
+    # все вызовы идут через общую сессию: пул, ретраи, rate limit, ETag
+    return get_session().request(method, url, headers=_auth_headers(kwargs.pop("headers", None)), **kwargs)
+
+
 def resolve_repo() -> str:
     repo = GITHUB_REPO or os.getenv("GITHUB_REPOSITORY")
     if not repo:
@@ -23,7 +32,7 @@ def resolve_repo() -> str:
 def get_pr_info(pr_number: int) -> Dict[str, Any]:
     repo = resolve_repo()
     url = f"{API_URL}/repos/{repo}/pulls/{pr_number}"
-    r = requests.get(url, headers=_auth_headers())
+    r = _request("GET", url)
     r.raise_for_status()
     return r.json()
 
@@ -34,7 +43,7 @@ def get_pr_files(pr_number: int) -> List[Dict[str, Any]]:
     page = 1
     while True:
         url = f"{API_URL}/repos/{repo}/pulls/{pr_number}/files?page={page}&per_page=100"
-        r = requests.get(url, headers=_auth_headers())
+        r = _request("GET", url)
         r.raise_for_status()
         items = r.json()
         out.extend(items)
@@ -44,28 +53,109 @@ def get_pr_files(pr_number: int) -> List[Dict[str, Any]]:
     return out
 
 
-def post_inline_comments(pr_number: int, comments: List[Dict[str, Any]], commit_id: str) -> int:
+def stream_pr_diff(pr_number: int, chunk_size: int = 64 * 1024) -> Iterator[str]:
+    """
+    Полный unified diff PR (application/vnd.github.diff) построчно.
+    Тело читается потоком кусками chunk_size и не держится в памяти целиком;
+    режем только по '\n', чтобы '\r' внутри строк (CRLF-файлы) не ломал счётчики ханков.
+    Байты декодируются как UTF-8 сами: для text/plain без charset requests угадал бы ISO-8859-1.
+    """
+    repo = resolve_repo()
+    url = f"{API_URL}/repos/{repo}/pulls/{int(pr_number)}"
+    r = _request("GET", url, headers={"Accept": "application/vnd.github.diff"}, stream=True)
+    with r:
+        r.raise_for_status()
+        tail = b""
+        for chunk in r.iter_content(chunk_size=chunk_size):
+            if not chunk:
+                continue
+            # b"\n" не встречается внутри многобайтных символов UTF-8 — резать байты по нему безопасно
+            lines = (tail + chunk).split(b"\n")
+            tail = lines.pop()
+            for raw in lines:
+                yield raw.decode("utf-8", errors="replace")
+        if tail:
+            yield tail.decode("utf-8", errors="replace")
+
+
+def _comment_payload(c: Dict[str, Any]) -> Dict[str, Any]:
+    return {"path": c["path"], "line": int(c["line"]), "side": "RIGHT", "body": c["body"]}
+
+
+def _error_text(r: requests.Response) -> str:
+    try:
+        data = r.json()
+        errs = data.get("errors")
+        return f"{data.get('message', '')} {errs}" if errs else str(data.get("message", ""))
+    except ValueError:
+        return r.text[:200]
+
+
+def post_review_batch(
+    pr_number: int,
+    comments: List[Dict[str, Any]],
+    commit_id: str,
+    chunk_size: int = REVIEW_BATCH_SIZE,
+) -> Dict[str, Any]:
     """
-    Публикуем inline-комменты по одному.
+    Публикуем inline-комменты пачками: один review (POST /pulls/{n}/reviews)
+    на chunk_size комментариев.
+    GitHub отклоняет review целиком (422), если хотя бы одна позиция невалидна, —
+    тогда только этот чанк публикуем поштучно, чтобы отсеять отвергнутые позиции.
     Ожидается: [{"path": str, "line": int, "body": str}, ...]
+    Возвращаем: {"posted": int, "failed": [{"comment", "status", "error"}, ...]}
     """
     repo = resolve_repo()
-    url = f"{API_URL}/repos/{repo}/pulls/{pr_number}/comments"
+    reviews_url = f"{API_URL}/repos/{repo}/pulls/{pr_number}/reviews"
+    comments_url = f"{API_URL}/repos/{repo}/pulls/{pr_number}/comments"
     posted = 0
+    failed: List[Dict[str, Any]] = []
+
+    valid: List[Dict[str, Any]] = []
     for c in comments:
-        if not all(k in c for k in ("path", "line", "body")):
-            continue
+        if all(k in c for k in ("path", "line", "body")):
+            valid.append(c)
+        else:
+            failed.append({"comment": c, "status": None, "error": "missing path/line/body"})
+
+    for i in range(0, len(valid), max(1, chunk_size)):
+        chunk = valid[i:i + max(1, chunk_size)]
         payload = {
-            "body": c["body"],
             "commit_id": commit_id,
-            "path": c["path"],
-            "line": int(c["line"]),
-            "side": "RIGHT"
+            "event": "COMMENT",
+            "body": f"AI review: замечаний — {len(chunk)}",
+            "comments": [_comment_payload(c) for c in chunk],
         }
-        r = requests.post(url, headers=_auth_headers(), json=payload)
+        r = _request("POST", reviews_url, json=payload)
         if r.status_code in (200, 201):
-            posted += 1
-    return posted
+            posted += len(chunk)
+            continue
+        if r.status_code != 422:
+            failed.extend({"comment": c, "status": r.status_code, "error": _error_text(r)} for c in chunk)
+            continue
+
+        # 422: в чанке есть невалидная позиция — откатываемся на поштучную публикацию
+        for c in chunk:
+            payload = {"commit_id": commit_id, **_comment_payload(c)}
+            r1 = _request("POST", comments_url, json=payload)
+            if r1.status_code in (200, 201):
+                posted += 1
+            else:
+                failed.append({"comment": c, "status": r1.status_code, "error": _error_text(r1)})
+
+    return {"posted": posted, "failed": failed}
+
+
+def post_inline_comments(pr_number: int, comments: List[Dict[str, Any]], commit_id: str) -> int:
+    """
+    Публикуем inline-комменты батчами (см. post_review_batch).
+    Ожидается: [{"path": str, "line": int, "body": str}, ...]
+    """
+    result = post_review_batch(pr_number, comments, commit_id)
+    for f in result["failed"]:
+        c = f["comment"]
+        print(f"[github_client] comment failed {c.get('path')}:{c.get('line')} status={f['status']} {f['error']}")
+    return result["posted"]
 
 
 def post_review_comment_reply(pr_number: int, comment_id: int, body: str):
@@ -77,7 +167,7 @@ def post_review_comment_reply(pr_number: int, comment_id: int, body: str):
     repo = resolve_repo()
     url = f"{API_URL}/repos/{repo}/pulls/{pr_number}/comments"
     payload = {"body": body, "in_reply_to": int(comment_id)}
-    r = requests.post(url, headers=_auth_headers(), json=payload)
+    r = _request("POST", url, json=payload)
     r.raise_for_status()
     return r.json()
 
@@ -86,36 +176,149 @@ def get_review_comment(comment_id: int):
     """GET /repos/{owner}/{repo}/pulls/comments/{comment_id}"""
     repo = resolve_repo()
     url = f"{API_URL}/repos/{repo}/pulls/comments/{int(comment_id)}"
-    r = requests.get(url, headers=_auth_headers())
+    r = _request("GET", url)
     r.raise_for_status()
     return r.json()
 
 
-def list_pull_review_comments(pr_number: int, per_page: int = 100):
-    """GET /repos/{owner}/{repo}/pulls/{pull_number}/comments"""
+def _paginate(url: str, params: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """Все элементы списка по ссылкам Link: rel="next"."""
+    while url:
+        r = _request("GET", url, params=params)
+        r.raise_for_status()
+        yield from r.json()
+        url = (r.links or {}).get("next", {}).get("url")
+        params = None  # ссылка next уже содержит все параметры запроса
+
+
+def list_pull_review_comments(pr_number: int, since: Optional[str] = None, per_page: int = 100):
+    """
+    GET /repos/{owner}/{repo}/pulls/{pull_number}/comments — все страницы.
+    since (ISO 8601) — только комментарии, обновлённые начиная с этого момента.
+    """
     repo = resolve_repo()
     url = f"{API_URL}/repos/{repo}/pulls/{int(pr_number)}/comments"
-    r = requests.get(url, headers=_auth_headers(), params={"per_page": per_page})
-    r.raise_for_status()
-    return r.json()
+    params: Dict[str, Any] = {"per_page": per_page, "sort": "created", "direction": "asc"}
+    if since:
+        params["since"] = since
+    return list(_paginate(url, params))
+
+
+def list_open_prs(updated_since: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Открытые PR, сначала недавно обновлённые; updated_since (ISO 8601) — только обновлённые
+    начиная с этого момента (листание прекращается на первом более старом PR).
+    """
+    repo = resolve_repo()
+    url = f"{API_URL}/repos/{repo}/pulls"
+    params = {"state": "open", "sort": "updated", "direction": "desc", "per_page": 100}
+    for pr in _paginate(url, params):
+        if updated_since and (pr.get("updated_at") or "") < updated_since:
+            return
+        yield pr
+
 
+class ReviewCommentCache:
+    """
+    Review-комментарии PR, которые уже видел процесс (LRU по PR).
+    Для каждого PR помним covered_since — с какого момента кэш полон — и watermark —
+    самый поздний updated_at; повторное упоминание дочитывает только новое (since=watermark).
+    """
+
+    def __init__(self, max_prs: int = 64):
+        self.max_prs = max_prs
+        self._prs: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, pr_number: int) -> Dict[str, Any]:
+        with self._lock:
+            e = self._prs.get(pr_number)
+            if e is None:
+                e = self._prs[pr_number] = {
+                    "comments": {}, "covered_since": None, "watermark": None, "lock": threading.Lock(),
+                }
+            self._prs.move_to_end(pr_number)
+            while len(self._prs) > self.max_prs:
+                self._prs.popitem(last=False)
+            return e
+
+    @staticmethod
+    def _add(e: Dict[str, Any], items: List[Dict[str, Any]]) -> None:
+        for c in items:
+            if c.get("id") is None:
+                continue
+            e["comments"][c["id"]] = c
+            ts = c.get("updated_at") or c.get("created_at")
+            if ts and (e["watermark"] is None or ts > e["watermark"]):
+                e["watermark"] = ts
+
+    def comments_since(self, pr_number: int, since: str, known: Optional[List[Dict[str, Any]]] = None):
+        """
+        Все комментарии PR, обновлённые начиная с since (ISO 8601):
+        первый раз — запрос since=since, дальше — только дочитывание с watermark.
+        """
+        e = self._entry(pr_number)
+        with e["lock"]:
+            if e["covered_since"] is None or since < e["covered_since"]:
+                fresh = list_pull_review_comments(pr_number, since=since)
+                e["covered_since"] = since
+            else:
+                fresh = list_pull_review_comments(pr_number, since=e["watermark"] or since)
+            # payload события — до свежих данных API, чтобы не перетереть их устаревшей копией
+            self._add(e, known or [])
+            self._add(e, fresh)
+            return list(e["comments"].values())
+
+    def get(self, pr_number: int, comment_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            e = self._prs.get(pr_number)
+            return e["comments"].get(comment_id) if e else None
 
-def get_review_thread(pr_number: int, comment_id: int):
+
+_comment_cache = ReviewCommentCache()
+
+
+def _get_thread_root(comment_id: int) -> Optional[Dict[str, Any]]:
+    """Корень треда; None — комментарий удалён (404)."""
+    try:
+        return get_review_comment(comment_id)
+    except requests.HTTPError as e:
+        if e.response is not None and e.response.status_code == 404:
+            return None
+        raise
+
+
+def get_review_thread(pr_number: int, comment_id: int, comment: Optional[Dict[str, Any]] = None):
     """
-    Вернём весь тред для review-комментария:
-    - узнаём root_id (in_reply_to_id или сам id),
-    - берём все комменты PR и фильтруем по root_id,
-    - сортируем по created_at по возрастанию.
+    Вернём весь тред для review-комментария, сортировка по created_at по возрастанию.
+    comment — комментарий из payload события (если есть — не запрашиваем его отдельно).
+
+    Стоимость зависит от треда, а не от PR: все ответы создаются после корня треда,
+    поэтому читаем только комментарии, обновлённые начиная с created_at корня
+    (since + пагинация), а повторные упоминания в PR дочитывают лишь новое (кэш с watermark).
     """
     try:
-        c = get_review_comment(int(comment_id))
+        c = comment if comment and comment.get("id") == comment_id else get_review_comment(int(comment_id))
         root_id = c.get("in_reply_to_id") or c.get("id")
-        comments = list_pull_review_comments(int(pr_number))
+        root = c if root_id == c.get("id") else (
+            _comment_cache.get(int(pr_number), root_id) or _get_thread_root(root_id)
+        )
+        if root is None:
+            # корень треда удалён, ответы по-прежнему ссылаются на него: тред — это они,
+            # а начинается он с самого раннего из оставшихся
+            print(f"[github_client] thread root {root_id} is deleted, using remaining replies")
+        since = root.get("created_at") if root else None
+        if not since:
+            comments = list_pull_review_comments(int(pr_number))
+        else:
+            comments = _comment_cache.comments_since(int(pr_number), since, known=[root, c])
         thread = [
             x for x in comments
             if (x.get("id") == root_id) or (x.get("in_reply_to_id") == root_id)
         ]
-        thread.sort(key=lambda x: x.get("created_at", ""))
+        if not any(x.get("id") == c.get("id") for x in thread):
+            thread.append(c)  # список комментариев может отставать от события
+        thread.sort(key=lambda x: (x.get("created_at", ""), x.get("id", 0)))
         return thread
     except Exception as e:
         print(f"[github_client] get_review_thread failed: {e}")
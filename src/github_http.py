@@ -0,0 +1,244 @@
+"""
+Общий HTTP-слой для GitHub API.
+
+- один requests.Session на процесс: keep-alive и пул соединений;
+- ретраи с экспоненциальной задержкой и джиттером на 403 (rate limit) / 429 / 5xx,
+  с учётом Retry-After и X-RateLimit-Reset;
+- token bucket — общий бюджет запросов для всех потоков процесса;
+- ETag/Last-Modified кэш для GET: повторное чтение отдаёт дешёвый 304
+  (304 не расходует лимит GitHub API).
+
+Каждый вызов попадает в metrics (группа "github"): время, байты ответа, ретраи.
+"""
+import random
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+
+from .config import (
+    GITHUB_HTTP_POOL_SIZE,
+    GITHUB_HTTP_RETRIES,
+    GITHUB_HTTP_TIMEOUT,
+    GITHUB_RATE_PER_SEC,
+    GITHUB_RATE_BURST,
+    GITHUB_MAX_RATE_WAIT,
+    GITHUB_ETAG_CACHE_SIZE,
+)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Бюджет запросов: rate токенов в секунду, не больше capacity про запас."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._ts = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause_until(self, monotonic_ts: float) -> None:
+        """Останавливаем всех вызывающих до момента ts (например, до сброса rate limit)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, monotonic_ts)
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._ts) * self.rate)
+                    self._ts = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class GitHubSession:
+    def __init__(
+        self,
+        pool_size: int = GITHUB_HTTP_POOL_SIZE,
+        retries: int = GITHUB_HTTP_RETRIES,
+        timeout: float = GITHUB_HTTP_TIMEOUT,
+        bucket: Optional[TokenBucket] = None,
+        etag_cache_size: int = GITHUB_ETAG_CACHE_SIZE,
+    ):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.retries = retries
+        self.timeout = timeout
+        self.bucket = bucket or TokenBucket(GITHUB_RATE_PER_SEC, GITHUB_RATE_BURST)
+        self._etag_cache_size = etag_cache_size
+        self._etags: "OrderedDict[Tuple, Tuple[Optional[str], Optional[str], requests.Response]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "not_modified": 0}
+
+    # --- ETag кэш -------------------------------------------------------------
+
+    @staticmethod
+    def _cache_key(url: str, headers: Dict[str, str], params: Optional[Dict[str, Any]]) -> Tuple:
+        items = tuple(sorted((params or {}).items()))
+        return url, items, headers.get("Accept", ""), headers.get("Authorization", "")
+
+    def _cached(self, key: Tuple):
+        with self._lock:
+            entry = self._etags.get(key)
+            if entry is not None:
+                self._etags.move_to_end(key)
+            return entry
+
+    def _remember(self, key: Tuple, r: requests.Response) -> None:
+        etag = r.headers.get("ETag")
+        modified = r.headers.get("Last-Modified")
+        if not (etag or modified) or self._etag_cache_size <= 0:
+            return
+        with self._lock:
+            self._etags[key] = (etag, modified, r)
+            self._etags.move_to_end(key)
+            while len(self._etags) > self._etag_cache_size:
+                self._etags.popitem(last=False)
+
+    # --- rate limit / backoff ---------------------------------------------------
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats[name] += 1
+
+    @staticmethod
+    def _is_rate_limited(r: requests.Response) -> bool:
+        # запрос отклонён до обработки — повтор безопасен даже для POST
+        if r.status_code == 429:
+            return True
+        if r.status_code != 403:
+            return False
+        return (
+            r.headers.get("X-RateLimit-Remaining") == "0"
+            or "Retry-After" in r.headers
+            or "rate limit" in (r.text or "").lower()
+        )
+
+    def _observe(self, r: requests.Response) -> None:
+        # лимит исчерпан — притормаживаем все потоки до X-RateLimit-Reset
+        if r.headers.get("X-RateLimit-Remaining") == "0":
+            reset = r.headers.get("X-RateLimit-Reset")
+            if reset and reset.isdigit():
+                wait = min(max(0.0, int(reset) - time.time()), GITHUB_MAX_RATE_WAIT)
+                self.bucket.pause_until(time.monotonic() + wait)
+
+    @staticmethod
+    def _delay(r: Optional[requests.Response], attempt: int) -> float:
+        if r is not None:
+            retry_after = r.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return min(float(retry_after), GITHUB_MAX_RATE_WAIT)
+            reset = r.headers.get("X-RateLimit-Reset")
+            if r.headers.get("X-RateLimit-Remaining") == "0" and reset and reset.isdigit():
+                return min(max(1.0, int(reset) - time.time()), GITHUB_MAX_RATE_WAIT)
+        # full jitter: случайная пауза в [0, base * 2^attempt]
+        return random.uniform(0, min(30.0, 0.5 * (2 ** attempt)))
+
+    # --- запрос ------------------------------------------------------------------
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        *,
+        headers: Optional[Dict[str, str]] = None,
+        params: Optional[Dict[str, Any]] = None,
+        json: Any = None,
+        stream: bool = False,
+    ) -> requests.Response:
+        method = method.upper()
+        t0 = time.perf_counter()
+        try:
+            r, retries, not_modified = self._send(method, url, headers=headers, params=params, json=json, stream=stream)
+        except Exception:
+            metrics.current().observe("github", metrics.api_route(method, url), time.perf_counter() - t0, errors=1)
+            raise
+        # у потокового ответа тело ещё не прочитано — берём Content-Length, если есть
+        size = r.headers.get("Content-Length", "")
+        nbytes = int(size) if size.isdigit() else (0 if stream else len(r.content or b""))
+        metrics.current().observe(
+            "github", metrics.api_route(method, url), time.perf_counter() - t0,
+            bytes=nbytes, retries=retries, not_modified=int(not_modified), errors=int(r.status_code >= 400),
+        )
+        return r
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        *,
+        headers: Optional[Dict[str, str]],
+        params: Optional[Dict[str, Any]],
+        json: Any,
+        stream: bool,
+    ) -> Tuple[requests.Response, int, bool]:
+        """Запрос с ретраями; (ответ, число повторов, ответ взят из ETag-кэша)."""
+        headers = dict(headers or {})
+        idempotent = method in ("GET", "HEAD", "PUT", "DELETE")
+        cache_key = self._cache_key(url, headers, params) if method == "GET" and not stream else None
+        cached = self._cached(cache_key) if cache_key else None
+        if cached:
+            etag, modified, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if modified:
+                headers["If-Modified-Since"] = modified
+
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            self._count("requests")
+            try:
+                r = self.session.request(
+                    method, url, headers=headers, params=params, json=json,
+                    stream=stream, timeout=self.timeout,
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if not idempotent or attempt >= self.retries:
+                    raise
+                self._count("retries")
+                time.sleep(self._delay(None, attempt))
+                continue
+
+            self._observe(r)
+            if r.status_code == 304 and cached:
+                self._count("not_modified")
+                return cached[2], attempt, True
+
+            retryable = self._is_rate_limited(r) or (idempotent and r.status_code in RETRY_STATUSES)
+            if retryable and attempt < self.retries:
+                self._count("retries")
+                r.close()
+                print(f"[github_http] {method} {url} -> {r.status_code}, retry {attempt + 1}/{self.retries}")
+                time.sleep(self._delay(r, attempt))
+                continue
+
+            if cache_key and r.status_code == 200:
+                self._remember(cache_key, r)
+            return r, attempt, False
+        raise RuntimeError(f"{method} {url}: retries exhausted")
+
+
+@lru_cache(maxsize=None)
+def get_session() -> GitHubSession:
+    """Общая сессия процесса (пул соединений, бюджет и ETag-кэш делятся между вызовами)."""
+    return GitHubSession()
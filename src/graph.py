@@ -1,11 +1,19 @@
-from typing import TypedDict, List, Dict, Any
+from functools import lru_cache
+from typing import TypedDict, List, Dict, Any, Callable
 from typing import Annotated
 import operator
+import time
 
-from langgraph.graph import StateGraph, END
-
-from .agents.codestyle_agent import run_codestyle_agent
-from .utils import resolve_positions
+from .agents.codestyle_agent import review_diff, diff_token_budget
+from .llm import LLMUnavailable
+from .review_cache import get_review_cache, split_by_hunk
+from .routing import TIER_FAST, TIER_STRONG, latency_target, route_shard, stronger_models, tier_model
+from .rules import get_pattern_engine
+from .config import REVIEW_CONTEXT_LINES
+from . import metrics
+from .compaction import compact_shard
+from .diff_index import DiffIndex, Hunk
+from .utils import LineMatchIndex, resolve_position, merge_comments
 from .github_client import post_inline_comments
 
 
@@ -13,62 +21,239 @@ class ReviewState(TypedDict, total=False):
     # входные данные
     pr_number: int
     head_sha: str
-    diff_text: str
-    diff_index: Dict[str, List]
+    shard: List[Hunk]  # ханки одного шарда (вход ветки CodeStyle)
+    shards: List[List[Hunk]]
+    diff_index: DiffIndex
+    # True — ревью устарело (например, в PR пришёл новый push), результат не нужен
+    should_stop: Callable[[], bool]
     # коллекция сырых комментариев от агентов (накапливаем из параллельных веток)
     raw_comments: Annotated[List[Dict[str, Any]], operator.add]
+    # те же комментарии, уже привязанные к строкам — ветка привязывает каждый,
+    # как только он пришёл из потока LLM (очередь на публикацию)
+    resolved_comments: Annotated[List[Dict[str, Any]], operator.add]
+    # находки локальных правил (forbiddenPatterns) — уже с точными номерами строк
+    rule_comments: Annotated[List[Dict[str, Any]], operator.add]
+    # статистика компактизации промптов по шардам (токены до/после)
+    prompt_stats: Annotated[List[Dict[str, Any]], operator.add]
     # выход/флаги
     final_comments: List[Dict[str, Any]]
-    codestyle_done: bool
     posted: bool
 
 
+def _stopped(state: ReviewState) -> bool:
+    fn = state.get("should_stop")
+    return bool(fn and fn())
+
+
 def start_node(state: ReviewState) -> Dict[str, Any]:
     # Ничего не делает — точка ветвления на параллельные узлы
     return {}
 
 
+def fan_out(state: ReviewState) -> List[Any]:
+    # Отдельная ветка CodeStyle на каждый шард + ветка локальных правил.
+    # Результаты сливаются через редьюсеры raw_comments/rule_comments,
+    # параллелизм ограничивается max_concurrency при invoke.
+    from langgraph.types import Send
+
+    shards = state.get("shards") or []
+    print(f"[graph] codestyle shards: {len(shards)}")
+    sends = [
+        Send("CodeStyle", {"shard": sh, "diff_index": state["diff_index"], "should_stop": state.get("should_stop")})
+        for sh in shards
+    ]
+    sends.append(Send("Rules", {"diff_index": state["diff_index"]}))
+    return sends
+
+
+OnItem = Callable[[Dict[str, Any]], None]
+
+
+def _ask_model(text: str, on_item: OnItem, tier: str, model: str):
+    m = metrics.current()
+    m.add(f"route.{tier}")
+    t0 = time.perf_counter()
+    try:
+        items = review_diff(text, on_item=on_item, model=model)
+    except LLMUnavailable as e:
+        # шард без ответа модели не валит ревью: остальные шарды и локальные правила публикуются
+        print(f"[codestyle] shard skipped, {e}")
+        m.add("shards.failed")
+        return None
+    dt = time.perf_counter() - t0
+    if dt > latency_target(tier):
+        print(f"[route] {model} ({tier}) answered in {dt:.1f}s, target {latency_target(tier):.0f}s")
+        m.add(f"llm.over_target.{tier}")
+    return items
+
+
+def _ask_agent(units: List[Hunk], on_item: OnItem, tier: str, model: str):
+    # Компактизация (контекст, ханки без добавлений, бюджет токенов) и вызов агента;
+    # возвращаем (замечания | None, статистика, модель, которая ответила)
+    text, stats = compact_shard(units, REVIEW_CONTEXT_LINES, diff_token_budget())
+    print(f"[codestyle] hunks={stats['hunks']} tokens {stats['tokens_raw']} -> {stats['tokens_sent']}"
+          f" (dropped hunks: {stats['dropped_hunks']}, truncated lines: {stats['truncated_lines']})")
+    if not text:
+        return [], stats, model
+    delivered = [0]
+
+    def counted(it: Dict[str, Any]) -> None:
+        delivered[0] += 1
+        on_item(it)
+
+    items = _ask_model(text, counted, tier, model)
+    if items is None and tier == TIER_FAST and not delivered[0]:
+        # быстрая модель не справилась — повторяем шард на сильной
+        strong = tier_model(TIER_STRONG)
+        print(f"[route] {model} gave no parsable answer, escalating to {strong}")
+        metrics.current().add("route.escalated")
+        return _ask_model(text, on_item, TIER_STRONG, strong), stats, strong
+    return items, stats, model
+
+
+def _review_units(units: List[Hunk], on_item: OnItem) -> List[Dict[str, Any]]:
+    # Модель выбирается по шарду (routing). В LLM уходят только ханки, которых нет в кэше;
+    # ответ раскладываем по ханкам и кэшируем. Все замечания (из кэша и из ответа)
+    # отдаются в on_item по одному; возвращаем статистику промптов
+    tier, model, profile = route_shard(units)
+    if profile:
+        print(f"[route] shard -> {model} ({tier}): added={profile['added']},"
+              f" rule_hits={profile['rule_hits']}, types={','.join(profile['types'])}")
+    cache = get_review_cache()
+    if cache is None:
+        _, stats, _ = _ask_agent(units, on_item, tier, model)
+        return [stats]
+
+    # ответ сильной модели из кэша годится и для шарда, отправленного быстрой
+    key_sets = [[cache.key(u.path, u.text, mdl) for u in units] for mdl in stronger_models(model)]
+    hits = cache.get_many([k for keys in key_sets for k in keys])
+    miss: List[Hunk] = []
+    for i, u in enumerate(units):
+        found = next((hits[keys[i]] for keys in key_sets if keys[i] in hits), None)
+        if found is None:
+            miss.append(u)
+            continue
+        for it in found:
+            on_item(it)
+    print(f"[cache] hunks: {len(units)}, hits: {len(units) - len(miss)}")
+    if not miss:
+        return []
+
+    fresh, stats, answered_by = _ask_agent(miss, on_item, tier, model)
+    if fresh is None:
+        # ответ не разобран — ничего не кэшируем, иначе ханки навсегда станут «чистыми»
+        return [stats]
+    fresh = [it for it in fresh if isinstance(it, dict)]
+    per_unit, orphans = split_by_hunk(fresh, miss)
+    entries = zip(miss, per_unit)
+    if orphans:
+        # ханки, откуда могли прийти непривязанные замечания, не кэшируем: иначе следующий push
+        # получит их из кэша «чистыми» и замечания пропадут насовсем
+        paths = {(it.get("path") or "").strip() for it in orphans}
+        if paths <= {u.path for u in miss}:
+            entries = [(u, found) for u, found in zip(miss, per_unit) if u.path not in paths]
+        else:
+            entries = []
+        skipped = len(miss) - len(entries)
+        print(f"[cache] comments not attributed to a hunk: {len(orphans)}, hunks not cached: {skipped}")
+        metrics.current().add("cache.uncached_hunks", skipped)
+    cache.put_many({cache.key(u.path, u.text, answered_by): found for u, found in entries})
+    return [stats]
+
+
 def codestyle_node(state: ReviewState) -> Dict[str, Any]:
-    items = run_codestyle_agent(state["diff_text"])
+    if _stopped(state):
+        # шарды, ещё не дошедшие до LLM, у отменённого ревью не запрашиваем
+        return {"raw_comments": [], "resolved_comments": [], "prompt_stats": []}
+    index = LineMatchIndex(state["diff_index"])
     tagged: List[Dict[str, Any]] = []
-    for it in items or []:
+    resolved: List[Dict[str, Any]] = []
+
+    def take(it: Dict[str, Any]) -> None:
+        # замечание привязывается к строке сразу, не дожидаясь конца ответа модели
         if not isinstance(it, dict):
-            continue
+            return
         body = (it.get("body") or it.get("message") or "").strip()
         if not body:
-            continue
+            return
         new_it = dict(it)
         new_it["body"] = body
         tagged.append(new_it)
-    return {"raw_comments": tagged, "codestyle_done": True}
+        pos = resolve_position(new_it, index)
+        if pos is not None:
+            resolved.append(pos)
+
+    stats = _review_units(state.get("shard") or [], take)
+    return {"raw_comments": tagged, "resolved_comments": resolved, "prompt_stats": stats}
+
+
+def rules_node(state: ReviewState) -> Dict[str, Any]:
+    # Детерминированный pre-pass по добавленным строкам, без LLM
+    found = get_pattern_engine().scan(state["diff_index"].added_lines())
+    print(f"[rules] local findings: {len(found)}")
+    return {"rule_comments": found}
 
 
 def post_node(state: ReviewState) -> Dict[str, Any]:
-    # Публикуем один раз, когда ветка codestyle завершена
+    # Публикуем один раз, когда завершились все ветки (шарды CodeStyle и Rules)
     if state.get("posted"):
         return {}
-    if not state.get("codestyle_done"):
-        return {}
+    if _stopped(state):
+        print(f"[graph] PR {state['pr_number']}: review superseded, nothing posted")
+        metrics.current().add("review.superseded")
+        return {"final_comments": [], "posted": False}
     raw = state.get("raw_comments", [])
     total = len(raw or [])
-    resolved = resolve_positions(raw, state["diff_index"])
-    final_items = resolved
+    m = metrics.current()
+    stats = state.get("prompt_stats") or []
+    if stats:
+        before = sum(st["tokens_raw"] for st in stats)
+        after = sum(st["tokens_sent"] for st in stats)
+        print(f"[codestyle] prompt diff tokens: {before} -> {after}, saved {before - after}"
+              f" ({(before - after) * 100 // max(1, before)}%)")
+    resolved = state.get("resolved_comments") or []
+    # замечания агента, которые не удалось привязать к строке диффа, теряются — считаем их
+    m.add("comments.agent", total)
+    m.add("comments.unresolved", total - len(resolved))
+    m.add("comments.rules", len(state.get("rule_comments") or []))
+    for st in stats:
+        m.add("prompt.tokens_raw", st["tokens_raw"])
+        m.add("prompt.tokens_sent", st["tokens_sent"])
+        m.add("prompt.truncated_lines", st.get("truncated_lines", 0))
+    final_items = merge_comments((state.get("rule_comments") or []) + resolved)
+    m.add("comments.final", len(final_items))
     if final_items:
-        post_inline_comments(state["pr_number"], final_items, state["head_sha"])
+        m.add("comments.posted", post_inline_comments(state["pr_number"], final_items, state["head_sha"]))
     return {"final_comments": final_items, "posted": True}
 
 
-# Сборка Parallel Graph
-graph = StateGraph(ReviewState)
+@lru_cache(maxsize=None)
+def get_review_graph():
+    """
+    Сборка и компиляция Parallel Graph — при первом запросе, а не при импорте модуля:
+    langgraph нужен только когда есть что ревьюить.
+    """
+    from langgraph.graph import StateGraph, END
+
+    graph = StateGraph(ReviewState)
+
+    # каждый узел обёрнут замером времени (metrics, группа "node")
+    graph.add_node("Start", metrics.instrument_node("Start", start_node))
+    graph.add_node("CodeStyle", metrics.instrument_node("CodeStyle", codestyle_node))
+    graph.add_node("Rules", metrics.instrument_node("Rules", rules_node))
+    graph.add_node("Post", metrics.instrument_node("Post", post_node))
 
-graph.add_node("Start", start_node)
-graph.add_node("CodeStyle", codestyle_node)
-graph.add_node("Post", post_node)
+    graph.set_entry_point("Start")
+    # Start -> (CodeStyle x N шардов || Rules) -> Post; Post стартует после всех веток
+    graph.add_conditional_edges("Start", fan_out, ["CodeStyle", "Rules"])
+    graph.add_edge("CodeStyle", "Post")
+    graph.add_edge("Rules", "Post")
+    graph.add_edge("Post", END)
+    return graph.compile()
 
-graph.set_entry_point("Start")
-# Линейный граф: Start -> CodeStyle -> Post
-graph.add_edge("Start", "CodeStyle")
-graph.add_edge("CodeStyle", "Post")
-graph.add_edge("Post", END)
 
-review_graph = graph.compile()
+def __getattr__(name: str):
+    # совместимость: graph.review_graph по-прежнему доступен, но компилируется лениво
+    if name == "review_graph":
+        return get_review_graph()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,138 @@
+"""
+Потоковый разбор JSON-массива из ответа LLM: объекты массива отдаются по мере того,
+как модель их допечатала, без ожидания всего ответа и без повторных полных разборов.
+
+Терпит те же обёртки, что и utils.parse_json_array: текст до массива, ```json-ограждение,
+хвост после закрывающей ']'. «Массив» из прозы (например, "[см. ниже]" или "[1]")
+пропускается, и поиск продолжается со следующей '['.
+В памяти держится только недописанный элемент, а не весь ответ.
+"""
+import json
+from typing import Any, Dict, List
+
+_SCALAR_CHARS = frozenset("-+.0123456789eEtrufalsn")
+
+
+class JsonArrayStream:
+    def __init__(self):
+        self._buf = ""          # недоразобранный хвост, начиная с незавершённого элемента
+        self._in_array = False
+        self._closed = False
+        self._items = 0         # элементов текущего кандидата-массива
+        self._dicts = 0         # из них объектов
+        # состояние сканирования незавершённого элемента (чтобы не пересматривать его с начала)
+        self._scan = 0
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self.errors = 0         # элементы текущего кандидата, которые не разобрались как JSON
+
+    @property
+    def done(self) -> bool:
+        """Закрывающая ']' массива получена, дальше текст не разбирается."""
+        return self._closed
+
+    @property
+    def complete(self) -> bool:
+        """Массив закрыт и все его элементы разобраны."""
+        return self._closed and not self.errors
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Добавить кусок ответа; вернуть объекты массива, завершённые этим куском."""
+        if self._closed or not chunk:
+            return []
+        buf = self._buf + chunk
+        n = len(buf)
+        out: List[Dict[str, Any]] = []
+        pos = 0
+        while pos < n and not self._closed:
+            if not self._in_array:
+                start = buf.find("[", pos)
+                if start == -1:
+                    pos = n
+                    break
+                self._in_array = True
+                # ошибки считаются по кандидату: проза брошенного "[см. ниже]" не портит настоящий массив
+                self._items = self._dicts = self.errors = 0
+                pos = start + 1
+                continue
+            c = buf[pos]
+            if c in " \t\r\n,":
+                pos += 1
+            elif c == "]":
+                pos += 1
+                if (self._items or self.errors) and not self._dicts:
+                    # "[1]", "[a, b]" и т.п. в тексте перед настоящим массивом
+                    self._in_array = False
+                else:
+                    self._closed = True
+            elif c in '{["':
+                end = self._value_end(buf, pos)
+                if end is None:
+                    break  # элемент ещё не допечатан
+                self._take(buf[pos:end], out)
+                pos = end
+            elif c in _SCALAR_CHARS:
+                end = pos
+                while end < n and buf[end] in _SCALAR_CHARS:
+                    end += 1
+                if end == n:
+                    break  # число/литерал может продолжиться в следующем куске
+                self._take(buf[pos:end], out)
+                pos = end
+            else:
+                # проза после '[' — это был не JSON-массив
+                if self._dicts:
+                    # ...но объекты из него уже отданы: дальше не угадываем
+                    self._closed = True
+                    self.errors += 1
+                self._in_array = False
+                pos += 1
+        self._buf = "" if self._closed else buf[pos:]
+        return out
+
+    def _value_end(self, buf: str, start: int):
+        """Индекс сразу за объектом/массивом/строкой, начатым в start; None — ещё не завершён."""
+        if self._scan == 0:
+            self._depth, self._in_str, self._esc = 0, False, False
+        depth, in_str, esc = self._depth, self._in_str, self._esc
+        i = start + self._scan
+        end = None
+        for i in range(i, len(buf)):
+            c = buf[i]
+            if in_str:
+                if esc:
+                    esc = False
+                elif c == "\\":
+                    esc = True
+                elif c == '"':
+                    in_str = False
+                    if depth == 0:
+                        end = i + 1
+                        break
+            elif c == '"':
+                in_str = True
+            elif c in "{[":
+                depth += 1
+            elif c in "}]":
+                depth -= 1
+                if depth == 0:
+                    end = i + 1
+                    break
+        if end is None:
+            self._scan = len(buf) - start
+            self._depth, self._in_str, self._esc = depth, in_str, esc
+            return None
+        self._scan = 0
+        return end
+
+    def _take(self, text: str, out: List[Dict[str, Any]]) -> None:
+        try:
+            value = json.loads(text)
+        except ValueError:
+            self.errors += 1
+            return
+        self._items += 1
+        if isinstance(value, dict):
+            self._dicts += 1
+            out.append(value)
@@ -0,0 +1,231 @@
+"""
+Клиенты chat-модели и общий бюджет вызовов LLM процесса.
+
+langchain_openai тянет за собой langchain_core, openai, pydantic и др. (секунды на старте),
+поэтому импортируется только при первом запросе клиента: события, которые отсекаются
+фильтром (нет упоминания бота, нечего ревьюить), до него не доходят.
+
+resilient_call() — политика одного вызова: дедлайн попытки (LLM_TIMEOUT_S; для потока —
+до первого куска ответа, дальше LLM_STREAM_IDLE_S без новых данных), повторы
+с экспоненциальной задержкой и опциональный хедж (второй запрос после LLM_HEDGE_AFTER_S
+или p95 накопленных задержек; берём тот, что ответил первым).
+
+Каждая попытка занимает слот общего бюджета процесса (batch, server): не больше
+LLM_MAX_CONCURRENCY одновременно и LLM_RATE_PER_SEC в секунду. Слот освобождается,
+когда поток попытки завершился, а не когда её бросили по дедлайну или из-за хеджа, —
+брошенные попытки тоже считаются. Хедж шлётся, только если есть свободный слот.
+"""
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+from typing import Any, Callable, Deque, Dict, List, Optional, TypeVar
+
+from . import metrics
+from .config import (
+    LLM_HEDGE_AFTER_S,
+    LLM_MAX_CONCURRENCY,
+    LLM_MAX_RETRIES,
+    LLM_RATE_PER_SEC,
+    LLM_RETRY_BACKOFF_S,
+    LLM_STREAM_IDLE_S,
+    LLM_TIMEOUT_S,
+)
+
+T = TypeVar("T")
+
+# ошибки API, которые повтором не исправить (ключ, модель, формат запроса)
+NON_RETRYABLE_STATUS = frozenset({400, 401, 403, 404, 422})
+# p95 для хеджа считаем по последним HEDGE_WINDOW успешным попыткам, начиная с HEDGE_MIN_SAMPLES
+HEDGE_WINDOW = 100
+HEDGE_MIN_SAMPLES = 20
+
+_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY) if LLM_MAX_CONCURRENCY > 0 else None
+
+
+def chat_model_class() -> Any:
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI
+
+
+@lru_cache(maxsize=None)
+def get_chat_model(model: str) -> Any:
+    """
+    Один клиент на модель: HTTP-пул клиента переиспользуется между запросами.
+    stream_usage — токены приходят и в потоковом ответе (последним чанком).
+    Повторы клиента выключены (их делает resilient_call), timeout — на уровне HTTP,
+    чтобы брошенная по дедлайну попытка не висела в пуле вечно.
+    """
+    return chat_model_class()(model=model, temperature=0, stream_usage=True,
+                              timeout=LLM_TIMEOUT_S, max_retries=0)
+
+
+@lru_cache(maxsize=None)
+def _rate_bucket():
+    from .github_http import TokenBucket
+    return TokenBucket(LLM_RATE_PER_SEC, max(1.0, LLM_RATE_PER_SEC))
+
+
+def _take_slot(slots: Optional[threading.BoundedSemaphore], blocking: bool = True) -> bool:
+    """Занять слот бюджета LLM; blocking=False — только если он свободен сейчас (для хеджа)."""
+    if blocking and LLM_RATE_PER_SEC > 0:
+        _rate_bucket().acquire()
+    return slots is None or slots.acquire(blocking=blocking)
+
+
+class LLMUnavailable(RuntimeError):
+    """Вызов LLM не удался за все попытки (ошибки или дедлайн)."""
+
+
+class LLMTimeout(TimeoutError):
+    pass
+
+
+class Attempt:
+    """
+    Передаётся в fn попытки. attempt() — попытку бросили (дедлайн или выиграл хедж),
+    потоковой попытке пора перестать отдавать данные. attempt.alive() — пришёл очередной
+    кусок потокового ответа: дедлайн stream-вызова отсчитывается от него.
+    """
+
+    __slots__ = ("_cancelled", "last_data")
+
+    def __init__(self, cancelled: threading.Event):
+        self._cancelled = cancelled
+        self.last_data: Optional[float] = None
+
+    def __call__(self) -> bool:
+        return self._cancelled.is_set()
+
+    def alive(self) -> None:
+        self.last_data = time.monotonic()
+
+
+@lru_cache(maxsize=None)
+def _pool() -> ThreadPoolExecutor:
+    # попытки идут в отдельных потоках: по дедлайну их можно бросить, не дожидаясь ответа
+    workers = 2 * LLM_MAX_CONCURRENCY if LLM_MAX_CONCURRENCY > 0 else 32
+    return ThreadPoolExecutor(max_workers=max(4, workers), thread_name_prefix="llm")
+
+
+_latencies: Dict[str, Deque[float]] = {}
+_latencies_lock = threading.Lock()
+
+
+def _record_latency(label: str, seconds: float) -> None:
+    with _latencies_lock:
+        _latencies.setdefault(label, deque(maxlen=HEDGE_WINDOW)).append(seconds)
+
+
+def hedge_delay(label: str) -> float:
+    """Через сколько секунд слать хедж: p95 задержек label, пока их мало — LLM_HEDGE_AFTER_S; 0 — без хеджа."""
+    if LLM_HEDGE_AFTER_S <= 0:
+        return 0.0
+    with _latencies_lock:
+        window = sorted(_latencies.get(label) or ())
+    if len(window) < HEDGE_MIN_SAMPLES:
+        return LLM_HEDGE_AFTER_S
+    return window[min(len(window) - 1, int(len(window) * 0.95))]
+
+
+def _retryable(e: BaseException) -> bool:
+    return getattr(e, "status_code", None) not in NON_RETRYABLE_STATUS
+
+
+def _attempt(fn: Callable[[Attempt], T], label: str, hedge_after: float, stream: bool) -> T:
+    """Одна попытка (плюс хедж): результат первой успешной, иначе ошибка первой упавшей."""
+    cancelled = threading.Event()
+    attempts: List[Attempt] = []
+    slots = _slots
+    _take_slot(slots)
+    t0 = time.monotonic()
+
+    def release(_fut: Any = None) -> None:
+        if slots is not None:
+            slots.release()
+
+    def submit():
+        # слот уже занят; его отпускает сам поток попытки, когда fn вернётся
+        attempt = Attempt(cancelled)
+        attempts.append(attempt)
+        ctx = contextvars.copy_context()  # метрики текущего ревью — и в потоке попытки
+        try:
+            fut = _pool().submit(ctx.run, fn, attempt)
+        except BaseException:
+            release()
+            raise
+        fut.add_done_callback(release)
+        return fut
+
+    def deadline() -> float:
+        seen = [a.last_data for a in attempts if a.last_data is not None]
+        if stream and seen:
+            return max(seen) + LLM_STREAM_IDLE_S
+        return t0 + LLM_TIMEOUT_S
+
+    pending = {submit()}
+    hedge_fut = None
+    error = None
+    try:
+        while pending:
+            now = time.monotonic()
+            if now >= deadline():
+                break
+            timeout = deadline() - now
+            if hedge_after > 0 and hedge_fut is None:
+                timeout = min(timeout, max(0.0, t0 + hedge_after - now))
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut.exception() is None:
+                    if hedge_fut is not None:
+                        metrics.current().add("llm.hedge_won" if fut is hedge_fut else "llm.hedge_lost")
+                    _record_latency(label, time.monotonic() - t0)
+                    return fut.result()
+                error = error or fut.exception()
+            if hedge_fut is None and hedge_after > 0 and pending and time.monotonic() - t0 >= hedge_after:
+                # первая попытка медлит — шлём такую же вторую, если бюджет позволяет
+                if _take_slot(slots, blocking=False):
+                    metrics.current().add("llm.hedged")
+                    hedge_fut = submit()
+                    pending.add(hedge_fut)
+                else:
+                    metrics.current().add("llm.hedge_skipped")
+                    hedge_after = 0.0
+    finally:
+        cancelled.set()  # брошенные попытки не должны отдавать результат дальше
+    if error is not None and not pending:
+        raise error
+    metrics.current().add("llm.timeouts")
+    if stream and any(a.last_data is not None for a in attempts):
+        raise LLMTimeout(f"{label}: stream stalled for {LLM_STREAM_IDLE_S:g}s")
+    raise LLMTimeout(f"{label}: no answer in {LLM_TIMEOUT_S:g}s")
+
+
+def resilient_call(
+    fn: Callable[[Attempt], T],
+    label: str,
+    hedge: bool = True,
+    may_retry: Callable[[], bool] = lambda: True,
+    stream: bool = False,
+) -> T:
+    """
+    fn(attempt) -> результат; attempt() — попытку бросили (см. Attempt).
+    hedge=False — для попыток с побочными эффектами (поток замечаний в on_item);
+    may_retry() == False — повтор уже невозможен (например, часть ответа отдана дальше);
+    stream=True — fn читает поток и зовёт attempt.alive() на каждый кусок: LLM_TIMEOUT_S
+    ждём только первый кусок, дальше попытку бросаем после LLM_STREAM_IDLE_S тишины.
+    """
+    for n in range(LLM_MAX_RETRIES + 1):
+        try:
+            return _attempt(fn, label, hedge_delay(label) if hedge else 0.0, stream)
+        except Exception as e:
+            if n == LLM_MAX_RETRIES or not _retryable(e) or not may_retry():
+                metrics.current().add("llm.failed")
+                raise LLMUnavailable(f"{label}: {e!r}") from e
+            delay = random.uniform(0, min(30.0, LLM_RETRY_BACKOFF_S * (2 ** n)))
+            print(f"[llm] {label}: attempt {n + 1} failed ({e!r}), retry in {delay:.1f}s")
+            metrics.current().add("llm.retries")
+            time.sleep(delay)
@@ -1,31 +1,131 @@
 import sys
-from .github_client import get_pr_info, get_pr_files
-from .utils import build_diff_index, build_filtered_files, build_diff_text_from_files
-from .graph import review_graph
+from typing import Callable, Optional
+import requests
+from . import metrics
+from .github_async import fetch_pr
+from .github_client import get_pr_info, stream_pr_diff
+from .git_diff import GitDiffError, stream_git_diff
+from .config import (
+    REVIEW_CONCURRENCY,
+    REVIEW_CONTEXT_LINES,
+    REVIEW_DIFF_SOURCE,
+    REVIEW_GIT_DIR,
+    REVIEW_ONLY_PREFIXES,
+)
+from .agents.codestyle_agent import diff_token_budget
+from .utils import (
+    build_diff_index,
+    build_diff_index_from_lines,
+    build_filtered_files,
+    build_diff_shards,
+    files_missing_patches,
+)
 
 
-def main(pr_number: int):
-    # 1) Метаданные PR (нужен head sha для inline-комментариев)
-    pr = get_pr_info(pr_number)
+def load_diff_index(pr_number: int, pr, files, included_files):
+    """
+    Индекс диффа из патчей /files; полный .diff потоком — если так настроено
+    или если /files отдал не всё (см. files_missing_patches).
+    """
+    use_raw = REVIEW_DIFF_SOURCE == "diff" or (
+        REVIEW_DIFF_SOURCE == "auto" and files_missing_patches(pr, files, included_files)
+    )
+    if use_raw:
+        print(f"[main] PR {pr_number}: using streamed .diff (source={REVIEW_DIFF_SOURCE})")
+        try:
+            return build_diff_index_from_lines(stream_pr_diff(pr_number))
+        except requests.HTTPError as e:
+            # например, 406 — дифф больше лимита GitHub; остаёмся на патчах /files
+            print(f"[main] .diff unavailable ({e}); falling back to /files patches")
+    return build_diff_index(included_files)
+
+
+def load_git_diff_index(pr_number: int, pr):
+    """
+    Индекс диффа из локального клона (REVIEW_DIFF_SOURCE=git): git diff merge-base..head
+    только по REVIEW_ONLY_PREFIXES, потоком в тот же разбор, что и .diff от GitHub.
+    None — локальный дифф не получился (нет git/коммитов), нужен путь через API.
+    """
+    try:
+        return build_diff_index_from_lines(
+            stream_git_diff(REVIEW_GIT_DIR, pr["base"]["sha"], pr["head"]["sha"], REVIEW_ONLY_PREFIXES)
+        )
+    except GitDiffError as e:
+        print(f"[main] PR {pr_number}: local git diff unavailable ({e}); falling back to the API")
+        return None
+
+
+def main(pr_number: int, should_stop: Optional[Callable[[], bool]] = None):
+    """
+    Ревью PR. should_stop — проверка «ревью устарело» (server: пришёл новый push):
+    между этапами и перед публикацией работа прекращается без комментариев.
+    """
+    # метрики (узлы графа, вызовы GitHub/LLM, токены) — отчёт пишется и при ошибке
+    with metrics.use_metrics(metrics.Metrics(f"PR #{pr_number}")) as m:
+        try:
+            review(pr_number, m, should_stop)
+        finally:
+            metrics.write_report(m)
+
+
+def review(pr_number: int, m: metrics.Metrics, should_stop: Optional[Callable[[], bool]] = None):
+    stop = should_stop or (lambda: False)
+    diff_index = None
+    if REVIEW_DIFF_SOURCE == "git":
+        # 1-2) Из API — только метаданные PR (base/head sha), дифф — из локального клона
+        with m.span("stage", "fetch"):
+            pr = get_pr_info(pr_number)
+        with m.span("stage", "index"):
+            diff_index = load_git_diff_index(pr_number, pr)
+        if diff_index is not None:
+            print(f"[main] PR {pr_number}: diff from local git ({REVIEW_GIT_DIR})")
+            m.add("files.total", int(pr.get("changed_files") or 0))
+            m.add("files.included", len(diff_index.files))
+
+    if diff_index is None:
+        # 1) Метаданные PR (нужен head sha для inline-комментариев) и файлы PR — одновременно,
+        #    страницы списка файлов тоже параллельно
+        with m.span("stage", "fetch"):
+            pr, files = fetch_pr(pr_number)
+
+        # 2) Фильтрация файлов: префиксы (по умолчанию src/) + files.include/exclude из правил
+        included_files = build_filtered_files(files)
+        m.add("files.total", len(files))
+        m.add("files.included", len(included_files))
+        # один проход по патчам: общий буфер диффа + компактный индекс строк и ханков
+        with m.span("stage", "index"):
+            diff_index = load_diff_index(pr_number, pr, files, included_files)
     head_sha = pr["head"]["sha"]
 
-    # 2) Файлы PR и фильтрация по префиксам (по умолчанию: src/)
-    files = get_pr_files(pr_number)
-    included_files = build_filtered_files(files)
-    diff_index = build_diff_index(included_files)
-    diff_text = build_diff_text_from_files(included_files)
+    with m.span("stage", "shard") as st:
+        shards = build_diff_shards(diff_index, diff_token_budget(), REVIEW_CONTEXT_LINES)
+        st["diff_chars"] = len(diff_index.text)
+    m.add("shards", len(shards))
+    if not len(diff_index):
+        # в области ревью нет изменений — граф (и langgraph/langchain) не нужен
+        print(f"[main] PR {pr_number}: nothing to review in {REVIEW_ONLY_PREFIXES}")
+        return
+    if stop():
+        print(f"[main] PR {pr_number}: superseded before review, skipping")
+        m.add("review.superseded")
+        return
 
     # 3) Начальное состояние графа
     initial_state = {
         "pr_number": pr_number,
         "head_sha": head_sha,
-        "diff_text": diff_text,      # даём агентам дифф только по src/**
-        "diff_index": diff_index,    # и индексы только по src/**
-        "raw_comments": []
+        "shards": shards,            # дифф только по src/**, порезанный на шарды (ханки индекса)
+        "diff_index": diff_index,    # и индекс строк только по src/**
+        "raw_comments": [],
+        "rule_comments": [],
+        "should_stop": stop,
     }
 
-    # 4) Запуск графа
-    review_graph.invoke(initial_state)
+    # 4) Запуск графа (шарды ревьюятся параллельно, не больше REVIEW_CONCURRENCY сразу)
+    from .graph import get_review_graph
+
+    with m.span("stage", "graph"):
+        get_review_graph().invoke(initial_state, config={"max_concurrency": REVIEW_CONCURRENCY})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,180 @@
+"""
+Инструментирование ревью: длительности узлов графа, вызовов GitHub API и LLM,
+байты, токены, ретраи и счётчики (например, сколько замечаний не удалось привязать).
+
+Текущий сборщик хранится в contextvar: потоки LangGraph и asyncio.to_thread
+наследуют контекст, поэтому параллельные ревью (batch/server) не смешиваются.
+Отчёт — JSON (REVIEW_METRICS_PATH) и Markdown в GITHUB_STEP_SUMMARY.
+"""
+import contextvars
+import functools
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from .config import REVIEW_METRICS_PATH
+
+
+class Metrics:
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        # group -> name -> {"calls", "total_s", "max_s", <числовые поля>...}
+        self._spans: Dict[str, Dict[str, Dict[str, float]]] = {}
+        self.counters: Counter = Counter()
+
+    def observe(self, group: str, name: str, seconds: float, **fields: float) -> None:
+        with self._lock:
+            st = self._spans.setdefault(group, {}).setdefault(name, {"calls": 0, "total_s": 0.0, "max_s": 0.0})
+            st["calls"] += 1
+            st["total_s"] += seconds
+            st["max_s"] = max(st["max_s"], seconds)
+            for k, v in fields.items():
+                if isinstance(v, (int, float)):
+                    st[k] = st.get(k, 0) + v
+
+    def add(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    @contextmanager
+    def span(self, group: str, name: str, **fields: float) -> Iterator[Dict[str, float]]:
+        """Замер блока; в отданный dict можно дописать числовые поля (bytes, tokens...)."""
+        extra: Dict[str, float] = dict(fields)
+        t0 = time.perf_counter()
+        try:
+            yield extra
+        finally:
+            self.observe(group, name, time.perf_counter() - t0, **extra)
+
+    def merge(self, other: "Metrics") -> None:
+        """Добавить замеры другого сборщика (batch: сумма по всем PR)."""
+        with other._lock:
+            spans = {g: {n: dict(st) for n, st in names.items()} for g, names in other._spans.items()}
+            counters = Counter(other.counters)
+        with self._lock:
+            for g, names in spans.items():
+                for n, st in names.items():
+                    cur = self._spans.setdefault(g, {}).setdefault(n, {"calls": 0, "total_s": 0.0, "max_s": 0.0})
+                    for k, v in st.items():
+                        cur[k] = max(cur[k], v) if k == "max_s" else cur.get(k, 0) + v
+            self.counters.update(counters)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            groups = {
+                g: {n: {k: round(v, 4) if isinstance(v, float) else v for k, v in st.items()}
+                    for n, st in names.items()}
+                for g, names in self._spans.items()
+            }
+            totals = {
+                g: {
+                    "calls": sum(st["calls"] for st in names.values()),
+                    "total_s": round(sum(st["total_s"] for st in names.values()), 4),
+                }
+                for g, names in self._spans.items()
+            }
+            return {
+                "label": self.label,
+                "started_at": self.started,
+                "duration_s": round(time.perf_counter() - self._t0, 4),
+                "totals": totals,
+                "groups": groups,
+                "counters": dict(self.counters),
+            }
+
+
+_current: contextvars.ContextVar[Metrics] = contextvars.ContextVar("review_metrics", default=Metrics("process"))
+
+
+def current() -> Metrics:
+    return _current.get()
+
+
+@contextmanager
+def use_metrics(m: Metrics) -> Iterator[Metrics]:
+    token = _current.set(m)
+    try:
+        yield m
+    finally:
+        _current.reset(token)
+
+
+def instrument_node(name: str, fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Обёртка узла LangGraph: время выполнения в группе "node"."""
+
+    @functools.wraps(fn)
+    def wrapper(state, *args, **kwargs):
+        with current().span("node", name):
+            return fn(state, *args, **kwargs)
+
+    return wrapper
+
+
+_REPO_RE = re.compile(r"/repos/[^/]+/[^/]+")
+_NUM_RE = re.compile(r"/\d+(?=/|$)")
+
+
+def api_route(method: str, url: str) -> str:
+    """'GET https://api.github.com/repos/o/r/pulls/5/files?page=2' -> 'GET /repos/{repo}/pulls/{n}/files'."""
+    path = re.sub(r"^[a-z]+://[^/]+", "", url).split("?", 1)[0]
+    path = _NUM_RE.sub("/{n}", _REPO_RE.sub("/repos/{repo}", path))
+    return f"{method} {path}"
+
+
+def llm_usage(resp: Any) -> Dict[str, int]:
+    """Токены из ответа chat-модели (usage_metadata или response_metadata.token_usage)."""
+    usage = getattr(resp, "usage_metadata", None) or {}
+    if usage:
+        return {
+            "prompt_tokens": int(usage.get("input_tokens") or 0),
+            "completion_tokens": int(usage.get("output_tokens") or 0),
+        }
+    tu = (getattr(resp, "response_metadata", None) or {}).get("token_usage") or {}
+    return {
+        "prompt_tokens": int(tu.get("prompt_tokens") or 0),
+        "completion_tokens": int(tu.get("completion_tokens") or 0),
+    }
+
+
+def _row(cells) -> str:
+    return "| " + " | ".join(str(c) for c in cells) + " |"
+
+
+def _summary_markdown(rep: Dict[str, Any]) -> str:
+    lines = [f"### AI review metrics {rep['label']}".rstrip(), "",
+             f"Total: **{rep['duration_s']} s**", ""]
+    for group, names in rep["groups"].items():
+        extra_keys = sorted({k for st in names.values() for k in st} - {"calls", "total_s", "max_s"})
+        lines.append(_row([group, "calls", "total, s", "max, s"] + extra_keys))
+        lines.append(_row(["---"] * (4 + len(extra_keys))))
+        for name, st in sorted(names.items(), key=lambda kv: -kv[1]["total_s"]):
+            lines.append(_row([f"`{name}`", st["calls"], st["total_s"], st["max_s"]] + [st.get(k, 0) for k in extra_keys]))
+        lines.append("")
+    if rep["counters"]:
+        lines.append(_row(["counter", "value"]))
+        lines.append(_row(["---", "---"]))
+        for k, v in sorted(rep["counters"].items()):
+            lines.append(_row([f"`{k}`", v]))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def write_report(m: Optional[Metrics] = None) -> Dict[str, Any]:
+    """JSON-отчёт в REVIEW_METRICS_PATH и Markdown-таблицы в GITHUB_STEP_SUMMARY (если заданы)."""
+    rep = (m or current()).report()
+    if REVIEW_METRICS_PATH:
+        with open(REVIEW_METRICS_PATH, "w", encoding="utf-8") as f:
+            json.dump(rep, f, ensure_ascii=False, indent=2)
+    summary = os.getenv("GITHUB_STEP_SUMMARY")
+    if summary:
+        with open(summary, "a", encoding="utf-8") as f:
+            f.write(_summary_markdown(rep) + "\n")
+    return rep
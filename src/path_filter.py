@@ -0,0 +1,164 @@
+"""
+Какие файлы PR ревьюить: REVIEW_ONLY_PREFIXES из окружения + files.include / files.exclude
+из .github/ai-review.json.
+
+Матчер собирается один раз на процесс:
+- префиксы — trie по сегментам пути (проверка за O(глубины пути), а не перебором префиксов);
+- глобы — переводятся в regex и объединяются в один паттерн на include и один на exclude.
+
+Синтаксис глобов: '*' и '?' — в пределах сегмента, '**' — любое число каталогов,
+'{a,b}' — альтернативы, '[...]' — класс символов. Глоб без '/' сопоставляется
+с именем файла на любой глубине (как в .gitignore).
+"""
+import re
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Pattern
+
+from .config import REVIEW_ONLY_PREFIXES
+
+
+def _split_alternatives(body: str) -> List[str]:
+    """'a,{b,c},d' -> ['a', '{b,c}', 'd'] — запятые только верхнего уровня."""
+    out, depth, cur = [], 0, []
+    for ch in body:
+        if ch == "," and depth == 0:
+            out.append("".join(cur))
+            cur = []
+            continue
+        depth += (ch == "{") - (ch == "}")
+        cur.append(ch)
+    out.append("".join(cur))
+    return out
+
+
+def _translate(glob: str) -> str:
+    i, n = 0, len(glob)
+    out: List[str] = []
+    while i < n:
+        c = glob[i]
+        if c == "*":
+            if glob.startswith("**/", i):
+                out.append("(?:.*/)?")  # ноль и больше каталогов
+                i += 3
+                continue
+            if glob.startswith("**", i):
+                out.append(".*")
+                i += 2
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "{":
+            depth, j = 0, i
+            while j < n:
+                depth += (glob[j] == "{") - (glob[j] == "}")
+                if depth == 0:
+                    break
+                j += 1
+            if j >= n:
+                out.append(re.escape(c))
+            else:
+                alts = _split_alternatives(glob[i + 1:j])
+                out.append("(?:" + "|".join(_translate(a) for a in alts) + ")")
+                i = j
+        elif c == "[":
+            j = glob.find("]", i + 1)
+            if j == -1:
+                out.append(re.escape(c))
+            else:
+                cls = glob[i + 1:j]
+                if cls.startswith("!"):
+                    cls = "^" + cls[1:]
+                out.append(f"[{cls}]")
+                i = j
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+def glob_to_regex(glob: str) -> str:
+    """Регулярное выражение (без якорей) для пути относительно корня репозитория."""
+    glob = glob.strip()
+    if glob.startswith("./"):
+        glob = glob[2:]
+    if "/" not in glob.rstrip("/"):
+        # имя файла/каталога на любой глубине
+        glob = "**/" + glob
+    glob = glob.lstrip("/")
+    if glob.endswith("/"):
+        glob += "**"
+    return _translate(glob)
+
+
+def compile_globs(globs: Iterable[str]) -> Optional[Pattern[str]]:
+    parts = [glob_to_regex(g) for g in globs if g and g.strip()]
+    if not parts:
+        return None
+    return re.compile("^(?:" + "|".join(f"(?:{p})" for p in parts) + ")$")
+
+
+class PrefixTrie:
+    """Trie по сегментам пути: есть ли среди префиксов каталог-предок (или сам путь)."""
+
+    _END = ""
+
+    def __init__(self, prefixes: Iterable[str]):
+        self._root: Dict[str, Any] = {}
+        self.empty = True
+        for p in prefixes:
+            segs = [s for s in p.strip().strip("/").split("/") if s and s != "."]
+            if not segs:
+                continue
+            node = self._root
+            for s in segs:
+                node = node.setdefault(s, {})
+            node[self._END] = True
+            self.empty = False
+
+    def matches(self, path: str) -> bool:
+        if self.empty:
+            return True
+        node = self._root
+        for s in path.split("/"):
+            node = node.get(s)
+            if node is None:
+                return False
+            if self._END in node:
+                return True
+        return False
+
+
+def _normalize(path: str) -> str:
+    path = (path or "").strip()
+    while path.startswith("./"):
+        path = path[2:]
+    return path.lstrip("/")
+
+
+class PathMatcher:
+    def __init__(self, prefixes: Iterable[str], include: Iterable[str] = (), exclude: Iterable[str] = ()):
+        self.prefixes = PrefixTrie(prefixes)
+        self.include = compile_globs(include)
+        self.exclude = compile_globs(exclude)
+
+    def __call__(self, path: str) -> bool:
+        path = _normalize(path)
+        if not path or not self.prefixes.matches(path):
+            return False
+        if self.include is not None and not self.include.match(path):
+            return False
+        return self.exclude is None or not self.exclude.match(path)
+
+
+@lru_cache(maxsize=None)
+def get_path_matcher() -> PathMatcher:
+    """Матчер процесса: REVIEW_ONLY_PREFIXES + секция "files" файла правил (если он есть)."""
+    from .rules import load_rules
+
+    try:
+        files = load_rules().get("files") or {}
+    except (OSError, ValueError) as e:
+        print(f"[filter] rules file unavailable, using prefixes only: {e}")
+        files = {}
+    return PathMatcher(REVIEW_ONLY_PREFIXES, files.get("include") or (), files.get("exclude") or ())
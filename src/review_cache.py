@@ -0,0 +1,174 @@
+"""
+Персистентный кэш ревью по ханкам (SQLite).
+
+Ключ: sha256(путь + нормализованный ханк) + sha256(файла правил) + модель
+(шарды маршрутизируются по разным моделям, см. routing).
+Значение: комментарии агента (path/line_match/body), относящиеся к ханку;
+пустой список — «ханк проверен, замечаний нет».
+Привязка к строкам всё равно делается заново через resolve_position,
+поэтому сдвиг ханка внутри файла не инвалидирует запись.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from .config import (
+    RULES_PATH,
+    REVIEW_CACHE_PATH,
+    REVIEW_CACHE_MAX_ENTRIES,
+    REVIEW_CACHE_MAX_AGE_DAYS,
+    get_openai_model,
+)
+from .diff_index import Hunk
+
+_HUNK_HEADER = re.compile(r"^@@[^@]*@@")
+
+
+def normalize_hunk(patch: str) -> str:
+    """Убираем номера строк из заголовка '@@' и хвостовые пробелы — они не влияют на ревью."""
+    lines = patch.splitlines()
+    if lines and lines[0].startswith("@@"):
+        lines[0] = _HUNK_HEADER.sub("@@", lines[0])
+    return "\n".join(ln.rstrip() for ln in lines)
+
+
+def rules_fingerprint(path: str = RULES_PATH) -> str:
+    try:
+        return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+    except OSError:
+        return "no-rules"
+
+
+class ReviewCache:
+    def __init__(self, path: str, max_entries: int, max_age_days: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # одно соединение на процесс; ветки графа работают в потоках — сериализуем через lock
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS hunks ("
+            " key TEXT PRIMARY KEY, comments TEXT NOT NULL,"
+            " created_at REAL NOT NULL, used_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS hunks_used_at ON hunks(used_at)")
+        self._db.commit()
+        self._rules = rules_fingerprint()
+        self.evict()
+
+    def key(self, path: str, patch: str, model: Optional[str] = None) -> str:
+        """model — модель, которая ревьюит ханк (по умолчанию OPENAI_MODEL)."""
+        h = hashlib.sha256()
+        h.update(f"{self._rules}:{model or get_openai_model()}".encode())
+        h.update(b"\0")
+        h.update(path.encode())
+        h.update(b"\0")
+        h.update(normalize_hunk(patch).encode())
+        return h.hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        if not keys:
+            return {}
+        out: Dict[str, List[Dict[str, Any]]] = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                rows = self._db.execute(
+                    f"SELECT key, comments FROM hunks WHERE key IN ({marks}) AND created_at >= ?",
+                    (*chunk, now - self.max_age),
+                ).fetchall()
+                for k, comments in rows:
+                    out[k] = json.loads(comments)
+            if out:
+                self._db.executemany("UPDATE hunks SET used_at = ? WHERE key = ?", [(now, k) for k in out])
+                self._db.commit()
+        return out
+
+    def put_many(self, entries: Dict[str, List[Dict[str, Any]]]) -> None:
+        if not entries:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO hunks(key, comments, created_at, used_at) VALUES (?, ?, ?, ?)",
+                [(k, json.dumps(v, ensure_ascii=False), now, now) for k, v in entries.items()],
+            )
+            self._db.commit()
+
+    def evict(self) -> int:
+        """Удаляем записи старше max_age и самые давно использованные сверх max_entries."""
+        with self._lock:
+            cur = self._db.execute("DELETE FROM hunks WHERE created_at < ?", (time.time() - self.max_age,))
+            removed = cur.rowcount
+            (count,) = self._db.execute("SELECT COUNT(*) FROM hunks").fetchone()
+            if count > self.max_entries:
+                cur = self._db.execute(
+                    "DELETE FROM hunks WHERE key IN (SELECT key FROM hunks ORDER BY used_at ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+                removed += cur.rowcount
+            self._db.commit()
+        if removed:
+            print(f"[cache] evicted {removed} entries")
+        return removed
+
+
+def _squash(text: str) -> str:
+    return re.sub(r"\s+", "", text)
+
+
+def split_by_hunk(items: List[Dict[str, Any]], units: List[Hunk]):
+    """
+    Раскладываем комментарии агента по ханкам, из которых они пришли
+    (по path и вхождению line_match в текст ханка; если line_match не нашёлся,
+    а ханк этого файла в шарде один — к нему).
+    Возвращаем (per_unit, orphans): список комментариев на каждый ханк
+    и комментарии, которые не удалось однозначно отнести ни к одному.
+    """
+    per_unit: List[List[Dict[str, Any]]] = [[] for _ in units]
+    texts = [u.text for u in units]
+    squashed = [None] * len(units)
+    orphans: List[Dict[str, Any]] = []
+    for it in items:
+        lm = (it.get("line_match") or "").strip()
+        path = (it.get("path") or "").strip()
+        same_path = [i for i, u in enumerate(units) if u.path == path]
+        cands = same_path or list(range(len(units)))
+        target = next((i for i in cands if lm and lm in texts[i]), None)
+        if target is None and lm:
+            lm_norm = _squash(lm)
+            for i in cands:
+                if squashed[i] is None:
+                    squashed[i] = _squash(texts[i])
+                if lm_norm in squashed[i]:
+                    target = i
+                    break
+        if target is None and len(same_path) == 1:
+            target = same_path[0]
+        if target is None:
+            orphans.append(it)
+        else:
+            per_unit[target].append(it)
+    return per_unit, orphans
+
+
+@lru_cache(maxsize=None)
+def get_review_cache() -> Optional[ReviewCache]:
+    """Кэш процесса; None, если REVIEW_CACHE_PATH пуст (кэш выключен) или БД недоступна."""
+    if not REVIEW_CACHE_PATH:
+        return None
+    try:
+        return ReviewCache(REVIEW_CACHE_PATH, REVIEW_CACHE_MAX_ENTRIES, REVIEW_CACHE_MAX_AGE_DAYS)
+    except (OSError, sqlite3.Error) as e:
+        print(f"[cache] disabled: {e}")
+        return None
@@ -0,0 +1,76 @@
+"""
+Выбор модели для шарда ревью.
+
+Два уровня: "fast" (REVIEW_FAST_MODEL — быстрая и дешёвая) и "strong" (OPENAI_MODEL).
+Шард классифицируется по добавленным строкам, типам файлов и числу срабатываний
+локальных правил (forbiddenPatterns) — всё считается по тексту ханков, без LLM.
+Большинство PR маленькие, и их шарды уходят быстрой модели; крупные и «грязные»
+шарды — сильной. Если быстрая модель не дала разбираемого ответа, шард повторяется
+на сильной (см. graph._ask_agent).
+"""
+from typing import Any, Dict, Iterable, List, Tuple
+
+from .config import (
+    REVIEW_FAST_LATENCY_S,
+    REVIEW_FAST_MAX_ADDED_LINES,
+    REVIEW_FAST_MAX_RULE_HITS,
+    REVIEW_FAST_MODEL,
+    REVIEW_STRONG_FILE_TYPES,
+    REVIEW_STRONG_LATENCY_S,
+    get_openai_model,
+)
+from .diff_index import Hunk
+from .rules import file_type, get_pattern_engine
+
+TIER_FAST = "fast"
+TIER_STRONG = "strong"
+
+
+def routing_enabled() -> bool:
+    return bool(REVIEW_FAST_MODEL) and REVIEW_FAST_MODEL != get_openai_model()
+
+
+def tier_model(tier: str) -> str:
+    return REVIEW_FAST_MODEL if tier == TIER_FAST and routing_enabled() else get_openai_model()
+
+
+def latency_target(tier: str) -> float:
+    return REVIEW_FAST_LATENCY_S if tier == TIER_FAST else REVIEW_STRONG_LATENCY_S
+
+
+def stronger_models(model: str) -> List[str]:
+    """model и модели старших уровней — их ответ из кэша годится и для этого шарда."""
+    strong = get_openai_model()
+    return [model] if model == strong else [model, strong]
+
+
+def shard_profile(units: Iterable[Hunk]) -> Dict[str, Any]:
+    """{"added": добавленных строк, "types": типы файлов, "rule_hits": строк с нарушениями forbiddenPatterns}."""
+    engine = get_pattern_engine()
+    added = hits = 0
+    types = set()
+    for u in units:
+        types.add(file_type(u.path))
+        for ln in u.text.split("\n")[1:]:
+            if ln.startswith("+"):
+                added += 1
+                if engine.match_line(ln[1:]):
+                    hits += 1
+    return {"added": added, "types": sorted(types), "rule_hits": hits}
+
+
+def route_shard(units: List[Hunk]) -> Tuple[str, str, Dict[str, Any]]:
+    """(уровень, модель, профиль шарда)."""
+    if not routing_enabled():
+        return TIER_STRONG, get_openai_model(), {}
+    profile = shard_profile(units)
+    strong_types = set(profile["types"]).intersection(REVIEW_STRONG_FILE_TYPES)
+    if (
+        profile["added"] > REVIEW_FAST_MAX_ADDED_LINES
+        or profile["rule_hits"] > REVIEW_FAST_MAX_RULE_HITS
+        or strong_types
+    ):
+        tier = TIER_STRONG
+    else:
+        tier = TIER_FAST
+    return tier, tier_model(tier), profile
@@ -0,0 +1,110 @@
+"""
+Локальные правила ревью из .github/ai-review.json.
+
+forbiddenPatterns проверяются детерминированно (regex) по добавленным строкам
+диффа ещё до вызова LLM: находки сразу получают точные номера строк,
+а сами правила в промпт агента не попадают.
+Секция "files" (include/exclude) применяется ещё при отборе файлов (path_filter)
+и в промпт тоже не идёт.
+"""
+import json
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Pattern, Tuple
+
+from .config import RULES_PATH
+
+# секции, которые исполняются локально и в промпт LLM не попадают
+LOCAL_SECTIONS = frozenset({"forbiddenPatterns", "files"})
+
+
+@lru_cache(maxsize=None)
+def load_rules(path: str = RULES_PATH) -> Dict[str, Any]:
+    """Читаем и кэшируем конфиг правил (один раз на процесс)."""
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+def file_type(path: str) -> str:
+    name = path.rsplit("/", 1)[-1]
+    return name.rsplit(".", 1)[-1].lower() if "." in name else ""
+
+
+def rules_for_prompt(rules: Dict[str, Any]) -> str:
+    """Правила для LLM без механических секций (LOCAL_SECTIONS)."""
+    data = {k: v for k, v in rules.items() if k not in LOCAL_SECTIONS}
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+
+_GROUP_REFS = re.compile(r"\\[1-9]|\(\?\(")
+
+
+def _own_groups(rx: Pattern[str]) -> bool:
+    """Правило ссылается на свои группы (по номеру или имени) — в общий регекс его не берём."""
+    return bool(rx.groupindex) or (rx.groups > 0 and _GROUP_REFS.search(rx.pattern) is not None)
+
+
+class PatternEngine:
+    """
+    Компилирует все forbiddenPatterns один раз.
+    Общий регекс (альтернация всех правил) служит предфильтром: строка без
+    попадания отбрасывается за один проход, по отдельным правилам проверяем
+    только строки-кандидаты. Правила, которым нужна своя нумерация групп
+    (обратные ссылки \\1, условия (?(1)...), именованные группы), в общий регекс
+    не входят и проверяются на каждой строке отдельно.
+    """
+
+    def __init__(self, patterns: List[Dict[str, Any]]):
+        self._patterns: List[Tuple[str, str, Pattern[str]]] = []
+        for p in patterns or []:
+            try:
+                rx = re.compile(p["regex"])
+            except (KeyError, TypeError, re.error) as e:
+                print(f"[rules] skip pattern {p.get('id')!r}: {e}")
+                continue
+            self._patterns.append((p.get("id") or "", p.get("message") or "", rx))
+
+        # в альтернации группы перенумеровываются: \1 второго правила указал бы на группу первого,
+        # а одинаковые имена групп в разных правилах — ошибка компиляции
+        shared = [p for p in self._patterns if not _own_groups(p[2])]
+        self._solo = [p for p in self._patterns if _own_groups(p[2])]
+        self._combined: Optional[Pattern[str]] = None
+        if shared:
+            try:
+                self._combined = re.compile("|".join(f"(?:{rx.pattern})" for _, _, rx in shared))
+            except re.error:
+                # например, inline-флаги в середине выражения — проверяем по одному
+                self._combined = None
+        if self._combined is None:
+            self._solo = self._patterns
+
+    def __len__(self) -> int:
+        return len(self._patterns)
+
+    def match_line(self, text: str) -> List[Tuple[str, str]]:
+        """[(rule_id, message), ...] для всех правил, сработавших на строке."""
+        if not self._patterns:
+            return []
+        candidates = self._patterns
+        if self._combined is not None and not self._combined.search(text):
+            candidates = self._solo
+        return [(rid, msg) for rid, msg, rx in candidates if rx.search(text)]
+
+    def scan(self, added_lines: Iterable[Tuple[str, int, str]]) -> List[Dict[str, Any]]:
+        """
+        Проверяем добавленные строки: [(path, new_line, text), ...] (DiffIndex.added_lines()).
+        Возвращаем готовые к публикации [{"path", "line", "body"}] —
+        один комментарий на строку со всеми нарушениями.
+        """
+        out: List[Dict[str, Any]] = []
+        for path, new_line, text in added_lines:
+            hits = self.match_line(text)
+            if hits:
+                body = "\n".join(f"{msg} (`{rid}`)" for rid, msg in hits)
+                out.append({"path": path, "line": new_line, "body": body})
+        return out
+
+
+@lru_cache(maxsize=None)
+def get_pattern_engine(path: str = RULES_PATH) -> PatternEngine:
+    return PatternEngine(load_rules(path).get("forbiddenPatterns") or [])
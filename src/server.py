@@ -0,0 +1,404 @@
+"""
+Долгоживущий сервер вебхуков GitHub (вместо холодного старта Actions-джобы на каждое событие).
+
+- pull_request (opened/synchronize/reopened) — ревью PR, как python -m src.main;
+- pull_request_review_comment с упоминанием бота — ответ в треде, как comment_responder;
+- скомпилированный граф, HTTP-сессия GitHub, LLM-клиенты, правила и кэш ревью
+  создаются один раз при старте и переиспользуются между событиями;
+- события идут в очередь задач с SERVER_WORKERS обработчиками; задачи одного PR
+  не выполняются одновременно: новый push заменяет ещё не начатое ревью,
+  а начатое — отменяет (оно останавливается между этапами и ничего не публикует).
+
+Запуск:   python -m src.server
+Проверка: python -m src.server replay payload.json --event pull_request
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+from . import metrics
+from .config import (
+    BOT_MENTION,
+    GITHUB_WEBHOOK_SECRET,
+    SERVER_HOST,
+    SERVER_MAX_BODY_BYTES,
+    SERVER_PORT,
+    SERVER_WORKERS,
+)
+
+REVIEW_ACTIONS = {"opened", "synchronize", "reopened"}
+# сколько ждать заголовков и тела запроса от клиента
+READ_TIMEOUT_S = 30
+
+JobKey = Tuple[str, int]
+
+
+class Job:
+    """Задача очереди: ("review", pr_number) или ("reply", comment_id)."""
+
+    __slots__ = ("key", "event", "payload", "cancel", "received")
+
+    def __init__(self, key: JobKey, event: str, payload: Dict[str, Any]):
+        self.key = key
+        self.event = event
+        self.payload = payload
+        self.cancel = threading.Event()
+        self.received = time.monotonic()
+
+
+def job_for(event: str, payload: Dict[str, Any]) -> Optional[Job]:
+    """Задача по вебхуку; None — событие нас не интересует."""
+    if event == "pull_request":
+        pr = payload.get("pull_request") or {}
+        if payload.get("action") not in REVIEW_ACTIONS or not pr.get("number"):
+            return None
+        return Job(("review", int(pr["number"])), event, payload)
+    if event == "pull_request_review_comment":
+        comment = payload.get("comment") or {}
+        if payload.get("action") != "created" or not comment.get("id"):
+            return None
+        # бот отвечает только на упоминание — остальное отсекаем до очереди
+        if (BOT_MENTION or "").lower() not in (comment.get("body") or "").lower():
+            return None
+        return Job(("reply", int(comment["id"])), event, payload)
+    return None
+
+
+def run_job(job: Job) -> None:
+    """
+    Выполнение задачи (в рабочем потоке). Метрики идут в сборщик задачи (JobQueue._run):
+    отчёт в файл на каждую задачу параллельные обработчики перезаписывали бы друг у друга.
+    """
+    from . import comment_responder
+    from .main import review
+
+    kind, num = job.key
+    if kind == "review":
+        review(num, metrics.current(), should_stop=job.cancel.is_set)
+    else:
+        comment_responder.handle_event(job.event, job.payload)
+
+
+class JobQueue:
+    """
+    Очередь задач с объединением по ключу:
+    - ключ ждёт запуска — payload заменяется свежим, лишней задачи не появляется;
+    - ключ уже выполняется — у выполняемой задачи выставляется cancel, новая ждёт её завершения.
+    Метрики задач суммируются в metrics (счётчики — в /healthz); отчёт REVIEW_METRICS_PATH
+    пишется один раз, при остановке.
+    """
+
+    def __init__(self, runner: Callable[[Job], None] = run_job, workers: int = SERVER_WORKERS):
+        self.runner = runner
+        self.workers = max(1, workers)
+        self._queue: "asyncio.Queue[JobKey]" = asyncio.Queue()
+        self._pending: Dict[JobKey, Job] = {}
+        self._running: Dict[JobKey, Job] = {}
+        self._tasks = []
+        self.stats: Counter = Counter()
+        self.metrics = metrics.Metrics("server")
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self) -> None:
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        metrics.write_report(self.metrics)
+
+    def submit(self, job: Job) -> str:
+        status = "queued"
+        running = self._running.get(job.key)
+        if running is not None and job.key[0] == "review" and not running.cancel.is_set():
+            running.cancel.set()
+            self.stats["cancelled"] += 1
+            status = "superseded"
+        if job.key in self._pending:
+            self._pending[job.key] = job
+            self.stats["coalesced"] += 1
+            return "coalesced"
+        self._pending[job.key] = job
+        self._queue.put_nowait(job.key)
+        self.stats["queued"] += 1
+        return status
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "pending": [list(k) for k in self._pending],
+            "running": [list(k) for k in self._running],
+            "stats": dict(self.stats),
+            "counters": dict(self.metrics.counters),
+        }
+
+    def _run(self, job: Job) -> None:
+        kind, num = job.key
+        t0 = time.perf_counter()
+        with metrics.use_metrics(metrics.Metrics(f"{kind} #{num}")) as m:
+            try:
+                self.runner(job)
+            finally:
+                self.metrics.merge(m)
+                self.metrics.observe("job", kind, time.perf_counter() - t0)
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            key = await self._queue.get()
+            if key in self._running:
+                # ключ занят — задачу снова поставит в очередь завершившийся запуск
+                continue
+            job = self._pending.pop(key, None)
+            if job is None:
+                continue
+            self._running[key] = job
+            wait = time.monotonic() - job.received
+            print(f"[server] worker {n}: {key[0]} #{key[1]} started (queued {wait:.2f}s)")
+            try:
+                await asyncio.to_thread(self._run, job)
+                self.stats["done"] += 1
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"[server] {key[0]} #{key[1]} failed: {e!r}")
+            finally:
+                del self._running[key]
+                if key in self._pending:
+                    self._queue.put_nowait(key)
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def content_length(headers: Dict[str, str]) -> Tuple[Optional[int], int]:
+    """(длина тела, 0) или (None, код ошибки): 411 — длины нет, 400 — она не число, 413 — слишком большая."""
+    raw = headers.get("content-length")
+    if raw is None or "transfer-encoding" in headers:
+        return None, 411
+    if not raw.isdigit():
+        return None, 400
+    size = int(raw)
+    if size > SERVER_MAX_BODY_BYTES:
+        return None, 413
+    return size, 0
+
+
+def verify_signature(secret: str, body: bytes, header: Optional[str]) -> bool:
+    if not secret:
+        return True
+    expected = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, header or "")
+
+
+def _parse_payload(body: bytes, content_type: str) -> Dict[str, Any]:
+    if content_type.startswith("application/x-www-form-urlencoded"):
+        body = (parse_qs(body.decode("utf-8")).get("payload") or ["{}"])[0].encode("utf-8")
+    return json.loads(body or b"{}")
+
+
+def warm_up() -> None:
+    """Всё тяжёлое — один раз при старте: импорт и компиляция графа, сессия, правила, фильтр путей, кэш, LLM-клиент."""
+    t0 = time.perf_counter()
+    from .agents.codestyle_agent import diff_token_budget
+    from .config import get_openai_model
+    from .github_http import get_session
+    from .graph import get_review_graph
+    from .llm import get_chat_model
+    from .path_filter import get_path_matcher
+    from .review_cache import get_review_cache
+    from .routing import TIER_FAST, tier_model
+    from .rules import get_pattern_engine
+
+    get_review_graph()
+    get_session()
+    get_pattern_engine()
+    get_path_matcher()
+    get_review_cache()
+    diff_token_budget()
+    try:
+        for model in dict.fromkeys((get_openai_model(), tier_model(TIER_FAST))):
+            get_chat_model(model)
+    except Exception as e:
+        # без ключа клиент не создаётся — сервер всё равно поднимаем, ошибка будет в задаче
+        print(f"[server] LLM client not ready: {e!r}")
+    print(f"[server] warm-up done in {time.perf_counter() - t0:.2f}s")
+
+
+def payload_repo(payload: Dict[str, Any]) -> str:
+    return ((payload.get("repository") or {}).get("full_name") or "").strip()
+
+
+class WebhookServer:
+    """
+    repo — репозиторий, который обслуживает процесс (GITHUB_REPO / GITHUB_REPOSITORY):
+    все вызовы GitHub идут в него, поэтому события других репозиториев (тот же
+    вебхук на уровне организации) отбрасываются — иначе ревью PR #N чужого
+    репозитория ушло бы в PR #N этого, а ключи задач разных репозиториев совпали бы.
+    """
+
+    def __init__(self, queue: JobQueue, repo: str, secret: str = GITHUB_WEBHOOK_SECRET):
+        self.queue = queue
+        self.repo = repo
+        self.secret = secret
+
+    def accept(self, event: str, payload: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        repo = payload_repo(payload)
+        if event != "ping" and repo.lower() != self.repo.lower():
+            print(f"[server] {event}: repository {repo or '?'!r} is not {self.repo!r}, ignored")
+            return 200, {"status": "ignored", "reason": "foreign repository", "repository": repo}
+        job = job_for(event, payload)
+        if job is None:
+            return 200, {"status": "ignored", "event": event, "action": payload.get("action")}
+        status = self.queue.submit(job)
+        print(f"[server] {event}/{payload.get('action')} -> {job.key[0]} #{job.key[1]}: {status}")
+        return 202, {"status": status, "job": list(job.key)}
+
+    async def _respond(self, writer: asyncio.StreamWriter, code: int, data: Dict[str, Any]) -> None:
+        body = json.dumps(data).encode("utf-8")
+        reason = {200: "OK", 202: "Accepted", 400: "Bad Request", 401: "Unauthorized",
+                  404: "Not Found", 408: "Request Timeout", 411: "Length Required",
+                  413: "Payload Too Large"}.get(code, "")
+        writer.write(
+            f"HTTP/1.1 {code} {reason}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+
+    async def _read_head(self, reader: asyncio.StreamReader) -> Tuple[list, Dict[str, str]]:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = line.decode("latin-1").partition(":")
+            headers[k.strip().lower()] = v.strip()
+        return request_line, headers
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            try:
+                request_line, headers = await asyncio.wait_for(self._read_head(reader), READ_TIMEOUT_S)
+            except asyncio.TimeoutError:
+                return await self._respond(writer, 408, {"error": "request timeout"})
+            if len(request_line) < 2:
+                return await self._respond(writer, 400, {"error": "bad request"})
+            method, path = request_line[0], request_line[1].split("?", 1)[0]
+
+            if method == "GET" and path == "/healthz":
+                return await self._respond(writer, 200, self.queue.snapshot())
+            if method != "POST" or path != "/webhook":
+                return await self._respond(writer, 404, {"error": "not found"})
+
+            size, error = content_length(headers)
+            if size is None:
+                message = {411: "content-length required", 413: "payload too large"}.get(error, "bad content-length")
+                return await self._respond(writer, error, {"error": message})
+            try:
+                body = await asyncio.wait_for(reader.readexactly(size), READ_TIMEOUT_S) if size else b""
+            except asyncio.TimeoutError:
+                return await self._respond(writer, 408, {"error": "request timeout"})
+            if not verify_signature(self.secret, body, headers.get("x-hub-signature-256")):
+                return await self._respond(writer, 401, {"error": "bad signature"})
+            try:
+                payload = _parse_payload(body, headers.get("content-type", ""))
+            except ValueError:
+                return await self._respond(writer, 400, {"error": "invalid json"})
+            code, data = self.accept(headers.get("x-github-event", ""), payload)
+            await self._respond(writer, code, data)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host: str = SERVER_HOST, port: int = SERVER_PORT) -> None:
+    from .github_client import resolve_repo
+
+    if not GITHUB_WEBHOOK_SECRET and not is_loopback(host):
+        # неподписанные запросы с любого адреса тратили бы бюджет LLM и комментировали PR
+        raise SystemExit(f"[server] refusing to listen on {host} without GITHUB_WEBHOOK_SECRET"
+                         " (set the secret or bind to 127.0.0.1)")
+    repo = resolve_repo()
+    await asyncio.to_thread(warm_up)
+    queue = JobQueue()
+    queue.start()
+    server = await asyncio.start_server(WebhookServer(queue, repo).handle, host, port)
+    print(f"[server] listening on http://{host}:{port}/webhook for {repo} (workers: {queue.workers})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await queue.stop()
+
+
+def _load_replay(path: str, event: Optional[str]) -> Tuple[str, Dict[str, Any]]:
+    """Файл — payload вебхука или {"event": ..., "payload": {...}} (например, сохранённая доставка)."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict) and "payload" in data and "event" in data:
+        return data["event"], data["payload"]
+    if not event:
+        raise SystemExit(f"{path}: event name unknown, pass --event")
+    return event, data
+
+
+def replay(paths, url: str, event: Optional[str] = None, secret: str = GITHUB_WEBHOOK_SECRET) -> None:
+    """Отправка сохранённых payload'ов на запущенный сервер — с подписью, как это делает GitHub."""
+    for path in paths:
+        name, payload = _load_replay(path, event)
+        body = json.dumps(payload).encode("utf-8")
+        headers = {
+            "Content-Type": "application/json",
+            "X-GitHub-Event": name,
+            "X-GitHub-Delivery": str(uuid.uuid4()),
+        }
+        if secret:
+            headers["X-Hub-Signature-256"] = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        req = urllib.request.Request(url, data=body, headers=headers, method="POST")
+        try:
+            with urllib.request.urlopen(req, timeout=30) as r:
+                print(f"[replay] {path}: {r.status} {r.read().decode('utf-8')}")
+        except urllib.error.HTTPError as e:
+            print(f"[replay] {path}: {e.code} {e.read().decode('utf-8')}")
+
+
+def main(argv=None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m src.server")
+    sub = ap.add_subparsers(dest="cmd")
+    p_serve = sub.add_parser("serve", help="принимать вебхуки (по умолчанию)")
+    p_serve.add_argument("--host", default=SERVER_HOST)
+    p_serve.add_argument("--port", type=int, default=SERVER_PORT)
+    p_replay = sub.add_parser("replay", help="отправить сохранённые payload'ы на сервер")
+    p_replay.add_argument("files", nargs="+")
+    p_replay.add_argument("--event", help="X-GitHub-Event для файлов с «голым» payload")
+    p_replay.add_argument("--url", default=f"http://127.0.0.1:{SERVER_PORT}/webhook")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "replay":
+        replay(args.files, args.url, args.event)
+        return
+    try:
+        asyncio.run(serve(getattr(args, "host", SERVER_HOST), getattr(args, "port", SERVER_PORT)))
+    except KeyboardInterrupt:
+        print("[server] stopped")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
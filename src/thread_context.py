@@ -0,0 +1,167 @@
+"""
+Контекст инлайн-тредов для responder (SQLite), ключ — id корневого комментария треда.
+
+Запись: сводка старых сообщений, id (и updated_at) уже свёрнутых в неё сообщений,
+diff_hunk обсуждаемого кода и head sha PR. Сводка обновляется инкрементально:
+когда «сырых» сообщений становится больше 2 × RESPONDER_RECENT_MESSAGES, в неё
+дописываются только выпавшие из окна — промпт ответа ограничен по размеру
+при любой длине треда, а суммаризация выполняется раз в N сообщений.
+
+Запись сбрасывается, если сменился head commit PR (код под обсуждением мог
+измениться) или изменилась уже свёрнутая часть треда (сообщение отредактировано/удалено).
+"""
+import json
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from .config import (
+    RESPONDER_HUNK_MAX_LINES,
+    RESPONDER_RECENT_MESSAGES,
+    REVIEW_CACHE_MAX_AGE_DAYS,
+    REVIEW_CACHE_MAX_ENTRIES,
+    THREAD_CONTEXT_PATH,
+)
+
+# одно сообщение треда в промпте — не длиннее (длинные вставки кода обрезаются)
+MESSAGE_MAX_CHARS = 1500
+SUMMARY_MAX_CHARS = 2000
+
+
+def format_message(c: Dict[str, Any]) -> str:
+    user = (c.get("user") or {}).get("login") or "user"
+    text = (c.get("body") or "").strip()
+    if len(text) > MESSAGE_MAX_CHARS:
+        text = text[:MESSAGE_MAX_CHARS] + " …"
+    return f"{user}: {text}"
+
+
+def trim_hunk(diff_hunk: str, max_lines: int = RESPONDER_HUNK_MAX_LINES) -> str:
+    """diff_hunk GitHub заканчивается комментируемой строкой — оставляем хвост и заголовок '@@'."""
+    lines = (diff_hunk or "").splitlines()
+    if len(lines) <= max_lines + 1:
+        return "\n".join(lines)
+    head = [lines[0]] if lines[0].startswith("@@") else []
+    return "\n".join(head + lines[-max_lines:])
+
+
+def _mark(c: Dict[str, Any]) -> List[Any]:
+    return [c.get("id"), c.get("updated_at") or c.get("created_at") or ""]
+
+
+class ThreadContextStore:
+    def __init__(self, path: str, max_entries: int, max_age_days: float):
+        self.max_entries = max_entries
+        self.max_age = max_age_days * 86400
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS threads ("
+            " root_id INTEGER PRIMARY KEY, head_sha TEXT NOT NULL, folded TEXT NOT NULL,"
+            " summary TEXT NOT NULL, diff_hunk TEXT NOT NULL, used_at REAL NOT NULL)"
+        )
+        self._db.commit()
+        self.evict()
+
+    def load(self, root_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT head_sha, folded, summary, diff_hunk FROM threads WHERE root_id = ?", (root_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"head_sha": row[0], "folded": json.loads(row[1]), "summary": row[2], "diff_hunk": row[3]}
+
+    def save(self, root_id: int, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO threads(root_id, head_sha, folded, summary, diff_hunk, used_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (root_id, entry["head_sha"], json.dumps(entry["folded"]), entry["summary"],
+                 entry["diff_hunk"], time.time()),
+            )
+            self._db.commit()
+
+    def evict(self) -> int:
+        with self._lock:
+            cur = self._db.execute("DELETE FROM threads WHERE used_at < ?", (time.time() - self.max_age,))
+            removed = cur.rowcount
+            (count,) = self._db.execute("SELECT COUNT(*) FROM threads").fetchone()
+            if count > self.max_entries:
+                cur = self._db.execute(
+                    "DELETE FROM threads WHERE root_id IN"
+                    " (SELECT root_id FROM threads ORDER BY used_at ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+                removed += cur.rowcount
+            self._db.commit()
+        return removed
+
+
+def build_context(
+    store: Optional[ThreadContextStore],
+    thread: List[Dict[str, Any]],
+    comment: Dict[str, Any],
+    head_sha: str,
+    summarize: Callable[[str, List[str]], str],
+    recent: int = RESPONDER_RECENT_MESSAGES,
+) -> Dict[str, Any]:
+    """
+    Компактный контекст ответа: {"summary", "recent": [строки], "diff_hunk", "path", "line"}.
+    summarize(старая_сводка, новые_строки) -> новая сводка.
+    """
+    root_id = comment.get("in_reply_to_id") or comment.get("id")
+    if not thread:
+        # тред не прочитался — отвечаем по самому комментарию, сохранённый контекст не трогаем
+        return {"summary": "", "recent": [format_message(comment)],
+                "diff_hunk": trim_hunk(comment.get("diff_hunk") or ""),
+                "path": comment.get("path"), "line": comment.get("line")}
+    root = thread[0]
+    marks = [_mark(c) for c in thread]
+
+    entry = store.load(root_id) if store is not None else None
+    if entry is not None:
+        n = len(entry["folded"])
+        if entry["head_sha"] != head_sha:
+            print(f"[responder] thread {root_id}: head commit changed, context reset")
+            entry = None
+        elif marks[:n] != entry["folded"]:
+            print(f"[responder] thread {root_id}: folded messages changed, context reset")
+            entry = None
+    if entry is None:
+        hunk = comment.get("diff_hunk") or root.get("diff_hunk") or ""
+        entry = {"head_sha": head_sha, "folded": [], "summary": "", "diff_hunk": trim_hunk(hunk)}
+
+    folded = len(entry["folded"])
+    if len(thread) - folded > 2 * recent:
+        cut = len(thread) - recent
+        summary = summarize(entry["summary"], [format_message(c) for c in thread[folded:cut]])
+        entry["summary"] = summary[:SUMMARY_MAX_CHARS]
+        entry["folded"] = marks[:cut]
+        folded = cut
+    if store is not None:
+        store.save(root_id, entry)
+
+    return {
+        "summary": entry["summary"],
+        "recent": [format_message(c) for c in thread[folded:]],
+        "diff_hunk": entry["diff_hunk"],
+        "path": comment.get("path") or root.get("path"),
+        "line": comment.get("line") or root.get("line"),
+    }
+
+
+@lru_cache(maxsize=None)
+def get_thread_store() -> Optional[ThreadContextStore]:
+    """Хранилище процесса; пустой THREAD_CONTEXT_PATH — только в памяти процесса."""
+    try:
+        return ThreadContextStore(THREAD_CONTEXT_PATH or ":memory:", REVIEW_CACHE_MAX_ENTRIES,
+                                  REVIEW_CACHE_MAX_AGE_DAYS)
+    except (OSError, sqlite3.Error) as e:
+        print(f"[responder] thread context store disabled: {e}")
+        return None
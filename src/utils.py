@@ -1,23 +1,25 @@
 import json
 import re
-from typing import Dict, List, Any, Tuple, Optional
-from .config import REVIEW_ONLY_PREFIXES
+from typing import Dict, Iterable, List, Any, Tuple, Optional
+from . import metrics
+from .diff_index import DiffIndex, Hunk, index_from_files, parse_unified
+from .compaction import compacted_tokens, split_hunk
 
 
-def extract_json(text: str):
+def parse_json_array(text: str) -> Optional[List[Any]]:
     """
     Надёжно извлекаем JSON-массив из ответа LLM.
     1) Пробуем распарсить весь текст.
     2) Ищем блок формата fenced-кода (```json ... ```), но без жёсткой привязки.
     3) Иначе берём подстроку между первой '[' и последней ']'.
-    Возвращаем [] при неудаче.
+    Возвращаем None, если массив извлечь не удалось (в отличие от честного "[]").
     """
     if not text:
-        return []
+        return None
     # Попытка №1: весь текст
     try:
         data = json.loads(text)
-        return data if isinstance(data, list) else []
+        return data if isinstance(data, list) else None
     except Exception:
         pass
     # Попытка №2: fenced-подобный блок
@@ -25,7 +27,7 @@ def extract_json(text: str):
     if m:
         try:
             data = json.loads(m.group(1))
-            return data if isinstance(data, list) else []
+            return data if isinstance(data, list) else None
         except Exception:
             pass
     # Попытка №3: массив верхнего уровня
@@ -35,138 +37,206 @@ def extract_json(text: str):
         sub = text[start:end+1]
         try:
             data = json.loads(sub)
-            return data if isinstance(data, list) else []
+            return data if isinstance(data, list) else None
         except Exception:
             pass
-    return []
+    return None
+
+
+def extract_json(text: str):
+    """Как parse_json_array, но возвращаем [] при неудаче."""
+    data = parse_json_array(text)
+    return data if data is not None else []
 
 
 def path_included(path: str) -> bool:
-    """true, если файл попадает под белый список префиксов (по умолчанию: только src/)."""
-    path = (path or "").lstrip("./")
-    return any(path.startswith(pref.rstrip("/") + "/") or path == pref.rstrip("/") for pref in REVIEW_ONLY_PREFIXES)
+    """true, если файл в области ревью: REVIEW_ONLY_PREFIXES + files.include/exclude из правил (см. path_filter)."""
+    from .path_filter import get_path_matcher
+
+    return get_path_matcher()(path)
 
 
 def build_filtered_files(files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """вернёт только те элементы из /pulls/{n}/files, чей filename начинается с разрешённых префиксов."""
+    """
+    Вернёт только элементы /pulls/{n}/files из области ревью (path_included).
+    Отброшенные файлы и размер их патчей попадают в лог и метрики (files.excluded, bytes.excluded).
+    """
     out: List[Dict[str, Any]] = []
+    excluded = excluded_bytes = 0
     for f in files:
         fn = f.get("filename") or ""
         if path_included(fn):
             out.append(f)
+        else:
+            excluded += 1
+            excluded_bytes += len(f.get("patch") or "")
+    if excluded:
+        print(f"[filter] excluded {excluded} of {len(files)} files ({excluded_bytes} bytes of patches)")
+        m = metrics.current()
+        m.add("files.excluded", excluded)
+        m.add("bytes.excluded", excluded_bytes)
     return out
 
 
+def build_diff_index(files: List[Dict[str, Any]]) -> DiffIndex:
+    """
+    Строим индекс строк НОВОЙ версии по каждому файлу на основе unified patch
+    из /pulls/{number}/files — один проход, общий буфер (см. diff_index.DiffIndex).
+    """
+    return index_from_files(files)
+
+
+def build_diff_index_from_lines(lines: Iterable[str]) -> DiffIndex:
+    """Индекс по потоку строк полного unified diff; файлы вне области ревью отбрасываются на лету."""
+    return parse_unified(lines, include=path_included)
+
+
+def files_missing_patches(pr: Dict[str, Any], files: List[Dict[str, Any]], included: List[Dict[str, Any]]) -> bool:
+    """
+    True, если /files отдал неполную картину: список обрезан (лимит 3000 файлов)
+    или у изменённого текстового файла нет поля patch (слишком большой дифф).
+    Бинарные файлы (changes == 0) и удалённые файлы не в счёт.
+    """
+    if len(files) < int(pr.get("changed_files") or 0):
+        return True
+    return any(
+        not f.get("patch") and f.get("status") != "removed" and int(f.get("changes") or 0) > 0
+        for f in included
+    )
+
+
 def build_diff_text_from_files(files: List[Dict[str, Any]]) -> str:
     """
     Склеиваем дифф только по выбранным файлам.
-    Добавляем заголовок '+++ b/<path>' перед патчем, чтобы агенты знали путь.
+    Заголовок '+++ b/<path>' перед патчем, чтобы агенты знали путь.
     """
-    parts: List[str] = []
-    for f in files:
-        path = f.get("filename")
-        patch = f.get("patch")
-        if not path or not patch:
-            continue
-        parts.append(f"+++ b/{path}\n{patch}\n")
-    return "\n".join(parts)
+    return build_diff_index(files).text
 
 
-def build_diff_index(files: List[Dict[str, Any]]) -> Dict[str, List[Tuple[int, str]]]:
+def build_diff_shards(diff_index: DiffIndex, max_tokens: int, context_lines: int = -1) -> List[List[Hunk]]:
     """
-    Строим индекс строк НОВОЙ версии по каждому файлу на основе unified patch
-    из /pulls/{number}/files.
-    Возвращаем: { "path": [(new_line_number, line_text_without_prefix), ...] }.
+    Делим дифф на шарды для параллельного ревью.
+    Единица — ханк; ханки одного файла идут подряд, размер считается в токенах
+    после компактизации (context_lines), шард закрывается, когда следующий ханк
+    не влезает в max_tokens. Ханки только с удалениями в шарды не попадают.
+    Ханк больше бюджета делится на окна строк (compaction.split_hunk), окна
+    раскладываются по шардам как обычные ханки.
     """
-    index: Dict[str, List[Tuple[int, str]]] = {}
-    for f in files:
-        path = f.get("filename")
-        patch = f.get("patch")
-        if not path or not patch:
+    shards: List[List[Hunk]] = []
+    cur: List[Hunk] = []
+    size = 0
+    for hunk in diff_index.hunks():
+        cost = compacted_tokens(hunk, context_lines)
+        if cost is None:
             continue
-        lines = patch.splitlines()
-        cur_new = None
-        acc: List[Tuple[int, str]] = []
-        for ln in lines:
-            if ln.startswith("@@"):
-                # пример заголовка: @@ -a,b +c,d @@
-                m = re.search(r"\+(\d+)", ln)
-                cur_new = int(m.group(1)) if m else None
-            elif cur_new is not None:
-                if ln.startswith("+"):
-                    acc.append((cur_new, ln[1:]))
-                    cur_new += 1
-                elif ln.startswith(" "):
-                    acc.append((cur_new, ln[1:]))
-                    cur_new += 1
-                elif ln.startswith("-"):
-                    # удалённая строка — номер новой версии не увеличиваем
-                    pass
-        index[path] = acc
-    return index
-
-
-def resolve_positions(agent_items: List[Dict[str, Any]], diff_index: Dict[str, List[Tuple[int, str]]]) -> List[Dict[str, Any]]:
-    """
-    Преобразуем элементы агента к виду для GitHub inline-комментов.
-
-    Вход:
-    - [{"path", "line_match", "body"}]
-
-    Поведение:
+        units = [(hunk, cost)]
+        if cost > max_tokens:
+            windows = split_hunk(hunk, context_lines, max_tokens)
+            print(f"[shards] {hunk.path}: hunk of {cost} tokens split into {len(windows)} windows")
+            units = [(w, c) for w in windows for c in (compacted_tokens(w, context_lines),) if c is not None]
+        for unit, cost in units:
+            if cur and size + cost > max_tokens:
+                shards.append(cur)
+                cur, size = [], 0
+            cur.append(unit)
+            size += cost
+    if cur:
+        shards.append(cur)
+    return shards
+
+
+def merge_comments(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Склеиваем комментарии, попавшие на одну строку (path, line), в один."""
+    merged: Dict[Tuple[str, int], Dict[str, Any]] = {}
+    for it in items:
+        key = (it["path"], int(it["line"]))
+        if key in merged:
+            prev = merged[key]
+            if it["body"] not in prev["body"]:
+                prev["body"] = f"{prev['body']}\n\n{it['body']}"
+        else:
+            merged[key] = {"path": it["path"], "line": int(it["line"]), "body": it["body"]}
+    return list(merged.values())
+
+
+class LineMatchIndex:
+    """
+    Поиск line_match по DiffIndex с мемоизацией по (path, line_match).
+    Сам поиск — str.find по общему буферу диффа (C-уровень) + bisect
+    по смещениям строк, см. diff_index.FileEntry.find.
+    """
+
+    __slots__ = ("_index", "_memo")
+
+    def __init__(self, diff_index: DiffIndex):
+        self._index = diff_index
+        self._memo: Dict[Tuple[str, str], Optional[int]] = {}
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._index
+
+    def find(self, path: str, line_match: str) -> Optional[int]:
+        """Номер первой строки файла, содержащей line_match (сначала точно, затем без пробелов)."""
+        key = (path, line_match)
+        if key not in self._memo:
+            self._memo[key] = self._index.find(path, line_match)
+        return self._memo[key]
+
+    def find_unique(self, line_match: str) -> Optional[Tuple[str, int]]:
+        """Совпадение по всем файлам диффа; возвращаем его, только если файл ровно один."""
+        match: Optional[Tuple[str, int]] = None
+        for path in self._index:
+            ln = self.find(path, line_match)
+            if ln is not None:
+                if match is not None:
+                    return None
+                match = (path, ln)
+        return match
+
+
+def resolve_position(it: Dict[str, Any], index: LineMatchIndex) -> Optional[Dict[str, Any]]:
+    """
+    Один элемент агента {"path", "line_match", "body"} -> {"path", "line", "body"}
+    (строка НОВОЙ версии) или None, если привязать не удалось.
+
     - Привязка выполняется ТОЛЬКО по содержимому новой версии (line_match).
     - Если задан path, ищем совпадение внутри этого файла; иначе пробуем найти
       уникальное совпадение по всем файлам диффа и используем его.
-    - Числовые координаты "line" игнорируем полностью.
+    - Числовые координаты "line" игнорируем полностью: они небезопасны
+      (съезжают из‑за удалений выше).
+    """
+    path = (it.get("path") or "").strip()
+    body = it.get("body") or it.get("message")
+    line_match = (it.get("line_match") or "").strip()
+    if not body or not line_match:
+        return None
+
+    # Вариант А: известен путь
+    if path and path in index:
+        best = index.find(path, line_match)
+        if best is not None:
+            return {"path": path, "line": best, "body": body}
+
+    # Вариант Б: путь не задан (или не нашёлся) — выбираем уникальное совпадение по всем файлам
+    match = index.find_unique(line_match)
+    if match is not None:
+        p, ln = match
+        return {"path": p, "line": ln, "body": body}
+    return None
+
+
+def resolve_positions(agent_items: List[Dict[str, Any]], diff_index: DiffIndex) -> List[Dict[str, Any]]:
+    """
+    Преобразуем элементы агента к виду для GitHub inline-комментов (см. resolve_position).
+    Поиск идёт по LineMatchIndex, построенному один раз на вызов.
 
-    Выход:
-    - [{"path", "line", "body"}] — номера строк даны по НОВОЙ версии.
+    Вход: [{"path", "line_match", "body"}]
+    Выход: [{"path", "line", "body"}] — номера строк даны по НОВОЙ версии.
     """
+    index = LineMatchIndex(diff_index)
     resolved: List[Dict[str, Any]] = []
     for it in agent_items:
-        path = (it.get("path") or "").strip()
-        body = it.get("body") or it.get("message")
-        if not body:
-            continue
-
-        line_match = (it.get("line_match") or "").strip()
-
-        # 1) Сопоставляем только по содержимому новой версии
-        if line_match:
-            # Вариант А: известен путь
-            def find_in_candidates(cands: List[Tuple[int, str]]) -> Optional[int]:
-                best_local: Optional[int] = None
-                for new_line, text in cands:
-                    if line_match in text:
-                        best_local = new_line
-                        break
-                if best_local is None:
-                    lm_norm = re.sub(r"\s+", "", line_match)
-                    for new_line, text in cands:
-                        if lm_norm in re.sub(r"\s+", "", text):
-                            best_local = new_line
-                            break
-                return best_local
-
-            if path and path in diff_index:
-                best = find_in_candidates(diff_index.get(path) or [])
-                if best is not None:
-                    resolved.append({"path": path, "line": best, "body": body})
-                    continue
-
-            # Вариант Б: путь не задан — ищем по всем файлам и выбираем уникальное совпадение
-            matches: List[Tuple[str, int]] = []
-            for p, cands in (diff_index or {}).items():
-                best = find_in_candidates(cands or [])
-                if best is not None:
-                    matches.append((p, best))
-            if len(matches) == 1:
-                p, ln = matches[0]
-                resolved.append({"path": p, "line": ln, "body": body})
-                continue
-
-        # 2) Если нет line_match и сопоставления не получилось — пропускаем элемент
-        # Чисто числовые координаты небезопасны (съезжают из‑за удалений выше).
-        continue
+        r = resolve_position(it, index)
+        if r is not None:
+            resolved.append(r)
     return resolved
-
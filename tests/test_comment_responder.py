@@ -0,0 +1,23 @@
+import json
+
+import pytest
+
+from src import comment_responder, metrics
+
+
+def test_report_is_written_when_handler_fails(tmp_path, monkeypatch):
+    event = tmp_path / "event.json"
+    event.write_text(json.dumps({"action": "created"}), encoding="utf-8")
+    monkeypatch.setenv("GITHUB_EVENT_NAME", "pull_request_review_comment")
+    monkeypatch.setenv("GITHUB_EVENT_PATH", str(event))
+    reports = []
+    monkeypatch.setattr(metrics, "write_report", lambda m=None: reports.append(m))
+
+    def boom(name, evt):
+        metrics.current().add("github.calls")
+        raise RuntimeError("GitHub is down")
+
+    monkeypatch.setattr(comment_responder, "handle_event", boom)
+    with pytest.raises(RuntimeError):
+        comment_responder.main()
+    assert len(reports) == 1 and reports[0].counters["github.calls"] == 1
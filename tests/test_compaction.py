@@ -0,0 +1,88 @@
+from src.compaction import compact_hunk, compact_shard, estimate_tokens, split_hunk
+from src.diff_index import _HUNK_RE, parse_unified, render_hunks
+from src.utils import build_diff_shards
+
+
+def _diff(body_lines, old=10, new=10, path="app.py"):
+    old_count = sum(ln[:1] in (" ", "-") for ln in body_lines)
+    new_count = sum(ln[:1] in (" ", "+") for ln in body_lines)
+    return [
+        f"diff --git a/{path} b/{path}",
+        f"--- a/{path}",
+        f"+++ b/{path}",
+        f"@@ -{old},{old_count} +{new},{new_count} @@ def main():",
+        *body_lines,
+    ]
+
+
+def _check_headers(text):
+    """Заголовки '@@' сходятся с числом строк под ними."""
+    lines = text.split("\n")
+    i = 0
+    while i < len(lines):
+        m = _HUNK_RE.match(lines[i])
+        i += 1
+        if not m:
+            continue
+        old_left = int(m.group(1)) if m.group(1) is not None else 1
+        new_left = int(m.group(3)) if m.group(3) is not None else 1
+        while i < len(lines) and not lines[i].startswith("@@"):
+            prefix = lines[i][:1]
+            old_left -= prefix in (" ", "-")
+            new_left -= prefix in (" ", "+")
+            i += 1
+        assert (old_left, new_left) == (0, 0), text
+
+
+def test_trimmed_context_gets_sub_hunk_headers():
+    body = [" a", "+b", " c", " d", " e", " f", " g", "-h", "+H", " i"]
+    index = parse_unified(_diff(body))
+    (hunk,) = index.hunks()
+    text = compact_hunk(hunk.text, 1)
+    assert text.split("\n") == [
+        "@@ -10,2 +10,3 @@ def main():", " a", "+b", " c",
+        "@@ -15,3 +16,3 @@ def main():", " g", "-h", "+H", " i",
+    ]
+    _check_headers(text)
+    # без пропусков ханк не меняется
+    assert compact_hunk(hunk.text, 5) == hunk.text
+    assert compact_hunk(hunk.text, -1) == hunk.text
+
+
+def test_deletions_only_hunk_is_dropped():
+    index = parse_unified(_diff([" a", "-b", " c"]))
+    assert compact_hunk(next(index.hunks()).text, 1) is None
+
+
+def test_big_hunk_is_split_into_windows():
+    body = []
+    for i in range(200):
+        body += [f" context line {i}", f"-old value {i}", f"+new value {i} = compute({i})"]
+    body.append("\\ No newline at end of file")
+    index = parse_unified(_diff(body))
+    (hunk,) = index.hunks()
+    budget = 300
+    windows = split_hunk(hunk, 1, budget)
+    assert len(windows) > 1
+    # окна покрывают все строки ханка, ничего не теряется
+    assert "\n".join(w.text.split("\n", 1)[1] for w in windows) == hunk.text.split("\n", 1)[1]
+    assert windows[0].text.startswith("@@ -10,")
+    for w in windows:
+        _check_headers(w.text)
+        text, stats = compact_shard([w], 1, budget)
+        assert stats["truncated"] == 0, stats
+        _check_headers(text)
+
+    shards = build_diff_shards(index, budget, 1)
+    assert sum(len(sh) for sh in shards) == len(windows)
+    rendered = render_hunks([u for sh in shards for u in sh])
+    assert rendered.startswith("+++ b/app.py\n@@ -10,")
+    assert all(compact_shard(sh, 1, budget)[1]["truncated_lines"] == 0 for sh in shards)
+
+
+def test_truncation_is_recorded():
+    long_line = "+" + "x = 1; " * 400
+    index = parse_unified(_diff([long_line, long_line, long_line]))
+    hunks = list(index.hunks())
+    text, stats = compact_shard(hunks, 1, estimate_tokens(long_line) + 20)
+    assert stats["truncated"] == 1 and stats["truncated_lines"] == 2
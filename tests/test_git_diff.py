@@ -0,0 +1,76 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from src import git_diff
+from src.git_diff import GitDiffError, merge_base, stream_git_diff
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+
+ENV = {
+    **os.environ,
+    "GIT_AUTHOR_NAME": "t", "GIT_AUTHOR_EMAIL": "t@example.com",
+    "GIT_COMMITTER_NAME": "t", "GIT_COMMITTER_EMAIL": "t@example.com",
+    "GIT_CONFIG_GLOBAL": os.devnull, "GIT_CONFIG_NOSYSTEM": "1",
+}
+
+
+def _git(cwd, *args):
+    return subprocess.run(["git", *args], cwd=cwd, env=ENV, check=True,
+                          capture_output=True, text=True).stdout.strip()
+
+
+def _commit(repo, path, text):
+    with open(os.path.join(repo, path), "w", encoding="utf-8") as f:
+        f.write(text)
+    _git(repo, "add", path)
+    _git(repo, "commit", "-q", "-m", path)
+    return _git(repo, "rev-parse", "HEAD")
+
+
+@pytest.fixture(scope="module")
+def origin(tmp_path_factory):
+    """main с длинной историей после ответвления feature: merge-base глубже 50 коммитов."""
+    repo = str(tmp_path_factory.mktemp("origin"))
+    _git(repo, "init", "-q", "-b", "main")
+    fork = _commit(repo, "main.txt", "0\n")
+    _git(repo, "checkout", "-q", "-b", "feature")
+    _commit(repo, "feature.txt", "one\n")
+    head = _commit(repo, "feature.txt", "one\nдва\n")
+    _git(repo, "checkout", "-q", "main")
+    for i in range(1, 120):
+        base = _commit(repo, "main.txt", f"{i}\n")
+    return {"dir": repo, "fork": fork, "base": base, "head": head}
+
+
+def _shallow_clone(origin, tmp_path):
+    clone = str(tmp_path / "clone")
+    _git(str(tmp_path), "clone", "-q", "--depth=1", "--branch", "main", f"file://{origin['dir']}", clone)
+    return clone
+
+
+def test_merge_base_deepens_shallow_clone(origin, tmp_path, monkeypatch):
+    clone = _shallow_clone(origin, tmp_path)
+    fetches = []
+    real_fetch = git_diff._fetch
+    monkeypatch.setattr(git_diff, "_fetch", lambda repo, *args: (fetches.append(args), real_fetch(repo, *args)))
+    assert merge_base(clone, origin["base"], origin["head"]) == origin["fork"]
+    assert fetches[0][0] == "--depth=50"  # head PR в клоне не было
+    assert any(a[0].startswith("--deepen=") for a in fetches[1:])
+
+
+def test_diff_is_against_merge_base_not_base_tip(origin, tmp_path):
+    clone = _shallow_clone(origin, tmp_path)
+    lines = list(stream_git_diff(clone, origin["base"], origin["head"]))
+    changed = [ln[6:] for ln in lines if ln.startswith("+++ b/")]
+    assert changed == ["feature.txt"]  # изменения main после ответвления в дифф PR не попадают
+    assert "+два" in lines
+
+
+def test_merge_base_gives_up_without_common_history(origin, tmp_path, monkeypatch):
+    clone = _shallow_clone(origin, tmp_path)
+    monkeypatch.setattr(git_diff, "MAX_DEEPEN_STEPS", 0)
+    with pytest.raises(GitDiffError):
+        merge_base(clone, origin["base"], origin["head"])
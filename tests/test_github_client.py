@@ -0,0 +1,55 @@
+import io
+
+import requests
+
+from src import github_client
+
+
+def _http_error(status):
+    resp = requests.Response()
+    resp.status_code = status
+    return requests.HTTPError(f"{status}", response=resp)
+
+
+def _comment(cid, created, reply_to=None):
+    return {"id": cid, "in_reply_to_id": reply_to, "created_at": created, "updated_at": created, "body": f"c{cid}"}
+
+
+def test_thread_with_deleted_root_starts_at_earliest_reply(monkeypatch):
+    replies = [_comment(12, "2026-01-01T10:05:00Z", 10), _comment(11, "2026-01-01T10:01:00Z", 10)]
+    other = _comment(20, "2026-01-01T09:00:00Z")
+
+    def get_comment(cid):
+        raise _http_error(404)
+
+    monkeypatch.setattr(github_client, "get_review_comment", get_comment)
+    monkeypatch.setattr(github_client, "list_pull_review_comments", lambda pr, since=None: replies + [other])
+    current = _comment(13, "2026-01-01T10:09:00Z", 10)  # ещё не попал в список комментариев
+    thread = github_client.get_review_thread(9001, 13, comment=current)
+    assert [c["id"] for c in thread] == [11, 12, 13]
+
+
+def test_thread_root_errors_other_than_404_fail(monkeypatch):
+    def get_comment(cid):
+        raise _http_error(500)
+
+    monkeypatch.setattr(github_client, "get_review_comment", get_comment)
+    monkeypatch.setattr(github_client, "list_pull_review_comments", lambda pr, since=None: [])
+    assert github_client.get_review_thread(9002, 13, comment=_comment(13, "2026-01-01T10:09:00Z", 10)) == []
+
+
+def test_stream_pr_diff_decodes_utf8(monkeypatch):
+    body = "+++ b/app.ts\n@@ -1 +1 @@\n+const s = 'привет';\r\n+// ok".encode("utf-8")
+
+    def request(method, url, **kwargs):
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.headers["Content-Type"] = "text/plain"
+        resp.encoding = requests.utils.get_encoding_from_headers(resp.headers)  # как у адаптера: ISO-8859-1
+        resp.raw = io.BytesIO(body)
+        return resp
+
+    monkeypatch.setattr(github_client, "_request", request)
+    monkeypatch.setattr(github_client, "resolve_repo", lambda: "acme/app")
+    lines = list(github_client.stream_pr_diff(1, chunk_size=7))
+    assert lines == ["+++ b/app.ts", "@@ -1 +1 @@", "+const s = 'привет';\r", "+// ok"]
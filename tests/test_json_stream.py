@@ -0,0 +1,59 @@
+import random
+
+import pytest
+
+from src.json_stream import JsonArrayStream
+from src.utils import parse_json_array
+
+ITEMS = '[{"line": 3, "message": "use f-string"}, {"line": 7, "message": "a ] inside \\" string"}]'
+
+RESPONSES = {
+    "bare": ITEMS,
+    "fenced": "Вот замечания:\n```json\n" + ITEMS + "\n```\n",
+    "prose_prefixed": "[see below]\n```json\n" + ITEMS + "\n```",
+    "empty": "Замечаний нет: []",
+    "truncated": ITEMS[:40],
+    "broken_item": '[{"line": 1}, {line: 2}]',
+    "no_array": "Всё хорошо, замечаний нет.",
+}
+
+
+def _stream(text, sizes):
+    s = JsonArrayStream()
+    out, pos = [], 0
+    for size in sizes:
+        out += s.feed(text[pos:pos + size])
+        pos += size
+    out += s.feed(text[pos:])
+    return s, out
+
+
+def _chunkings(text):
+    yield [len(text)]
+    yield [1] * len(text)
+    rnd = random.Random(len(text))
+    for _ in range(20):
+        yield [rnd.randint(1, 12) for _ in range(len(text))]
+
+
+@pytest.mark.parametrize("name", sorted(RESPONSES))
+def test_stream_matches_parse_json_array(name):
+    text = RESPONSES[name]
+    expected = parse_json_array(text)
+    for sizes in _chunkings(text):
+        s, items = _stream(text, sizes)
+        assert s.complete == (expected is not None), (name, sizes)
+        if expected is not None:
+            assert items == [x for x in expected if isinstance(x, dict)]
+
+
+def test_prose_prefixed_array_is_complete():
+    s, items = _stream(RESPONSES["prose_prefixed"], [5] * 100)
+    assert s.complete and s.errors == 0
+    assert [it["line"] for it in items] == [3, 7]
+
+
+def test_numbered_references_before_unfenced_array():
+    # parse_json_array здесь сдаётся (берёт текст от первой '[' до последней ']'), поток — нет
+    s, items = _stream("См. [1] и [2, 3]:\n" + ITEMS + "\nГотово.", [7] * 100)
+    assert s.complete and [it["line"] for it in items] == [3, 7]
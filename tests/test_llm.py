@@ -0,0 +1,134 @@
+import threading
+import time
+
+import pytest
+
+from src import llm, metrics
+from src.llm import LLMUnavailable, resilient_call
+
+
+@pytest.fixture
+def fast_policy(monkeypatch):
+    monkeypatch.setattr(llm, "LLM_TIMEOUT_S", 0.3)
+    monkeypatch.setattr(llm, "LLM_STREAM_IDLE_S", 0.15)
+    monkeypatch.setattr(llm, "LLM_MAX_RETRIES", 2)
+    monkeypatch.setattr(llm, "LLM_RETRY_BACKOFF_S", 0.01)
+    monkeypatch.setattr(llm, "LLM_HEDGE_AFTER_S", 0.0)
+    monkeypatch.setattr(llm, "LLM_RATE_PER_SEC", 0.0)
+    monkeypatch.setattr(llm, "_slots", threading.BoundedSemaphore(2))
+    m = metrics.Metrics()
+    with metrics.use_metrics(m):
+        yield m
+
+
+class _ApiError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def test_hedge_wins_over_slow_attempt(fast_policy, monkeypatch):
+    monkeypatch.setattr(llm, "LLM_HEDGE_AFTER_S", 0.05)
+    calls = []
+
+    def fn(attempt):
+        calls.append(attempt)
+        if len(calls) == 1:
+            time.sleep(0.25)
+            return "slow"
+        return "hedge"
+
+    assert resilient_call(fn, "test-hedge") == "hedge"
+    assert calls[0]()  # медленная попытка брошена
+    assert fast_policy.counters["llm.hedged"] == 1
+    assert fast_policy.counters["llm.hedge_won"] == 1
+
+
+def test_hedge_needs_a_free_slot(fast_policy, monkeypatch):
+    monkeypatch.setattr(llm, "LLM_HEDGE_AFTER_S", 0.05)
+    monkeypatch.setattr(llm, "_slots", threading.BoundedSemaphore(1))
+    calls = []
+
+    def fn(attempt):
+        calls.append(attempt)
+        time.sleep(0.1)
+        return "only"
+
+    assert resilient_call(fn, "test-hedge-slot") == "only"
+    assert len(calls) == 1
+    assert fast_policy.counters["llm.hedge_skipped"] == 1
+
+
+def test_abandoned_attempt_keeps_its_slot(fast_policy, monkeypatch):
+    slots = threading.BoundedSemaphore(1)
+    monkeypatch.setattr(llm, "_slots", slots)
+    monkeypatch.setattr(llm, "LLM_MAX_RETRIES", 0)
+    release = threading.Event()
+
+    def fn(attempt):
+        release.wait(5)
+        return "late"
+
+    with pytest.raises(LLMUnavailable):
+        resilient_call(fn, "test-abandon")
+    # попытку бросили по дедлайну, но она ещё идёт — слот занят
+    assert not slots.acquire(blocking=False)
+    release.set()
+    assert slots.acquire(timeout=2)
+    slots.release()
+
+
+def test_client_errors_are_not_retried(fast_policy):
+    calls = []
+
+    def fn(attempt):
+        calls.append(1)
+        raise _ApiError(401)
+
+    with pytest.raises(LLMUnavailable):
+        resilient_call(fn, "test-401")
+    assert len(calls) == 1
+
+
+def test_server_errors_are_retried(fast_policy):
+    calls = []
+
+    def fn(attempt):
+        calls.append(1)
+        if len(calls) < 3:
+            raise _ApiError(503)
+        return "ok"
+
+    assert resilient_call(fn, "test-503") == "ok"
+    assert fast_policy.counters["llm.retries"] == 2
+
+
+def test_stream_is_not_cut_while_data_arrives(fast_policy, monkeypatch):
+    monkeypatch.setattr(llm, "LLM_MAX_RETRIES", 0)
+
+    def fn(attempt):
+        # 0.6 s ответа при LLM_TIMEOUT_S=0.3: куски идут чаще, чем LLM_STREAM_IDLE_S
+        for _ in range(12):
+            time.sleep(0.05)
+            attempt.alive()
+        return "streamed"
+
+    assert resilient_call(fn, "test-stream", hedge=False, stream=True) == "streamed"
+
+
+def test_stalled_stream_times_out(fast_policy, monkeypatch):
+    monkeypatch.setattr(llm, "LLM_MAX_RETRIES", 0)
+    seen = []
+
+    def fn(attempt):
+        attempt.alive()
+        time.sleep(0.5)
+        seen.append(attempt())
+        return "late"
+
+    t0 = time.monotonic()
+    with pytest.raises(LLMUnavailable, match="stalled"):
+        resilient_call(fn, "test-stall", hedge=False, stream=True)
+    assert time.monotonic() - t0 < 0.4
+    time.sleep(0.3)
+    assert seen == [True]
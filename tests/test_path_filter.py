@@ -0,0 +1,49 @@
+import pytest
+
+from src.path_filter import PathMatcher, PrefixTrie, compile_globs
+
+
+@pytest.mark.parametrize("glob, path, expected", [
+    ("**/*.ts", "app.ts", True),                # '**/' — и ноль каталогов
+    ("**/*.ts", "src/a/b/app.ts", True),
+    ("*.ts", "src/deep/app.ts", True),          # без '/' — имя файла на любой глубине
+    ("src/*.ts", "src/deep/app.ts", False),     # '*' не переходит через '/'
+    ("src/**", "src/deep/app.ts", True),
+    ("dist/", "pkg/dist/bundle.js", True),      # каталог на любой глубине
+    ("/dist/", "pkg/dist/bundle.js", False),    # ведущий '/' — от корня
+    ("./src/*.ts", "src/app.ts", True),
+    ("**/*.{ts,tsx}", "web/App.tsx", True),
+    ("**/*.{ts,{js,jsx}}", "web/App.jsx", True),  # вложенные альтернативы
+    ("**/*.{ts,tsx}", "web/App.js", False),
+    ("file?.ts", "file1.ts", True),
+    ("file?.ts", "file/.ts", False),
+    ("v[0-9].ts", "v7.ts", True),
+    ("v[!0-9].ts", "v7.ts", False),
+    ("v[!0-9].ts", "vx.ts", True),
+    ("a+b(c).ts", "a+b(c).ts", True),            # метасимволы regex — буквально
+    ("{unclosed.ts", "{unclosed.ts", True),
+    ("[unclosed.ts", "[unclosed.ts", True),
+])
+def test_glob(glob, path, expected):
+    assert bool(compile_globs([glob]).match(path)) is expected
+
+
+def test_prefix_trie_matches_whole_segments():
+    trie = PrefixTrie(["src/", "./lib", "/tools/scripts"])
+    assert trie.matches("src/app.ts")
+    assert trie.matches("lib/x.ts")
+    assert trie.matches("tools/scripts/run.ts")
+    assert not trie.matches("srcx/app.ts")
+    assert not trie.matches("tools/other.ts")
+    assert PrefixTrie(["", "  "]).matches("anything.ts")  # пустые префиксы — без ограничения
+
+
+def test_matcher_combines_prefixes_and_globs():
+    match = PathMatcher(["src/"], include=["**/*.{ts,tsx}"], exclude=["**/dist/**", "*.d.ts"])
+    assert match("src/app.ts")
+    assert match("./src/ui/App.tsx")
+    assert not match("src/dist/app.ts")
+    assert not match("src/types/index.d.ts")
+    assert not match("src/app.js")
+    assert not match("lib/app.ts")
+    assert not match("")
@@ -0,0 +1,57 @@
+from src import graph
+from src.diff_index import parse_unified
+from src.review_cache import split_by_hunk
+
+
+def _index():
+    return parse_unified([
+        "+++ b/a.ts", "@@ -1,1 +1,2 @@", " const a = 1;", "+var b = 2;",
+        "@@ -10,1 +11,2 @@", " const c = 3;", "+var d = 4;",
+        "+++ b/b.ts", "@@ -1,1 +1,2 @@", " x();", "+console.log(y);",
+    ])
+
+
+def test_split_by_hunk_uses_the_only_hunk_of_the_file():
+    units = list(_index().hunks())
+    items = [
+        {"path": "a.ts", "line_match": "var d = 4;", "body": "d"},
+        {"path": "b.ts", "line_match": "no such line", "body": "only hunk of b.ts"},
+        {"path": "a.ts", "line_match": "no such line", "body": "ambiguous"},
+    ]
+    per_unit, orphans = split_by_hunk(items, units)
+    assert [len(x) for x in per_unit] == [0, 1, 1]
+    assert [it["body"] for it in orphans] == ["ambiguous"]
+
+
+class _Cache:
+    def __init__(self):
+        self.stored = {}
+
+    def key(self, path, text, model):
+        return f"{path}:{text}"
+
+    def get_many(self, keys):
+        return {}
+
+    def put_many(self, entries):
+        self.stored.update(entries)
+
+
+def test_hunks_with_orphaned_comments_are_not_cached(monkeypatch):
+    units = list(_index().hunks())
+    cache = _Cache()
+    answer = [
+        {"path": "a.ts", "line_match": "moved elsewhere", "body": "lost?"},
+        {"path": "b.ts", "line_match": "console.log(y);", "body": "no console"},
+    ]
+    monkeypatch.setattr(graph, "get_review_cache", lambda: cache)
+    monkeypatch.setattr(graph, "route_shard", lambda u: ("strong", "m", {}))
+    monkeypatch.setattr(graph, "_ask_agent", lambda miss, on_item, tier, model: (answer, {}, model))
+    graph._review_units(units, lambda it: None)
+    # оба ханка a.ts могли быть источником замечания — в кэш попадает только b.ts
+    assert sorted(k.split(":")[0] for k in cache.stored) == ["b.ts"]
+
+    cache.stored.clear()
+    answer[0]["path"] = "unknown.ts"
+    graph._review_units(units, lambda it: None)
+    assert cache.stored == {}
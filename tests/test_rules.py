@@ -0,0 +1,45 @@
+from src.rules import PatternEngine
+
+PATTERNS = [
+    {"id": "console", "message": "console", "regex": r"console\.(log|warn)\("},
+    {"id": "doubled-word", "message": "doubled", "regex": r"\b(\w+)\s+\1\b"},
+    {"id": "same-quotes", "message": "quotes", "regex": r"(?P<q>['\"])\s*(?P=q)"},
+    {"id": "no-var", "message": "var", "regex": r"\bvar\s+"},
+]
+
+LINES = [
+    "var x = 1;",
+    "return the the value;",
+    "const s = '';",
+    'const s = "";',
+    "// TODO: fix",
+    "console.log(x)",
+    "let a = b;",
+    "if (a a) {}",
+]
+
+
+def test_patterns_with_own_groups_match_like_separate_regexes():
+    engine = PatternEngine(PATTERNS)
+    single = [PatternEngine([p]) for p in PATTERNS]
+    for line in LINES:
+        expected = [hit for e in single for hit in e.match_line(line)]
+        assert engine.match_line(line) == expected, line
+    assert engine.match_line("return the the value;") == [("doubled-word", "doubled")]
+    assert engine.match_line("let a = b;") == []
+
+
+def test_repeated_group_names():
+    engine = PatternEngine(PATTERNS + [{"id": "todo", "message": "todo", "regex": r"(?P<q>TODO)\b"}])
+    assert engine.match_line("// TODO: fix") == [("todo", "todo")]
+    assert engine.match_line("return the the value;") == [("doubled-word", "doubled")]
+
+
+def test_bad_combination_falls_back_to_separate_checks():
+    # глобальный флаг не в начале выражения не собирается в общий регекс
+    engine = PatternEngine([
+        {"id": "a", "message": "a", "regex": r"foo"},
+        {"id": "b", "message": "b", "regex": r"(?i)bar"},
+    ])
+    assert engine.match_line("BAR") == [("b", "b")]
+    assert engine.match_line("foo") == [("a", "a")]
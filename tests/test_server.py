@@ -0,0 +1,161 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.server import Job, JobQueue, WebhookServer
+
+
+def _pr_event(number, repo="acme/app", action="synchronize"):
+    return {"action": action, "pull_request": {"number": number}, "repository": {"full_name": repo}}
+
+
+class _Runner:
+    """Задачи ждут release; видно, какие запустились и были ли отменены."""
+
+    def __init__(self):
+        self.started = []
+        self.cancelled = []
+        self.release = threading.Event()
+
+    def __call__(self, job: Job):
+        self.started.append(job)
+        self.release.wait(5)
+        self.cancelled.append(job.cancel.is_set())
+
+
+async def _until(cond, timeout=5.0):
+    loop = asyncio.get_running_loop()
+    end = loop.time() + timeout
+    while not cond():
+        assert loop.time() < end, "timeout"
+        await asyncio.sleep(0.01)
+
+
+def test_foreign_repository_is_ignored():
+    async def run():
+        q = JobQueue(runner=lambda job: None, workers=1)
+        srv = WebhookServer(q, "acme/app", secret="s")
+        code, data = srv.accept("pull_request", _pr_event(7, repo="other/app"))
+        assert (code, data["status"]) == (200, "ignored")
+        code, data = srv.accept("pull_request", {"action": "opened", "pull_request": {"number": 7}})
+        assert data["status"] == "ignored"  # без repository — тоже чужое
+        code, data = srv.accept("pull_request", _pr_event(7, repo="ACME/app"))
+        assert (code, data["status"]) == (202, "queued")
+        assert q.snapshot()["pending"] == [["review", 7]]
+
+    asyncio.run(run())
+
+
+def test_pending_review_is_coalesced():
+    async def run():
+        runner = _Runner()
+        q = JobQueue(runner=runner, workers=1)
+        srv = WebhookServer(q, "acme/app")
+        # первый PR занимает единственный обработчик, второй ждёт в очереди
+        srv.accept("pull_request", _pr_event(1))
+        q.start()
+        await _until(lambda: runner.started)
+        assert srv.accept("pull_request", _pr_event(2))[1]["status"] == "queued"
+        newer = _pr_event(2)
+        newer["marker"] = "latest"
+        assert srv.accept("pull_request", newer)[1]["status"] == "coalesced"
+        runner.release.set()
+        await _until(lambda: len(runner.started) == 2 and len(runner.cancelled) == 2)
+        assert runner.started[1].payload["marker"] == "latest"
+        await q.stop()
+
+    asyncio.run(run())
+
+
+def test_running_review_is_cancelled_and_rerun():
+    async def run():
+        runner = _Runner()
+        q = JobQueue(runner=runner, workers=2)
+        srv = WebhookServer(q, "acme/app")
+        q.start()
+        srv.accept("pull_request", _pr_event(5))
+        await _until(lambda: runner.started)
+        # новый push в тот же PR: начатое ревью отменяется, новое ждёт его завершения
+        assert srv.accept("pull_request", _pr_event(5))[1]["status"] == "superseded"
+        assert runner.started[0].cancel.is_set()
+        await asyncio.sleep(0.1)
+        assert len(runner.started) == 1  # второй обработчик не берёт занятый ключ
+        runner.release.set()
+        await _until(lambda: len(runner.started) == 2 and len(runner.cancelled) == 2)
+        assert runner.cancelled == [True, False]
+        assert q.stats["cancelled"] == 1
+        await q.stop()
+
+    asyncio.run(run())
+
+
+async def _http(srv: WebhookServer, raw: bytes) -> bytes:
+    server = await asyncio.start_server(srv.handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(raw)
+        await writer.drain()
+        data = await reader.read()
+        writer.close()
+        return data
+    finally:
+        server.close()
+        await server.wait_closed()
+
+
+def test_content_length_is_validated():
+    async def run():
+        q = JobQueue(runner=lambda job: None, workers=1)
+        srv = WebhookServer(q, "acme/app")
+        head = b"POST /webhook HTTP/1.1\r\nX-GitHub-Event: ping\r\n"
+        missing = await _http(srv, head + b"\r\n{}")
+        assert missing.startswith(b"HTTP/1.1 411")
+        chunked = await _http(srv, head + b"Transfer-Encoding: chunked\r\n\r\n2\r\n{}\r\n0\r\n\r\n")
+        assert chunked.startswith(b"HTTP/1.1 411")
+        for bad in (b"abc", b"-1", b""):
+            resp = await _http(srv, head + b"Content-Length: " + bad + b"\r\n\r\n{}")
+            assert resp.startswith(b"HTTP/1.1 400"), bad
+        huge = await _http(srv, head + b"Content-Length: 999999999999\r\n\r\n")
+        assert huge.startswith(b"HTTP/1.1 413")
+        ok = await _http(srv, head + b"Content-Length: 2\r\n\r\n{}")
+        assert ok.startswith(b"HTTP/1.1 200")
+
+    asyncio.run(run())
+
+
+def test_refuses_public_host_without_secret(monkeypatch):
+    from src import server
+
+    monkeypatch.setattr(server, "GITHUB_WEBHOOK_SECRET", "")
+    with pytest.raises(SystemExit):
+        asyncio.run(server.serve(host="0.0.0.0", port=0))
+    assert server.is_loopback("127.0.0.1") and server.is_loopback("::1") and server.is_loopback("localhost")
+    assert not server.is_loopback("0.0.0.0")
+
+
+def test_job_metrics_are_aggregated_into_one_report(monkeypatch):
+    from src import metrics, server
+
+    reports = []
+    monkeypatch.setattr(server.metrics, "write_report", lambda m=None: reports.append(m.report()))
+
+    def runner(job):
+        metrics.current().add("llm.calls", job.key[1])
+
+    async def run():
+        q = JobQueue(runner=runner, workers=2)
+        srv = WebhookServer(q, "acme/app")
+        srv.accept("pull_request", _pr_event(1))
+        srv.accept("pull_request", _pr_event(2))
+        q.start()
+        await _until(lambda: q.stats["done"] == 2)
+        assert q.snapshot()["counters"] == {"llm.calls": 3}
+        assert reports == []  # по задаче — никаких отчётов в файл
+        await q.stop()
+
+    asyncio.run(run())
+    assert len(reports) == 1
+    assert reports[0]["counters"] == {"llm.calls": 3}
+    assert reports[0]["groups"]["job"]["review"]["calls"] == 2
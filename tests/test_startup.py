@@ -0,0 +1,27 @@
+import json
+
+from bench.run import STARTUP_BUDGET_S, run_startup
+
+# Холодный старт в отдельном интерпретаторе: событие, которое отсекается фильтром,
+# не должно тянуть langchain/langgraph/openai. Время — лучшее из нескольких запусков,
+# чтобы не ловить шум загруженной машины.
+RUNS = 3
+
+
+def _check(code, env=None):
+    results = [run_startup(code, env or {}) for _ in range(RUNS)]
+    assert results[0]["heavy_imports"] == []
+    best = min(r["wall_s"] for r in results)
+    assert best < STARTUP_BUDGET_S, f"startup {best}s over budget {STARTUP_BUDGET_S}s"
+
+
+def test_skipped_responder_event_stays_light(tmp_path):
+    event = tmp_path / "event.json"
+    event.write_text(json.dumps({"action": "created", "pull_request": {"number": 1},
+                                 "comment": {"id": 1, "body": "просто комментарий"}}), encoding="utf-8")
+    _check("from src import comment_responder\ncomment_responder.main()",
+           {"GITHUB_EVENT_NAME": "pull_request_review_comment", "GITHUB_EVENT_PATH": str(event)})
+
+
+def test_import_main_stays_light():
+    _check("import src.main")